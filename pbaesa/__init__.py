@@ -7,10 +7,36 @@ LCIA methods in Brightway LCA framework.
 
 __version__ = "0.1.1"
 
-from .lcia import create_pbaesa_methods
-from .allocation import get_all_allocation_factor
+import importlib
 
 __all__ = [
     "create_pbaesa_methods",
     "get_all_allocation_factor",
+    "run_batch_aesa",
 ]
+
+# Modules of the public functions, which are only imported on first use, so that importing
+# pbaesa does not load Brightway, pymrio or matplotlib
+_lazy_functions = {
+    "create_pbaesa_methods": "lcia",
+    "get_all_allocation_factor": "allocation",
+    "run_batch_aesa": "aesa",
+}
+_submodules = [
+    "aesa", "allocation", "allocation_cube", "concordance", "exiobase_index", "lcia", "leontief", "scoring", "spa", "utils",
+]
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f".{name}", __name__)
+    if name in _lazy_functions:
+        module = importlib.import_module(f".{_lazy_functions[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_submodules))
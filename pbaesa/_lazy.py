@@ -0,0 +1,29 @@
+"""
+Deferred imports of heavy dependencies.
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access instead of at import time.
+
+    Parameters:
+        name: str - Name of the module, e.g. 'pymrio'
+
+    Returns:
+        module: The module, which is only executed when one of its attributes is used.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
@@ -0,0 +1,243 @@
+"""
+Batch absolute environmental sustainability assessment of many functional units.
+"""
+
+import numpy as np
+import pandas as pd
+import bw2data as bd
+import bw2calc as bc
+
+from .allocation import _lognormal_noise, get_allocation_factors, ALLOCATION_FACTOR_COLUMNS
+from .scoring import calculate_pb_scores, get_characterization_matrix, get_pb_methods
+from .utils import calculate_exploitation_of_SOS, SAFE_OPERATING_SPACE
+
+
+def get_activity_id(activity):
+    """
+    Get the Brightway node id of an activity.
+
+    Parameters:
+        activity: Brightway activity, node id (int) or key (tuple of database name and code)
+
+    Returns:
+        activity_id: int
+    """
+    if isinstance(activity, (int, float)):
+        return int(activity)
+    if isinstance(activity, tuple):
+        return bd.get_activity(activity).id
+    return activity.id
+
+
+def run_batch_aesa(functional_units, methods=None, exiobase_storage_path=None):
+    """
+    Run the absolute environmental sustainability assessment for many functional units at once.
+
+    The LCIA scores of all functional units are calculated with a single factorization and
+    characterized for all methods with one sparse product (c.f. scoring.calculate_pb_scores), the
+    exploitation of the Safe Operating Space is derived from the scores and the allocation
+    factors (assigned shares of the Safe Operating Space) of all functional units are looked
+    up with one join per year.
+
+    Parameters:
+        functional_units: DataFrame or list of dicts
+            One row per functional unit with the columns 'activity' (Brightway activity, node id
+            or key), 'geographical_scope', 'sector' and 'year'. Optional columns are 'amount'
+            (defaults to 1) and 'name' (defaults to the row number).
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        aesa_df: A dataframe with one row per functional unit and planetary boundary category,
+                 including the LCIA score, the exploitation of the Safe Operating Space and the
+                 assigned shares of the Safe Operating Space via all allocation factors.
+    """
+    fu_df = pd.DataFrame(functional_units).reset_index(drop=True)
+
+    required_columns = ['activity', 'geographical_scope', 'sector', 'year']
+    missing_columns = [col for col in required_columns if col not in fu_df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns in functional units: {missing_columns}")
+
+    if 'amount' not in fu_df.columns:
+        fu_df['amount'] = 1.0
+    fu_df['amount'] = fu_df['amount'].fillna(1.0)
+    if 'name' not in fu_df.columns:
+        fu_df['name'] = None
+    fu_df['name'] = fu_df['name'].fillna(pd.Series(fu_df.index.astype(str), index=fu_df.index))
+    if fu_df['name'].duplicated().any():
+        raise ValueError("Names of functional units must be unique.")
+
+    # Step 1: Calculate LCIA scores of all functional units with one factorization and one characterization
+    demands = {
+        row['name']: {get_activity_id(row['activity']): float(row['amount'])}
+        for _, row in fu_df.iterrows()
+    }
+    scores_df = calculate_pb_scores(demands, methods=methods)
+
+    # Step 2: Calculate exploitation of the Safe Operating Space
+    mlca_scores = {
+        (method_key, name): scores_df.at[name, method_key]
+        for name in scores_df.index
+        for method_key in scores_df.columns
+    }
+    exploitation_of_SOS = calculate_exploitation_of_SOS(mlca_scores)
+
+    scores_df = pd.DataFrame(
+        [
+            {
+                'name': key[1],
+                'category': key[0][1],
+                'score': mlca_scores[key],
+                'exploitation_of_SOS': value,
+            }
+            for key, value in exploitation_of_SOS.items()
+        ]
+    )
+
+    # Step 3: Look up the allocation factors of all functional units at once
+    factors_df = get_allocation_factors(fu_df, exiobase_storage_path=exiobase_storage_path)
+    fu_df = pd.concat([fu_df[['name', 'geographical_scope', 'sector', 'year']], factors_df], axis=1)
+
+    aesa_df = scores_df.merge(fu_df, on='name', how='left')
+    aesa_df = aesa_df[
+        ['name', 'geographical_scope', 'sector', 'year', 'category', 'score', 'exploitation_of_SOS']
+        + ALLOCATION_FACTOR_COLUMNS
+    ]
+
+    return aesa_df
+
+
+def _update_running_statistics(stats, batch, thresholds):
+    """
+    Update running summary statistics with a batch of samples (c.f. Chan et al. for the
+    pairwise combination of means and variances), so that no samples have to be kept.
+
+    Parameters:
+        stats (dict): Running statistics, updated in place.
+        batch (array): Samples (categories x batch size).
+        thresholds (dict): Named thresholds (arrays of categories) whose exceedance is counted.
+    """
+    n_batch = batch.shape[1]
+    mean_batch = batch.mean(axis=1)
+    m2_batch = ((batch - mean_batch[:, None]) ** 2).sum(axis=1)
+
+    n = stats['count'] + n_batch
+    delta = mean_batch - stats['mean']
+    stats['mean'] = stats['mean'] + delta * n_batch / n
+    stats['m2'] = stats['m2'] + m2_batch + delta ** 2 * stats['count'] * n_batch / n
+    stats['count'] = n
+    stats['min'] = np.minimum(stats['min'], batch.min(axis=1))
+    stats['max'] = np.maximum(stats['max'], batch.max(axis=1))
+    for name, threshold in thresholds.items():
+        stats[name] = stats[name] + (batch > threshold[:, None]).sum(axis=1)
+
+    return None
+
+
+def run_monte_carlo_aesa(
+    demand,
+    iterations=1000,
+    cf_uncertainty=None,
+    sos_uncertainty=None,
+    assigned_share=None,
+    methods=None,
+    use_distributions=True,
+    batch_size=100,
+    seed=None,
+):
+    """
+    Calculate the distribution of the exploitation of the Safe Operating Space of a functional
+    unit via Monte Carlo simulation.
+
+    The inventory is sampled with the Monte Carlo infrastructure of bw2calc. The inventories of
+    a batch are characterized for all planetary boundary categories at once with one sparse
+    matrix product and combined with lognormal samples of the characterization factors and of
+    the Safe Operating Space thresholds of each category. Only running summary statistics are
+    kept, so memory use does not grow with the number of iterations.
+
+    Parameters:
+        demand (dict): Functional unit with Brightway activities, node ids or keys as keys and amounts as values.
+        iterations (int): Number of Monte Carlo samples.
+        cf_uncertainty (dict): Standard deviation of the log of the characterization factors per 
+                               category, e.g. {"Climate Change": 0.1}. Missing categories are certain.
+        sos_uncertainty (dict): Standard deviation of the log of the Safe Operating Space threshold
+                                per category. Missing categories are certain.
+        assigned_share (float): Assigned share of the Safe Operating Space (allocation factor). If given,
+                                the probability of exceeding it is reported.
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        use_distributions (bool): Sample the inventory from the uncertainty distributions of the databases.
+        batch_size (int): Number of samples that are characterized at once.
+        seed (int): Seed for the inventory sampling and the random number generator.
+
+    Returns:
+        statistics_df: A dataframe with the mean, standard deviation, minimum and maximum of the
+                       exploitation of the Safe Operating Space per planetary boundary category, and
+                       the probabilities of transgressing the Safe Operating Space and the assigned share.
+    """
+    if methods is None:
+        methods = get_pb_methods()
+    categories = [method_key[1] for method_key in methods]
+    cf_uncertainty = cf_uncertainty or {}
+    sos_uncertainty = sos_uncertainty or {}
+
+    rng = np.random.default_rng(seed)
+    demand = {get_activity_id(act): amount for act, amount in demand.items()}
+    lca = bc.LCA(demand, use_distributions=use_distributions, seed_override=seed)
+    lca.lci()
+
+    C = get_characterization_matrix(methods, lca.dicts.biosphere)
+    sos = np.array([SAFE_OPERATING_SPACE.get(cat, np.nan) for cat in categories])
+    cf_sigmas = np.array([cf_uncertainty.get(cat, 0) for cat in categories], dtype=float)[:, None]
+    sos_sigmas = np.array([sos_uncertainty.get(cat, 0) for cat in categories], dtype=float)[:, None]
+
+    thresholds = {'probability_transgression': np.ones(len(methods))}
+    if assigned_share is not None:
+        thresholds['probability_exceeding_assigned_share'] = np.full(len(methods), assigned_share)
+
+    stats = {
+        'count': 0,
+        'mean': np.zeros(len(methods)),
+        'm2': np.zeros(len(methods)),
+        'min': np.full(len(methods), np.inf),
+        'max': np.full(len(methods), -np.inf),
+    }
+    stats.update({name: np.zeros(len(methods)) for name in thresholds})
+
+    inventory = np.asarray(lca.inventory.sum(axis=1)).ravel()
+    for start in range(0, iterations, batch_size):
+        b = min(batch_size, iterations - start)
+
+        # Step 1: Sample inventories (biosphere flows x batch size)
+        if use_distributions:
+            inventories = np.empty((len(inventory), b))
+            for i in range(b):
+                next(lca)
+                inventories[:, i] = np.asarray(lca.inventory.sum(axis=1)).ravel()
+            scores = C @ inventories
+        else:
+            scores = np.repeat((C @ inventory)[:, None], b, axis=1)
+
+        # Step 2: Characterize and divide by the Safe Operating Space with sampled uncertainty
+        exploitation = (
+            scores * _lognormal_noise(rng, cf_sigmas, (len(methods), b))
+            / (sos[:, None] * _lognormal_noise(rng, sos_sigmas, (len(methods), b)))
+        )
+
+        _update_running_statistics(stats, exploitation, thresholds)
+
+    statistics_df = pd.DataFrame(
+        {
+            'mean': stats['mean'],
+            'std': np.sqrt(stats['m2'] / max(stats['count'] - 1, 1)),
+            'min': stats['min'],
+            'max': stats['max'],
+        },
+        index=pd.Index(categories, name='category'),
+    )
+    for name in thresholds:
+        statistics_df[name] = stats[name] / stats['count']
+    statistics_df['iterations'] = stats['count']
+
+    return statistics_df
@@ -7,9 +7,48 @@ import glob
 import os
 import numpy as np
 import copy
-import pymrio as p
+import hashlib
+import json
+import queue
+import threading
+import zipfile
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
 
+from ._lazy import lazy_import
+from .exiobase_index import (
+    check_sectors,
+    is_valid_geographical_scope,
+    is_valid_sector,
+    suggest_geographical_scopes,
+    suggest_sectors,
+)
+
+# Heavy dependencies are only imported when they are used
+p = lazy_import("pymrio")
+sparse = lazy_import("scipy.sparse")
+
+
+# Column names of the allocation factors file
+GEO_SCOPE_COLUMN = "Country (c.f. ISO 3166-1 alpha-2) & Rest of World regions"
+SECTOR_COLUMN = "Sector (c.f. EU’s NACE Rev.1 classification)"
+ALLOCATION_FACTOR_COLUMNS = [
+    'Allocation factor calculated via total final consumption expenditure',
+    'Allocation factor calculated via direct final consumption expenditure',
+    'Allocation factor calculated via total gross value added',
+    'Allocation factor calculated via direct gross value added',
+]
+
+# Value-added components that make up the gross value added (GVA)
+GVA_COMPONENTS = [
+    "Other net taxes on production",
+    "Compensation of employees; wages, salaries, & employers' social contributions: Low-skilled",
+    "Compensation of employees; wages, salaries, & employers' social contributions: Medium-skilled",
+    "Compensation of employees; wages, salaries, & employers' social contributions: High-skilled",
+    "Operating surplus: Consumption of fixed capital",
+    "Operating surplus: Remaining net operating surplus"
+]
+
 
 def get_direct_FCE_allocation_factor(geographical_scope, sector, year, exiobase_storage_path=None):
     """
@@ -165,58 +204,184 @@ def download_exiobase_data(year, exiobase_storage_path=None):
     )
     return exio_downloadlog 
 
-def load_matrices(year, return_L=True, return_Y=True, exiobase_storage_path=None):
+def find_exiobase_file_path(year, exiobase_storage_path=None):
     """
-    Load Y matrix and calculate L matrix from exiobase.
+    Get the path of the exiobase archive for a given year without downloading it.
 
     Parameters:
         year: int
-        return_L: boolean
-        return_Y: boolean
         exiobase_storage_path: str or Path, optional
             Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
 
     Returns:
-        results: L and/or Y matrix
+        exio_file_path: str, or None if the archive has not been downloaded
+    """
+    if exiobase_storage_path is None:
+        exio_storage_folder = Path.home() / ".pbaesa_data" / "exiobase"
+    else:
+        exio_storage_folder = Path(exiobase_storage_path)
+    matching_files = glob.glob(str(exio_storage_folder / f"IOT_{year}_*.zip"))
 
-    """ 
+    return matching_files[0] if matching_files else None
+
+def get_exiobase_file_path(year, exiobase_storage_path=None):
+    """
+    Get the path of the exiobase archive for a given year and download it if it does not exist yet.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
 
+    Returns:
+        exio_file_path: str, or None if no archive exists for the year
+    """
     if exiobase_storage_path is None:
         exio_storage_folder = Path.home() / ".pbaesa_data" / "exiobase"
     else:
         exio_storage_folder = Path(exiobase_storage_path)
     exio_storage_folder.mkdir(parents=True, exist_ok=True)
-    pattern = str(exio_storage_folder / f"IOT_{year}_*.zip")
-    matching_files = glob.glob(pattern)
 
-    if matching_files:
-        exio_file_path = matching_files[0]
-    else:
-        download_exiobase_data(year, exiobase_storage_path)
-        matching_files = glob.glob(pattern)
-        if matching_files:
-            exio_file_path = matching_files[0]
-        else:
-            print("Exiobase versions only exist from 1995 to 2022! Choose another")
-    
-    exio3 = p.parse_exiobase3(exio_file_path)
+    exio_file_path = find_exiobase_file_path(year, exiobase_storage_path=exio_storage_folder)
+    if exio_file_path:
+        return exio_file_path
 
-    #### Extract A-Matrix and Y-Matrix from Exiobase #### 
-    A = exio3.A.copy() 
-    Y = exio3.Y.copy()
-    Y = Y.reset_index() 
+    download_exiobase_data(year, exiobase_storage_path)
+    exio_file_path = find_exiobase_file_path(year, exiobase_storage_path=exio_storage_folder)
+    if exio_file_path:
+        return exio_file_path
 
-    #### Calculate Leontief-Matrix L (c.f. Equation 2 of Oosterhoff et al.) ####
-    L = p.calc_L(A)
+    print("Exiobase versions only exist from 1995 to 2022! Choose another")
+    return None
+
+def _read_exiobase_labels(exio_file_path):
+    """
+    Read the (region, sector) labels of all rows of the core matrices from the label files
+    of an exiobase archive (unit.txt or x.txt), without parsing any matrix.
+
+    Parameters:
+        exio_file_path: str or Path
+
+    Returns:
+        labels_df: dataframe with the columns 'region' and 'sector' in exiobase order
+    """
+    with zipfile.ZipFile(exio_file_path) as archive:
+        members = [
+            name for name in archive.namelist()
+            if os.path.basename(name) in ("unit.txt", "x.txt") and name.count("/") <= 1
+        ]
+        # Prefer unit.txt, which only contains labels
+        for member in sorted(members, key=lambda name: os.path.basename(name) != "unit.txt"):
+            with archive.open(member) as f:
+                labels_df = pd.read_csv(f, sep="\t", usecols=[0, 1])
+            if list(labels_df.columns) == ["region", "sector"]:
+                return labels_df
+
+    raise ValueError(f"No label file with region and sector columns found in {exio_file_path}")
+
+# In-memory cache of the manifests that have been loaded in this process
+_manifests = {}
+
+def load_exiobase_manifest(year, exiobase_storage_path=None):
+    """
+    Load the manifest of region codes, sector names, sorted flat labels and dimensions of the
+    exiobase archive of a given year.
+
+    The manifest is built once from the label files of the archive and cached as json next to 
+    the archive, so that functions that only need labels or shapes do not parse any matrix.
+    The cache is rebuilt when the archive changes.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        manifest: dict with the entries
+            'year': int
+            'archive': file name of the exiobase archive
+            'archive_size': size of the archive in bytes
+            'geo': geographical scopes in exiobase order
+            'sectors': sector names in exiobase order
+            'labels': sorted flat 'region_sector' labels
+            'num_geo': number of geographical scopes
+            'num_sectors': number of sectors across all geographical scopes (length of L)
+    """
+    exio_file_path = get_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
+    if exio_file_path is None:
+        storage_path = exiobase_storage_path or Path.home() / ".pbaesa_data" / "exiobase"
+        raise FileNotFoundError(f"No exiobase archive found for {year} in {storage_path}")
+    exio_file_path = Path(exio_file_path)
+    archive_size = exio_file_path.stat().st_size
+    manifest_path = exio_file_path.with_name(f"manifest_{year}.json")
+
+    manifest = _manifests.get(str(manifest_path))
+    if manifest is None and manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    if manifest is not None and manifest['archive'] == exio_file_path.name and manifest['archive_size'] == archive_size:
+        _manifests[str(manifest_path)] = manifest
+        return manifest
+
+    labels_df = _read_exiobase_labels(exio_file_path)
+    labels = sorted(labels_df['region'].astype(str) + '_' + labels_df['sector'].astype(str))
+    manifest = {
+        'year': int(year),
+        'archive': exio_file_path.name,
+        'archive_size': archive_size,
+        'geo': list(pd.unique(labels_df['region'].astype(str))),
+        'sectors': list(pd.unique(labels_df['sector'].astype(str))),
+        'labels': labels,
+        'num_geo': int(labels_df['region'].nunique()),
+        'num_sectors': len(labels),
+    }
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    _manifests[str(manifest_path)] = manifest
+
+    return manifest
+
+def load_matrices(year, return_L=True, return_Y=True, exiobase_storage_path=None, return_A=False):
+    """
+    Load Y matrix and calculate L matrix from exiobase.
+
+    Parameters:
+        year: int
+        return_L: boolean
+        return_Y: boolean
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+        return_A: boolean - Return the technical coefficient matrix A (after L, before Y)
+
+    Returns:
+        results: L, A and/or Y matrix
+
+    """ 
 
-    #### Delete not further needed variables to liberate storage ####
-    del A
+    exio_file_path = get_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
+
+    exio3 = _parse_exiobase3(exio_file_path)
 
     results = []
+
+    #### Calculate Leontief-Matrix L (c.f. Equation 2 of Oosterhoff et al.) ####
     if return_L:
+        A = exio3.A.copy()
+        L = p.calc_L(A)
+
+        #### Delete not further needed variables to liberate storage ####
+        del A
         results.append(L)
+
+    if return_A:
+        results.append(exio3.A.copy())
+
     if return_Y:
+        Y = exio3.Y.copy()
+        Y = Y.reset_index() 
         results.append(Y)
+
     return results if len(results) > 1 else results[0]
 
 def prepare_L_matrix(year, exiobase_storage_path=None):
@@ -243,19 +408,21 @@ def prepare_L_matrix(year, exiobase_storage_path=None):
 
     return L_sorted
 
-def get_index(year):
+def get_index(year, exiobase_storage_path=None):
     """
     Get index for all matrices.
 
     Parameters:
         year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
 
     Returns:
         save_index: index
 
     """ 
-    L_sorted = prepare_L_matrix(year)
-    save_index = L_sorted.index
+    manifest = load_exiobase_manifest(year, exiobase_storage_path=exiobase_storage_path)
+    save_index = pd.Index(manifest['labels'])
 
     return save_index
 
@@ -276,25 +443,9 @@ def load_satellites(year, return_F=True, return_x=True, return_z = True, exiobas
 
     """ 
 
-    if exiobase_storage_path is None:
-        exio_storage_folder = Path.home() / ".pbaesa_data" / "exiobase"
-    else:
-        exio_storage_folder = Path(exiobase_storage_path)
-    exio_storage_folder.mkdir(parents=True, exist_ok=True)
-    pattern = str(exio_storage_folder / f"IOT_{year}_*.zip")
-    matching_files = glob.glob(pattern)
+    exio_file_path = get_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
 
-    if matching_files:
-        exio_file_path = matching_files[0]
-    else:
-        download_exiobase_data(year, exiobase_storage_path)
-        matching_files = glob.glob(pattern)
-        if matching_files:
-            exio_file_path = matching_files[0]
-        else:
-            print("Exiobase versions only exist from 1995 to 2022! Choose another")
-    
-    exio3 = p.parse_exiobase3(exio_file_path)
+    exio3 = _parse_exiobase3(exio_file_path)
 
     F_satellite = exio3.factor_inputs.F.copy() #factor_inputs
 
@@ -311,6 +462,242 @@ def load_satellites(year, return_F=True, return_x=True, return_z = True, exiobas
         results.append(z_satellite)
     return results if len(results) > 1 else results[0]
 
+# Parsed exiobase systems of prefetched years, by archive path
+_prefetched_exiobase = {}
+_prefetched_exiobase_lock = threading.Lock()
+
+def _parse_exiobase3(exio_file_path):
+    """
+    Parse an exiobase archive, unless it has already been parsed by prefetch_exiobase_years.
+    """
+    with _prefetched_exiobase_lock:
+        exio3 = _prefetched_exiobase.get(str(exio_file_path))
+    if exio3 is not None:
+        return exio3
+    return p.parse_exiobase3(exio_file_path)
+
+def prefetch_exiobase_years(years, depth=1, exiobase_storage_path=None):
+    """
+    Iterate over several years while the exiobase data of the upcoming years is downloaded 
+    and parsed in a background thread.
+
+    While a year is being processed in the loop body, load_matrices, load_satellites and all 
+    functions based on them use the already parsed system of that year instead of parsing the 
+    archive again. The parsed system is released when the loop moves on to the next year.
+    At most 'depth' upcoming years are held in memory in addition to the current one.
+
+    Parameters:
+        years: list of int
+        depth: int - Number of years that are prefetched ahead of the current year
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Yields:
+        year: int
+    """
+    if depth < 1:
+        raise ValueError("The prefetch depth must be at least 1.")
+
+    parsed = queue.Queue()
+    # One slot for the current year and one for each upcoming year
+    free_slots = threading.Semaphore(depth + 1)
+    stop = threading.Event()
+    done = object()
+
+    def prefetch():
+        for year in years:
+            # Wait until the consumer has released a year, to bound the memory use
+            while not free_slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            if stop.is_set():
+                return
+            try:
+                exio_file_path = get_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
+                exio3 = p.parse_exiobase3(exio_file_path) if exio_file_path else None
+                parsed.put((year, exio_file_path, exio3, None))
+            except Exception as error:
+                parsed.put((year, None, None, error))
+                return
+        parsed.put(done)
+
+    thread = threading.Thread(target=prefetch, name="pbaesa-prefetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = parsed.get()
+            if item is done:
+                break
+            year, exio_file_path, exio3, error = item
+            if error is not None:
+                raise error
+
+            key = str(exio_file_path)
+            if exio3 is not None:
+                with _prefetched_exiobase_lock:
+                    _prefetched_exiobase[key] = exio3
+            del exio3
+
+            try:
+                yield year
+            finally:
+                with _prefetched_exiobase_lock:
+                    _prefetched_exiobase.pop(key, None)
+                free_slots.release()
+    finally:
+        stop.set()
+
+def calculate_for_years(years, function=None, depth=1, exiobase_storage_path=None):
+    """
+    Run a calculation for several years, while the exiobase data of the next years is 
+    downloaded and parsed in the background (c.f. prefetch_exiobase_years).
+
+    Parameters:
+        years: list of int
+        function: callable with the signature function(year, exiobase_storage_path=None).
+                  Defaults to calculate_all_allocation_factors.
+        depth: int - Number of years that are prefetched ahead of the current year
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        results: dict with years as keys and the results of the function as values
+    """
+    if function is None:
+        function = calculate_all_allocation_factors
+
+    results = {}
+    for year in prefetch_exiobase_years(years, depth=depth, exiobase_storage_path=exiobase_storage_path):
+        results[year] = function(year, exiobase_storage_path=exiobase_storage_path)
+
+    return results
+
+# Shared memory blocks that are kept alive in this process (published or attached)
+_shared_memory_blocks = {}
+
+def _attach_shared_memory(shm_name):
+    """
+    Attach to an existing shared memory block without registering it with the resource 
+    tracker of the current process, so that workers do not unlink it when they exit.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=shm_name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def publish_shared_matrices(year, matrices=('L', 'Y', 'Z', 'F', 'x'), exiobase_storage_path=None):
+    """
+    Load the matrices of a given year once and publish them in shared memory for worker processes.
+
+    The exiobase archive is parsed and L is calculated only once. Workers attach to the published
+    matrices with attach_shared_matrices and receive zero-copy views, so that the memory use does 
+    not grow with the number of workers. The publishing process has to call 
+    release_shared_matrices when all workers are done.
+
+    Parameters:
+        year: int
+        matrices: tuple - Matrices to publish, any of 'L', 'Y', 'Z', 'F' and 'x'
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        handle: dict - Picklable description of the published matrices (shared memory names, 
+                shapes, dtypes and labels) that can be passed to worker processes.
+    """
+    exio_file_path = get_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
+    exio3 = _parse_exiobase3(exio_file_path)
+
+    sources = {
+        'L': lambda: p.calc_L(exio3.A),
+        'Y': lambda: exio3.Y,
+        'Z': lambda: exio3.Z,
+        'F': lambda: exio3.factor_inputs.F,
+        'x': lambda: exio3.x,
+    }
+
+    handle = {'year': year, 'matrices': {}}
+    for name in matrices:
+        df = sources[name]()
+        array = np.ascontiguousarray(df.to_numpy(dtype=float))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared_array[:] = array
+        _shared_memory_blocks[shm.name] = shm
+
+        handle['matrices'][name] = {
+            'shm_name': shm.name,
+            'shape': array.shape,
+            'dtype': array.dtype.str,
+            'index': list(df.index),
+            'columns': list(df.columns),
+        }
+        del df, array
+
+    del exio3
+    print(f"Matrices {', '.join(matrices)} for {year} published in shared memory!")
+
+    return handle
+
+def attach_shared_matrices(handle, as_dataframes=False):
+    """
+    Attach to matrices published with publish_shared_matrices, e.g. in a worker process.
+
+    Parameters:
+        handle: dict - Output of publish_shared_matrices
+        as_dataframes: boolean - Return dataframes with the original labels instead of arrays.
+                       The dataframes are backed by the shared memory as well.
+
+    Returns:
+        shared: dict with the matrix names as keys and read-only arrays (or dataframes) as values.
+                The labels of the arrays are available in handle['matrices'][name]['index'] 
+                and handle['matrices'][name]['columns'].
+    """
+    shared = {}
+    for name, info in handle['matrices'].items():
+        shm = _shared_memory_blocks.get(info['shm_name'])
+        if shm is None:
+            shm = _attach_shared_memory(info['shm_name'])
+            _shared_memory_blocks[info['shm_name']] = shm
+
+        array = np.ndarray(info['shape'], dtype=np.dtype(info['dtype']), buffer=shm.buf)
+        array.flags.writeable = False
+
+        if as_dataframes:
+            index, columns = info['index'], info['columns']
+            shared[name] = pd.DataFrame(
+                array,
+                index=pd.MultiIndex.from_tuples(index) if isinstance(index[0], tuple) else pd.Index(index),
+                columns=pd.MultiIndex.from_tuples(columns) if isinstance(columns[0], tuple) else pd.Index(columns),
+                copy=False,
+            )
+        else:
+            shared[name] = array
+
+    return shared
+
+def release_shared_matrices(handle):
+    """
+    Release the shared memory of matrices published with publish_shared_matrices.
+
+    Parameters:
+        handle: dict - Output of publish_shared_matrices
+    """
+    for info in handle['matrices'].values():
+        shm = _shared_memory_blocks.pop(info['shm_name'], None)
+        if shm is None:
+            continue
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    return None
+
 def define_scope(year, return_what='all', exiobase_storage_path=None):
     """
     Define geographical scope and sector information for a given year.
@@ -328,18 +715,12 @@ def define_scope(year, return_what='all', exiobase_storage_path=None):
     exiobase_storage_path: str or Path, optional
         Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
     """
-    L = load_matrices(year, return_Y=False, exiobase_storage_path=exiobase_storage_path)
-
-    # Define abbreviations used in Exiobase for all geographical scopes
-    geo = [
-        'AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'ES', 'FI', 'FR', 'GR', 'HR',
-        'HU', 'IE', 'IT', 'LT', 'LU', 'LV', 'MT', 'NL', 'PL', 'PT', 'RO', 'SE', 'SI',
-        'SK', 'GB', 'US', 'JP', 'CN', 'CA', 'KR', 'BR', 'IN', 'MX', 'RU', 'AU', 'CH',
-        'TR', 'TW', 'NO', 'ID', 'ZA', 'WA', 'WL', 'WE', 'WF', 'WM'
-    ]
+    # Abbreviations used in Exiobase for all geographical scopes and number of sectors from the manifest
+    manifest = load_exiobase_manifest(year, exiobase_storage_path=exiobase_storage_path)
+    geo = list(manifest['geo'])
 
-    num_geo = len(geo)
-    num_sectors = len(L)
+    num_geo = manifest['num_geo']
+    num_sectors = manifest['num_sectors']
 
     # Handle return options
     if return_what == 'num_geo':
@@ -501,7 +882,7 @@ def calculate_direct_FCE_allocation_factor(year, exiobase_storage_path=None):
         direct_FCE_pop_df: A dataframe including the allocation factors based on direct FCE for a specified year.
 
     """   
-    save_index = get_index(year)
+    save_index = get_index(year, exiobase_storage_path=exiobase_storage_path)
     FR_matrix = calculate_FR_matrix(year, exiobase_storage_path=exiobase_storage_path)
     sPOPr = calculate_population_weights()
     direct_FCE_pop = (FR_matrix * sPOPr).sum(axis=1)
@@ -523,7 +904,7 @@ def calculate_total_FCE_allocation_factor(year, exiobase_storage_path=None):
         total_FCE_df: A dataframe including the allocation factors based on total FCE for a specified year.
 
     """ 
-    save_index = get_index(year)
+    save_index = get_index(year, exiobase_storage_path=exiobase_storage_path)
     
     FR_matrix = calculate_FR_matrix(year, exiobase_storage_path=exiobase_storage_path)
     L = load_matrices(year, return_Y=False, exiobase_storage_path=exiobase_storage_path)
@@ -608,14 +989,7 @@ def calculate_GVA_per_sector(year, exiobase_storage_path=None):
     value_added = value_added.transpose().sort_index()
 
     # Step 2: Define relevant GVA components
-    gva_components = [
-        "Other net taxes on production",
-        "Compensation of employees; wages, salaries, & employers' social contributions: Low-skilled",
-        "Compensation of employees; wages, salaries, & employers' social contributions: Medium-skilled",
-        "Compensation of employees; wages, salaries, & employers' social contributions: High-skilled",
-        "Operating surplus: Consumption of fixed capital",
-        "Operating surplus: Remaining net operating surplus"
-    ]
+    gva_components = GVA_COMPONENTS
 
     # Step 3: Sum the selected value-added components across sectors
     V_df = value_added.filter(gva_components).sum(axis=1)
@@ -645,14 +1019,7 @@ def calculate_direct_GVA_per_sector(year, exiobase_storage_path=None):
     value_added.columns = ['_'.join(col) for col in value_added.columns]
     value_added = value_added.transpose().sort_index()
 
-    gva_components = [
-        "Other net taxes on production",
-        "Compensation of employees; wages, salaries, & employers' social contributions: Low-skilled",
-        "Compensation of employees; wages, salaries, & employers' social contributions: Medium-skilled",
-        "Compensation of employees; wages, salaries, & employers' social contributions: High-skilled",
-        "Operating surplus: Consumption of fixed capital",
-        "Operating surplus: Remaining net operating surplus"
-    ]
+    gva_components = GVA_COMPONENTS
 
     #### Calculation of gross value added per geographical scope ####
     GVA_geo = value_added.filter(gva_components).sum(axis=1)
@@ -697,7 +1064,7 @@ def calculate_total_GVA_per_sector(year, exiobase_storage_path=None):
     V_df = calculate_GVA_per_sector(year, exiobase_storage_path=exiobase_storage_path)
     V = V_df.to_numpy()
     L_sorted = prepare_L_matrix(year, exiobase_storage_path=exiobase_storage_path)
-    save_index = get_index(year)
+    save_index = get_index(year, exiobase_storage_path=exiobase_storage_path)
     #### Calculation of type I GVA multiplier ####
 
     # Step 1: Extract total output from Exiobase
@@ -705,41 +1072,46 @@ def calculate_total_GVA_per_sector(year, exiobase_storage_path=None):
     x_df = x_df.transpose()
     x_df.columns = ['_'.join(col) for col in x_df.columns]
     x_df = x_df.transpose().sort_index()
-    total_output_array = x_df.to_numpy()
+    total_output_array = x_df.to_numpy().ravel()
 
     # Step 2: Combute the denominator of the multiplier
     with np.errstate(divide='ignore', invalid='ignore'):
         bottom_multiplier = np.divide(V, total_output_array)
         bottom_multiplier = np.nan_to_num(bottom_multiplier, nan=0.0, posinf=0.0, neginf=0.0)
 
-    bottom_multiplier_df = pd.DataFrame(bottom_multiplier, index=save_index)
-
-    del bottom_multiplier
+    # Step 3: Compute the numerator of the multiplier and then the multiplier itself
+    top_multiplier = L_sorted.to_numpy().T @ bottom_multiplier
+    multiplier = np.divide(top_multiplier, bottom_multiplier, out=np.zeros_like(top_multiplier), where=bottom_multiplier != 0)
 
-    # Step 3: Combute the numerator of the multiplier and then the multiplier itself
-    multiplier_j_list = []
+    #### Calculation of total GVA per sector in geographical scope ####
+    total_GVA_j = pd.DataFrame(multiplier * V, index=save_index)
 
-    for j in range(len(L_sorted)):
-        result = pd.DataFrame()
-        result = L_sorted.iloc[:, j] * bottom_multiplier_df.iloc[:, 0]
+    # Delete not further needed variables to liberate storage
+    del L_sorted, bottom_multiplier, top_multiplier
 
-        top_multiplier_j = result.sum()
-        bottom_multiplier_j = bottom_multiplier_df.iloc[j, :]
-        bottom_multiplier_j = bottom_multiplier_j.iloc[0]
-        multiplier_j = np.divide(top_multiplier_j, bottom_multiplier_j, out=np.zeros_like(top_multiplier_j), where=bottom_multiplier_j != 0) 
-        multiplier_j_list.append(multiplier_j)
+    return total_GVA_j
 
-    multiplier_j_df = pd.DataFrame(multiplier_j_list).transpose()
-    multiplier_j_df.columns = L_sorted.columns
+def build_region_indicator(regions, geo):
+    """
+    Build a sparse indicator matrix that assigns each sector to its geographical scope.
 
-    #### Calculation of total GVA per sector in geographical scope ####
-    V_vector_df = pd.DataFrame(V_df)
-    total_GVA_j = multiplier_j_df.transpose() * V_vector_df
+    Multiplying the indicator with a matrix that has one row per sector sums the rows per
+    geographical scope.
 
-    # Delete not further needed variables to liberate storage
-    del L_sorted, bottom_multiplier_df
+    Parameters:
+        regions: list or array with the geographical scope of each sector
+        geo: list of geographical scopes (order of the rows of the indicator)
 
-    return total_GVA_j
+    Returns:
+        region_indicator: sparse matrix (geographical scopes x sectors)
+    """
+    geo_ids = pd.Index(geo).get_indexer(pd.Index(regions))
+    if (geo_ids < 0).any():
+        raise ValueError("All sectors must belong to one of the given geographical scopes.")
+    return sparse.csr_matrix(
+        (np.ones(len(geo_ids)), (geo_ids, np.arange(len(geo_ids)))),
+        shape=(len(geo), len(geo_ids)),
+    )
 
 def add_regional_resolution_to_total_GVA_of_sector(year, exiobase_storage_path=None):
     """
@@ -762,40 +1134,29 @@ def add_regional_resolution_to_total_GVA_of_sector(year, exiobase_storage_path=N
 
     # Step 1: Extract inter-sectoral inputs from Exiobase 
     Input = load_satellites(year, return_F = False, return_x=False, exiobase_storage_path=exiobase_storage_path)
-    Input.columns = ['_'.join(col) for col in Input.columns]
-    Input.index = ['_'.join(idx) for idx in Input.index]
-
-    # Step 2: Compute value added inputs
-    VA = pd.DataFrame(V_df).transpose()
-    VA.rename(index={0: 'primary'}, inplace=True)
-
-    geoscopes = sorted(set(col.split('_')[0] for col in VA.columns))
-    VA_per_geoscope = pd.DataFrame(index=[f"{geoscope}_primary" for geoscope in geoscopes], columns=VA.columns)
-    for geoscope in geoscopes:
-        row_name = f"{geoscope}_primary"
-        VA_per_geoscope.loc[row_name] = [
-            VA.loc['primary', col] if col.startswith(geoscope + '_') else 0
-            for col in VA.columns
-        ]
-    VA_per_geoscope = VA_per_geoscope[Input.columns]
+    supplier_regions = Input.index.get_level_values(0).astype(str)
+    consumer_regions = Input.columns.get_level_values(0).astype(str)
+    labels = _flat_labels(Input.columns)
+    geo = sorted(set(supplier_regions))
+    Z = Input.to_numpy(dtype=float)
+    del Input
+
+    # Step 2: Compute value added inputs (supplied by the own geographical scope of each sector)
+    V = V_df.reindex(labels).to_numpy(dtype=float)
+    VA_per_geoscope = build_region_indicator(consumer_regions, geo).multiply(V).toarray()
 
     # Step 3: Compute total input share per geographical scope
-    Input = pd.concat([Input, VA_per_geoscope], axis=0)
-    Input = Input.div(Input.sum(axis=0), axis=1)
-
-    Input_per_geoscope = (
-        Input.groupby(Input.index.str.split('_').str[0])  
-            .sum()
-            .sort_index()
-            .T                                          
-            .sort_index()
-    )
+    Input_per_geoscope = build_region_indicator(supplier_regions, geo) @ Z + VA_per_geoscope
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Input_per_geoscope = np.nan_to_num(Input_per_geoscope / (Z.sum(axis=0) + V), nan=0.0)
+
+    Input_per_geoscope = pd.DataFrame(Input_per_geoscope.T, index=labels, columns=geo).sort_index()
 
     # Step 4: Multiply total GVA of each sector in each geographical scope with input shares per geographical scope to obtain regional resolution 
     total_GVA_per_geo_scope = Input_per_geoscope.multiply(total_GVA_j.iloc[:, 0], axis=0)
 
     # Delete not further needed variables to liberate storage
-    del Input, VA_per_geoscope
+    del Z, VA_per_geoscope
 
     return total_GVA_per_geo_scope
 
@@ -816,7 +1177,7 @@ def calculate_total_GVA_allocation_factor(year, exiobase_storage_path=None):
     #### Calculate allocation factors based on total GVA ####
     full_GVA_per_geo = calculate_GVA_per_geographical_scope(year, exiobase_storage_path=exiobase_storage_path)
     total_GVA_per_geo_scope = add_regional_resolution_to_total_GVA_of_sector(year, exiobase_storage_path=exiobase_storage_path)
-    save_index = get_index(year)
+    save_index = get_index(year, exiobase_storage_path=exiobase_storage_path)
     sPOPr_dict = get_population_weights()
 
     # Step 1: Compute share of GVA in each geographical scope that originates from total GVA of each sector in each geographical scope
@@ -844,7 +1205,7 @@ def calculate_direct_GVA_allocation_factor(year, exiobase_storage_path=None):
     """ 
     GVA_df_geo = calculate_direct_GVA_per_sector(year, exiobase_storage_path=exiobase_storage_path)
     full_GVA_per_geo = calculate_GVA_per_geographical_scope(year, exiobase_storage_path=exiobase_storage_path)
-    save_index = get_index(year)
+    save_index = get_index(year, exiobase_storage_path=exiobase_storage_path)
     sPOPr_dict = get_population_weights()
     sPOPr_series = pd.Series(sPOPr_dict).sort_index()
     ##### Calculate allocation factors based on total GVA ####
@@ -896,6 +1257,426 @@ def calculate_all_allocation_factors(year, exiobase_storage_path=None):
 
     return aSoSOS_j_df   
 
+def _flat_labels(index):
+    """
+    Join the entries of a (region, sector) MultiIndex to flat 'region_sector' labels.
+    """
+    return np.array(['_'.join(idx) for idx in index], dtype=object)
+
+def prepare_allocation_arrays(year, exiobase_storage_path=None, leontief=True):
+    """
+    Prepare the EXIOBASE data that enters the allocation factors as numeric arrays.
+
+    All arrays follow the order of the sorted 'region_sector' labels that is also used by the
+    allocation factor dataframes, and all geographical scopes are sorted alphabetically.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+        leontief: boolean - If False, the technical coefficient matrix 'A' is returned instead
+            of the Leontief inverse 'L', which is then not calculated
+
+    Returns:
+        arrays: dict with the entries
+            'labels': sorted 'region_sector' labels (n)
+            'geo': sorted geographical scopes (r)
+            'geo_index': position of the geographical scope of each sector in 'geo' (n)
+            'L': Leontief inverse (n x n), or 'A': technical coefficient matrix (n x n)
+            'Y_fce': final consumption expenditure of each geographical scope on each sector (n x r)
+            'V': gross value added of each sector (n)
+            'x': total output of each sector (n)
+            'Z_geo': inter-sectoral inputs of each sector aggregated by supplying geographical scope (r x n)
+            'Z_total': total inter-sectoral inputs of each sector (n)
+            'sPOPr': population weights of the geographical scopes (r)
+    """
+    L, Y = load_matrices(
+        year, return_L=leontief, return_A=not leontief, exiobase_storage_path=exiobase_storage_path
+    )
+    F, x_df, Z = load_satellites(year, exiobase_storage_path=exiobase_storage_path)
+    geo = sorted(define_scope(year, return_what='geo', exiobase_storage_path=exiobase_storage_path))
+
+    # Leontief inverse (or technical coefficients) in the order of the sorted labels
+    L_labels = _flat_labels(L.index)
+    order = np.argsort(L_labels, kind='stable')
+    labels = L_labels[order]
+    L_sorted = L.to_numpy()[np.ix_(order, order)]
+    del L
+
+    geo_position = {geo_scope: r for r, geo_scope in enumerate(geo)}
+    geo_index = np.array([geo_position[label.split('_')[0]] for label in labels])
+
+    # Final consumption expenditure (first three final demand categories of each geographical scope)
+    Y_labels = (Y['region'].astype(str) + '_' + Y['sector'].astype(str)).to_numpy(dtype=object)
+    Y_order = np.argsort(Y_labels, kind='stable')
+    Y_fce = np.column_stack([Y[geo_scope].iloc[:, :3].to_numpy().sum(axis=1) for geo_scope in geo])[Y_order]
+
+    # Gross value added and total output
+    V_labels = _flat_labels(F.columns)
+    V = F.filter(GVA_COMPONENTS, axis=0).to_numpy().sum(axis=0)[np.argsort(V_labels, kind='stable')]
+    x_labels = _flat_labels(x_df.index)
+    x = x_df.to_numpy().sum(axis=1)[np.argsort(x_labels, kind='stable')]
+
+    # Inter-sectoral inputs aggregated by supplying geographical scope
+    Z_labels = _flat_labels(Z.columns)
+    Z_np = Z.to_numpy()
+    Z_geo = build_region_indicator(Z.index.get_level_values(0).astype(str), geo) @ Z_np
+    Z_col_order = np.argsort(Z_labels, kind='stable')
+    Z_geo = Z_geo[:, Z_col_order]
+    Z_total = Z_np.sum(axis=0)[Z_col_order]
+    del Z, Z_np
+
+    return {
+        'labels': labels,
+        'geo': geo,
+        'geo_index': geo_index,
+        'L' if leontief else 'A': L_sorted,
+        'Y_fce': Y_fce,
+        'V': V,
+        'x': x,
+        'Z_geo': Z_geo,
+        'Z_total': Z_total,
+        'sPOPr': calculate_population_weights(),
+    }
+
+def calculate_total_FCE_multiplier(L):
+    """
+    Calculate the factor by which the allocation factors based on total FCE exceed the ones 
+    based on direct FCE, i.e. the row sums of the marginal supply-chain matrix S_marginal 
+    (c.f. Equations 3-7), without building any further n x n matrix.
+
+    Parameters:
+        L: array - Leontief inverse (n x n)
+
+    Returns:
+        s: array (n)
+    """
+    col_sums = L.sum(axis=0)
+    L_diag = np.diagonal(L)
+    return 1 + col_sums / L_diag * (L @ (1 / col_sums))
+
+def calculate_allocation_factor_samples(arrays, Y_fce, V, sPOPr, s=None, top_multiplier=None):
+    """
+    Calculate all allocation factors for a batch of samples of final consumption expenditure,
+    gross value added and population weights with batched matrix products.
+
+    Parameters:
+        arrays: dict - Output of prepare_allocation_arrays
+        Y_fce: array (n x r x b) - Samples of the final consumption expenditure
+        V: array (n x b) - Samples of the gross value added
+        sPOPr: array (r x b) - Samples of the population weights
+        s: array (n), optional - Output of calculate_total_FCE_multiplier, to avoid recomputation
+        top_multiplier: array (n x b), optional - Numerator L^T v of the type I GVA multiplier
+            for the value added coefficients v = V / x of the samples. If both s and
+            top_multiplier are given, the Leontief inverse is not used.
+
+    Returns:
+        samples: dict with the allocation factor column names as keys and arrays (n x b) as values
+    """
+    if s is None:
+        s = calculate_total_FCE_multiplier(arrays['L'])
+    geo_index = arrays['geo_index']
+
+    #### Allocation factors based on FCE (c.f. Equations 1 and 8) ####
+    FR = Y_fce / Y_fce.sum(axis=0, keepdims=True)
+    direct_FCE = np.einsum('jrb,rb->jb', FR, sPOPr)
+    total_FCE = s[:, None] * direct_FCE
+
+    #### Allocation factors based on GVA ####
+    # GVA per geographical scope
+    geo_indicator = build_region_indicator(np.asarray(arrays['geo'])[geo_index], arrays['geo'])
+    full_GVA_per_geo = geo_indicator @ V
+
+    # Direct GVA: share of the GVA of the own geographical scope
+    direct_GVA = V / full_GVA_per_geo[geo_index] * sPOPr[geo_index]
+
+    # Total GVA: type I GVA multiplier applied to the direct GVA
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.nan_to_num(V / arrays['x'][:, None], nan=0.0, posinf=0.0, neginf=0.0)
+        if top_multiplier is None:
+            top_multiplier = arrays['L'].T @ v
+        multiplier = np.nan_to_num(top_multiplier / v, nan=0.0, posinf=0.0, neginf=0.0)
+    total_GVA_j = multiplier * V
+
+    # Regional resolution via the input shares of each geographical scope (incl. value added)
+    weights = sPOPr / full_GVA_per_geo
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares_weighted = (arrays['Z_geo'].T @ weights + V * weights[geo_index]) / (arrays['Z_total'][:, None] + V)
+    total_GVA = np.nan_to_num(total_GVA_j * shares_weighted, nan=0.0)
+
+    return {
+        'Allocation factor calculated via total final consumption expenditure': total_FCE,
+        'Allocation factor calculated via direct final consumption expenditure': direct_FCE,
+        'Allocation factor calculated via total gross value added': total_GVA,
+        'Allocation factor calculated via direct gross value added': direct_GVA,
+    }
+
+def _lognormal_noise(rng, sigma, size):
+    """
+    Draw multiplicative lognormal noise with an expected value of one.
+
+    Parameters:
+        rng: numpy random number generator
+        sigma: float or array - Standard deviation of the log, e.g. one value per row that
+            broadcasts to size
+        size: int or tuple - Shape of the noise
+    """
+    sigma = np.asarray(sigma, dtype=float)
+    if not sigma.any():
+        return np.ones(size)
+    return np.exp(rng.standard_normal(size) * sigma - sigma ** 2 / 2)
+
+def calculate_allocation_factor_uncertainty(
+    year,
+    iterations=1000,
+    fce_uncertainty=0.1,
+    gva_uncertainty=0.1,
+    population_uncertainty=0.05,
+    percentiles=(2.5, 50, 97.5),
+    batch_size=50,
+    seed=None,
+    exiobase_storage_path=None,
+):
+    """
+    Propagate the uncertainty of final demand, value added and population weights to all 
+    allocation factors of a specific year via Monte Carlo simulation.
+
+    The EXIOBASE data is loaded and the Leontief inverse is calculated only once. The samples
+    are drawn as multiplicative lognormal perturbations and evaluated in batches with matrix 
+    products. Perturbed population weights are rescaled to their original sum.
+
+    Parameters:
+        year: int
+        iterations: int - Number of Monte Carlo samples
+        fce_uncertainty: float - Standard deviation of the log of the final consumption expenditure entries
+        gva_uncertainty: float - Standard deviation of the log of the gross value added of each sector
+        population_uncertainty: float - Standard deviation of the log of the population weights
+        percentiles: tuple - Percentiles that are returned for each allocation factor
+        batch_size: int - Number of samples that are evaluated at once (controls memory use)
+        seed: int, optional - Seed of the random number generator
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        uncertainty_df: A dataframe with the mean and the requested percentiles of all 
+                        allocation factors for each sector in each geographical scope.
+    """
+    rng = np.random.default_rng(seed)
+    arrays = prepare_allocation_arrays(year, exiobase_storage_path=exiobase_storage_path)
+    s = calculate_total_FCE_multiplier(arrays['L'])
+
+    Y_fce, V, sPOPr = arrays['Y_fce'], arrays['V'], arrays['sPOPr']
+    samples = {col: np.empty((len(V), iterations)) for col in ALLOCATION_FACTOR_COLUMNS}
+
+    for start in range(0, iterations, batch_size):
+        b = min(batch_size, iterations - start)
+
+        Y_fce_b = Y_fce[:, :, None] * _lognormal_noise(rng, fce_uncertainty, Y_fce.shape + (b,))
+        V_b = V[:, None] * _lognormal_noise(rng, gva_uncertainty, (len(V), b))
+        sPOPr_b = sPOPr[:, None] * _lognormal_noise(rng, population_uncertainty, (len(sPOPr), b))
+        sPOPr_b *= sPOPr.sum() / sPOPr_b.sum(axis=0, keepdims=True)
+
+        batch = calculate_allocation_factor_samples(arrays, Y_fce_b, V_b, sPOPr_b, s=s)
+        for col in ALLOCATION_FACTOR_COLUMNS:
+            samples[col][:, start:start + b] = batch[col]
+
+    print(f"{iterations} Monte Carlo samples of the allocation factors calculated!")
+
+    results = {}
+    for col in ALLOCATION_FACTOR_COLUMNS:
+        results[(col, 'mean')] = samples[col].mean(axis=1)
+        for q, values in zip(percentiles, np.percentile(samples[col], percentiles, axis=1)):
+            results[(col, f"p{q:g}")] = values
+
+    uncertainty_df = pd.DataFrame(results, index=arrays['labels'])
+    uncertainty_df.columns = pd.MultiIndex.from_tuples(uncertainty_df.columns)
+
+    return uncertainty_df
+
+# Environment variable for a custom pbaesa data directory, defaults to ~/.pbaesa_data
+DATA_DIR_ENVIRONMENT_VARIABLE = "PBAESA_DATA_DIR"
+
+# Sheet of the allocation factors file with the cache key of its inputs
+CACHE_KEY_SHEET = "Cache key"
+
+def get_data_path():
+    """
+    Get the pbaesa data directory, e.g. for cached allocation factors.
+
+    The directory can be configured with the environment variable PBAESA_DATA_DIR.
+
+    Returns:
+        data_path: Path
+    """
+    data_path = os.environ.get(DATA_DIR_ENVIRONMENT_VARIABLE)
+    if data_path:
+        return Path(data_path)
+    return Path.home() / ".pbaesa_data"
+
+def hash_exiobase_archive(exio_file_path):
+    """
+    Calculate the SHA-256 hash of an exiobase archive.
+
+    The hash is stored next to the archive together with its size and modification time, 
+    so that the archive is only read again when it changes.
+
+    Parameters:
+        exio_file_path: str or Path
+
+    Returns:
+        digest: str
+    """
+    exio_file_path = Path(exio_file_path)
+    stat = exio_file_path.stat()
+    hash_path = exio_file_path.with_name(exio_file_path.name + ".sha256.json")
+
+    if hash_path.exists():
+        with open(hash_path, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get('size') == stat.st_size and stored.get('mtime_ns') == stat.st_mtime_ns:
+            return stored['sha256']
+
+    sha256 = hashlib.sha256()
+    with open(exio_file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+
+    with open(hash_path, "w", encoding="utf-8") as f:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}, f)
+
+    return digest
+
+def get_allocation_factor_cache_key(year, exiobase_storage_path=None):
+    """
+    Get the key of the cached allocation factors of a given year.
+
+    The key is a hash of all inputs of the calculation: the exiobase archive, the population
+    weights, the value-added components of the GVA and the pbaesa version. If any of them 
+    changes, the allocation factors are calculated again.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        cache_key: str, or None if the exiobase archive has not been downloaded
+    """
+    from . import __version__
+
+    exio_file_path = find_exiobase_file_path(year, exiobase_storage_path=exiobase_storage_path)
+    if exio_file_path is None:
+        return None
+
+    inputs = {
+        'year': int(year),
+        'archive': hash_exiobase_archive(exio_file_path),
+        'population_weights': sorted(get_population_weights().items()),
+        'gva_components': GVA_COMPONENTS,
+        'version': __version__,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+def get_cached_allocation_factors_path(year, cache_key):
+    """
+    Get the path of the cached allocation factors of a given year and cache key.
+
+    Parameters:
+        year: int
+        cache_key: str
+
+    Returns:
+        file_path: Path
+    """
+    return get_data_path() / "allocation_factors" / f"Allocation Factors_{year}_{cache_key}.csv"
+
+def add_scope_columns(aSoSOS_j_df):
+    """
+    Add geographical scope and sector columns to the allocation factors.
+
+    Parameters:
+        aSoSOS_j_df: dataframe with 'region_sector' labels as index
+
+    Returns:
+        aSoSOS_j_df: dataframe
+    """
+    aSoSOS_j_df[GEO_SCOPE_COLUMN] = aSoSOS_j_df.index.str.split('_').str[0]
+    aSoSOS_j_df[SECTOR_COLUMN] = aSoSOS_j_df.index.str.split('_').str[1]
+
+    return aSoSOS_j_df
+
+def cache_allocation_factors(year, aSoSOS_j_df, exiobase_storage_path=None):
+    """
+    Store the allocation factors of a given year in the result cache of the data directory.
+
+    Parameters:
+        year: int
+        aSoSOS_j_df: dataframe with all allocation factors, c.f. calculate_all_allocation_factors
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        file_path: Path of the cached file, or None if the exiobase archive is not available
+    """
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+    if cache_key is None:
+        return None
+
+    file_path = get_cached_allocation_factors_path(year, cache_key)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first, so that no incomplete results are read
+    temporary_path = file_path.with_name(file_path.name + f".{os.getpid()}.tmp")
+    aSoSOS_j_df.to_csv(temporary_path)
+    os.replace(temporary_path, file_path)
+
+    return file_path
+
+def load_cached_allocation_factors(year, exiobase_storage_path=None):
+    """
+    Load the allocation factors of a given year from the result cache of the data directory.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        allocation_factor_df: dataframe, or None if there are no cached allocation factors 
+                              for the current inputs
+    """
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+    if cache_key is None:
+        return None
+
+    file_path = get_cached_allocation_factors_path(year, cache_key)
+    if not file_path.exists():
+        return None
+
+    return pd.read_csv(file_path, index_col=0, float_precision="round_trip")
+
+def calculate_and_cache_allocation_factors(year, exiobase_storage_path=None):
+    """
+    Calculate all allocation factors for a given year with geographical scope and sector
+    columns and store them in the result cache of the data directory.
+
+    Parameters:
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        aSoSOS_j_df: dataframe with all allocation factors
+    """
+    aSoSOS_j_df = calculate_all_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    aSoSOS_j_df = add_scope_columns(aSoSOS_j_df)
+
+    # Keep the results in the cache of the data directory for reuse in any working directory
+    cache_allocation_factors(year, aSoSOS_j_df, exiobase_storage_path=exiobase_storage_path)
+
+    return aSoSOS_j_df
+
 def export_all_allocation_factors(year, exiobase_storage_path=None):
     """
     Calculate and export all allocation factors for a given year.
@@ -906,6 +1687,9 @@ def export_all_allocation_factors(year, exiobase_storage_path=None):
     - Total final consumption expenditure (FCE)
     - Direct gross value added (GVA)
     - Total gross value added (GVA)
+
+    The cache key of the inputs (c.f. get_allocation_factor_cache_key) is stored in a second
+    sheet, so that load_allocation_factors only uses the file for the same inputs.
     
     Parameters:
         year: int - The year for which to calculate allocation factors
@@ -916,24 +1700,108 @@ def export_all_allocation_factors(year, exiobase_storage_path=None):
         Excel-File with Allocation Factors
         
     """
-    aSoSOS_j_df = calculate_all_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    aSoSOS_j_df = calculate_and_cache_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
 
     # Write to Excel-File that includes the allocation factors
-    aSoSOS_j_df['Country (c.f. ISO 3166-1 alpha-2) & Rest of World regions'] = aSoSOS_j_df.index.str.split('_').str[0]
-    aSoSOS_j_df['Sector (c.f. EU’s NACE Rev.1 classification)'] = aSoSOS_j_df.index.str.split('_').str[1]
-     
     filename = f"Allocation Factors_{year}.xlsx"
-    aSoSOS_j_df.to_excel(filename)
+    with pd.ExcelWriter(filename) as writer:
+        aSoSOS_j_df.to_excel(writer)
+        if cache_key is not None:
+            pd.DataFrame({'cache_key': [cache_key]}).to_excel(writer, sheet_name=CACHE_KEY_SHEET, index=False)
+
+def read_allocation_factors_file(year, cache_key=None):
+    """
+    Read the allocation factors file of a given year from the working directory.
+
+    Parameters:
+        year: int
+        cache_key: str, optional - Cache key of the current inputs. If given, the file is only
+            read if it stores the same cache key (c.f. export_all_allocation_factors).
+
+    Returns:
+        allocation_factor_df: dataframe, or None if there is no file for the given cache key
+    """
+    file_path = Path(f"Allocation Factors_{year}.xlsx")
+    if not file_path.exists():
+        return None
+
+    if cache_key is not None:
+        with pd.ExcelFile(file_path) as excel_file:
+            stored_key = None
+            if CACHE_KEY_SHEET in excel_file.sheet_names:
+                stored_key = excel_file.parse(CACHE_KEY_SHEET)['cache_key'].iloc[0]
+        if stored_key != cache_key:
+            print(f"The allocation factors file for year {year} was not calculated from the current inputs and is ignored.")
+            return None
+
+    allocation_factor_df = pd.read_excel(file_path)
+
+    # Harmonize column names due to formatting variations
+    allocation_factor_df.columns = [
+        col.replace('Allocation factors calculated \nvia', 'Allocation factor calculated via')
+        if isinstance(col, str) else col
+        for col in allocation_factor_df.columns
+    ]
+
+    return allocation_factor_df
+
+def load_allocation_factors(year, exiobase_storage_path=None):
+    """
+    Load the table of all allocation factors for a specific year.
+
+    Allocation factors are read without any calculation from the precomputed allocation factor
+    cube if it covers the year and was built from the current inputs (c.f. allocation_cube), 
+    or from the result cache of the data directory if they have been calculated from the same 
+    inputs before (c.f. get_allocation_factor_cache_key). Otherwise an allocation factors file
+    in the working directory is used if it stores the same cache key, or if the cache key is
+    unknown because no exiobase archive is available. If neither exists, the allocation factors
+    are calculated and cached, without writing a file to the working directory.
+
+    Parameters:
+        year: int - Year for which to load allocation factors
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        allocation_factor_df: A pandas DataFrame with the allocation factors of all sectors in 
+                              all geographical scopes, or None if it could not be generated.
+    """
+    from .allocation_cube import get_allocation_factors_from_cube
+
+    allocation_factor_df = get_allocation_factors_from_cube(year, exiobase_storage_path=exiobase_storage_path)
+    if allocation_factor_df is not None:
+        return allocation_factor_df
+
+    allocation_factor_df = load_cached_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    if allocation_factor_df is not None:
+        return allocation_factor_df
+
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+    allocation_factor_df = read_allocation_factors_file(year, cache_key=cache_key)
+    if allocation_factor_df is not None:
+        return allocation_factor_df
+
+    print(f"Allocation factors for year {year} not found.")
+    print("Attempting to generate allocation factors...")
+    try:
+        return calculate_and_cache_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    except NotImplementedError as e:
+        print(f"Error: {e}")
+        print("\nPlease provide the allocation factors file manually.")
+        print(f"Expected file name: Allocation Factors_{year}.xlsx")
+        return None
 
 def get_all_allocation_factor(geographical_scope, sector, year, exiobase_storage_path=None):
     """
     Get all allocation factors for a sector in a specific geographical scope and for a specific year.
     
-    If the allocation factors file does not exist, this function will attempt to download/calculate it
-    automatically by calling export_all_allocation_factors.
+    If no allocation factors are available for the current inputs, this function will attempt
+    to download/calculate them automatically (c.f. load_allocation_factors).
 
     Parameters:
-        geographical_scope: str - ISO 3166-1 alpha-2 country code or Rest of World region
+        geographical_scope: str - ISO 3166-1 alpha-2 country code, Rest of World region or
+                            group of geographical scopes (c.f. concordance.REGION_GROUPS)
         sector: str - Sector name according to EU's NACE Rev.1 classification
         year: int - Year for which to retrieve allocation factors
         exiobase_storage_path: str or Path, optional
@@ -943,40 +1811,31 @@ def get_all_allocation_factor(geographical_scope, sector, year, exiobase_storage
         filtered_df: A pandas DataFrame with allocation factors for the specified sector 
                     and geographical scope, or None if not found.
     """    
-    
-    pattern = f"Allocation Factors_{year}.xlsx"
-    matching_file = glob.glob(pattern)
-  
-    if not matching_file:
-        print(f"Allocation factors file for year {year} not found.")
-        print("Attempting to generate allocation factors...")
-        try:
-            export_all_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
-            # Re-check for the file after generation
-            matching_file = glob.glob(pattern)
-            if not matching_file:
-                print("Failed to generate allocation factors file.")
-                return None
-        except NotImplementedError as e:
-            print(f"Error: {e}")
-            print("\nPlease provide the allocation factors file manually.")
-            print(f"Expected file name: {pattern}")
-            return None
-    
-    file_path_allocation_factors = matching_file[0]
-    allocation_factor_df = pd.read_excel(file_path_allocation_factors)
+    from .concordance import REGION_GROUPS, aggregate_allocation_factors
+
+    if geographical_scope in REGION_GROUPS:
+        allocation_factor_df = aggregate_allocation_factors(
+            year,
+            groups={geographical_scope: REGION_GROUPS[geographical_scope]},
+            exiobase_storage_path=exiobase_storage_path,
+        )
+    else:
+        allocation_factor_df = load_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    if allocation_factor_df is None:
+        return None
 
-    geo_scope_col = "Country (c.f. ISO 3166-1 alpha-2) & Rest of World regions"
-    sector_col = "Sector (c.f. EU’s NACE Rev.1 classification)"
+    geo_scope_col = GEO_SCOPE_COLUMN
+    sector_col = SECTOR_COLUMN
 
-    if geographical_scope not in allocation_factor_df[geo_scope_col].values:
-        print("Invalid location. Available options:")
-        print(allocation_factor_df[geo_scope_col].unique())
+    if geographical_scope not in REGION_GROUPS and not is_valid_geographical_scope(geographical_scope):
+        print(f"Invalid location '{geographical_scope}'. Did you mean one of these?")
+        print(suggest_geographical_scopes(geographical_scope))
         return None
 
-    if sector not in allocation_factor_df[sector_col].values:
-        print("Invalid sector. Available options:")
-        print(allocation_factor_df[sector_col].unique())
+    check_sectors(sector)
+    if not is_valid_sector(sector):
+        print(f"Invalid sector '{sector}'. Did you mean one of these?")
+        print(suggest_sectors(sector))
         return None
 
     filtered_df = allocation_factor_df[
@@ -984,4 +1843,55 @@ def get_all_allocation_factor(geographical_scope, sector, year, exiobase_storage
         (allocation_factor_df[sector_col] == sector)
     ]
 
-    return filtered_df
\ No newline at end of file
+    return filtered_df
+
+def get_allocation_factors(functional_units, exiobase_storage_path=None):
+    """
+    Get all allocation factors for many combinations of geographical scope, sector and year at once.
+
+    The allocation factors file of each requested year is loaded only once and all combinations
+    are resolved with a single join instead of one lookup per combination.
+
+    Parameters:
+        functional_units: DataFrame or list of dicts
+            One row per combination with the columns 'geographical_scope', 'sector' and 'year'.
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        factors_df: A dataframe with one column per allocation factor, aligned with the rows of 
+                    functional_units. Combinations that could not be found are NaN.
+    """
+    keys = ['geographical_scope', 'sector', 'year']
+    requested = pd.DataFrame(functional_units)[keys].rename_axis(None)
+    check_sectors(requested['sector'].unique())
+
+    tables = []
+    for year in requested['year'].unique():
+        allocation_factor_df = load_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+        if allocation_factor_df is None:
+            continue
+        table = allocation_factor_df.rename(
+            columns={GEO_SCOPE_COLUMN: 'geographical_scope', SECTOR_COLUMN: 'sector'}
+        )[['geographical_scope', 'sector'] + ALLOCATION_FACTOR_COLUMNS]
+        table['year'] = year
+        tables.append(table)
+
+    if tables:
+        table = pd.concat(tables, ignore_index=True)
+    else:
+        table = pd.DataFrame(columns=keys + ALLOCATION_FACTOR_COLUMNS)
+
+    factors_df = (
+        requested.reset_index()
+        .merge(table, on=keys, how='left')
+        .set_index('index')
+    )
+    factors_df.index.name = requested.index.name
+
+    not_found = factors_df[ALLOCATION_FACTOR_COLUMNS].isna().all(axis=1)
+    if not_found.any():
+        print("No allocation factors found for the following combinations:")
+        print(factors_df.loc[not_found, keys].drop_duplicates().to_string(index=False))
+
+    return factors_df[ALLOCATION_FACTOR_COLUMNS]
@@ -0,0 +1,514 @@
+"""
+Precomputed allocation factors of all EXIOBASE years as one year x region x sector x method cube.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .allocation import (
+    ALLOCATION_FACTOR_COLUMNS,
+    GEO_SCOPE_COLUMN,
+    SECTOR_COLUMN,
+    add_scope_columns,
+    cache_allocation_factors,
+    calculate_all_allocation_factors,
+    calculate_for_years,
+    get_allocation_factor_cache_key,
+    get_data_path,
+    load_cached_allocation_factors,
+)
+from .exiobase_index import load_exiobase_index
+
+
+# File name of the compressed allocation factor cube
+CUBE_FILE_NAME = "allocation_factors_cube.npz"
+
+# Years covered by EXIOBASE 3
+EXIOBASE_YEARS = list(range(1995, 2023))
+
+# Allocation factor cubes that have been loaded in this process, by file path
+_cubes = {}
+
+
+def get_cube_file_paths():
+    """
+    Get the locations that are searched for the allocation factor cube: the data directory
+    (c.f. allocation.get_data_path) first and the package data second.
+
+    Returns:
+        file_paths: list of Path
+    """
+    return [
+        get_data_path() / CUBE_FILE_NAME,
+        Path(os.path.dirname(__file__)) / "data" / CUBE_FILE_NAME,
+    ]
+
+
+def allocation_factor_table_to_array(allocation_factor_df, geo, sectors):
+    """
+    Arrange the allocation factors of one year as a region x sector x method array.
+
+    Parameters:
+        allocation_factor_df: dataframe with 'region_sector' labels as index and the allocation
+                              factor columns, c.f. calculate_all_allocation_factors
+        geo: list of geographical scopes of the cube
+        sectors: list of sectors of the cube
+
+    Returns:
+        values: array (geo x sectors x methods), NaN for missing combinations
+    """
+    labels = pd.Index(allocation_factor_df.index.astype(str))
+    split_labels = labels.str.split('_', n=1)
+    geo_ids = pd.Index(geo).get_indexer(split_labels.str[0])
+    sector_ids = pd.Index(sectors).get_indexer(split_labels.str[1])
+
+    unknown = (geo_ids < 0) | (sector_ids < 0)
+    if unknown.any():
+        raise ValueError(f"Allocation factors with unknown labels: {list(labels[unknown][:5])}")
+
+    values = np.full((len(geo), len(sectors), len(ALLOCATION_FACTOR_COLUMNS)), np.nan)
+    values[geo_ids, sector_ids, :] = allocation_factor_df[ALLOCATION_FACTOR_COLUMNS].to_numpy(dtype=float)
+
+    return values
+
+
+def build_allocation_factor_cube(years=None, file_path=None, exiobase_storage_path=None):
+    """
+    Calculate the allocation factors of several years with the full pipeline and save them as
+    a compressed allocation factor cube.
+
+    Allocation factors that are already in the result cache of the data directory are reused,
+    the exiobase data of the next year is prefetched while the current year is calculated.
+
+    Parameters:
+        years: list of int - Defaults to all EXIOBASE years (1995-2022)
+        file_path: str or Path - Defaults to the data directory
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        file_path: Path of the written cube
+    """
+    from . import __version__
+
+    years = list(EXIOBASE_YEARS if years is None else years)
+    file_path = Path(file_path) if file_path is not None else get_cube_file_paths()[0]
+
+    exiobase_index = load_exiobase_index()
+    geo = sorted(exiobase_index['geo'])
+    sectors = exiobase_index['sectors']
+
+    def calculate_year(year, exiobase_storage_path=None):
+        allocation_factor_df = load_cached_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+        if allocation_factor_df is None:
+            allocation_factor_df = calculate_all_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+            cache_allocation_factors(year, add_scope_columns(allocation_factor_df), exiobase_storage_path=exiobase_storage_path)
+        cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+        return allocation_factor_table_to_array(allocation_factor_df, geo, sectors), cache_key
+
+    results = calculate_for_years(years, function=calculate_year, exiobase_storage_path=exiobase_storage_path)
+
+    metadata = {
+        'version': __version__,
+        'cache_keys': {str(year): results[year][1] for year in years},
+    }
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            values=np.stack([results[year][0] for year in years]),
+            years=np.array(years),
+            geo=np.array(geo),
+            sectors=np.array(sectors),
+            methods=np.array(ALLOCATION_FACTOR_COLUMNS),
+            metadata=np.array(json.dumps(metadata)),
+        )
+    _cubes.pop(str(file_path), None)
+    _stores.clear()
+
+    return file_path
+
+
+def load_allocation_factor_cube(file_path=None):
+    """
+    Load the allocation factor cube.
+
+    Parameters:
+        file_path: str or Path - If None, the data directory and the package data are searched
+
+    Returns:
+        cube: dict with the entries
+            'values': array (years x geo x sectors x methods)
+            'years': pandas Index of the years
+            'geo': pandas Index of the geographical scopes
+            'sectors': pandas Index of the sectors
+            'methods': pandas Index of the allocation factor columns
+            'metadata': dict with the pbaesa version and the cache keys of the years
+        or None if no cube exists
+    """
+    candidates = [Path(file_path)] if file_path is not None else get_cube_file_paths()
+    file_path = next((path for path in candidates if path.exists()), None)
+    if file_path is None:
+        return None
+
+    if str(file_path) not in _cubes:
+        with np.load(file_path, allow_pickle=False) as data:
+            _cubes[str(file_path)] = {
+                'values': data['values'],
+                'years': pd.Index(data['years'].astype(int)),
+                'geo': pd.Index(data['geo'].astype(str)),
+                'sectors': pd.Index(data['sectors'].astype(str)),
+                'methods': pd.Index(data['methods'].astype(str)),
+                'metadata': json.loads(str(data['metadata'])),
+            }
+
+    return _cubes[str(file_path)]
+
+
+def is_cube_current(cube, year, exiobase_storage_path=None):
+    """
+    Check whether the allocation factors of a year in the cube were calculated from the current
+    inputs: the cube must have been built with the installed pbaesa version and, if the exiobase
+    archive of the year has been downloaded, from the same inputs (c.f.
+    allocation.get_allocation_factor_cache_key).
+
+    Parameters:
+        cube: dict, c.f. load_allocation_factor_cube
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        bool
+    """
+    from . import __version__
+
+    if cube['metadata'].get('version') != __version__:
+        return False
+
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+    return cache_key is None or cube['metadata'].get('cache_keys', {}).get(str(int(year))) == cache_key
+
+
+def get_allocation_factors_from_cube(year, file_path=None, exiobase_storage_path=None):
+    """
+    Get the table of all allocation factors of a year from the allocation factor cube
+    without any calculation.
+
+    Parameters:
+        year: int
+        file_path: str or Path - If None, the data directory and the package data are searched
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        allocation_factor_df: dataframe in the layout of load_allocation_factors, or None if
+                              the cube does not contain the year or is outdated (c.f. is_cube_current)
+    """
+    cube = load_allocation_factor_cube(file_path)
+    if cube is None or int(year) not in cube['years']:
+        return None
+    if not is_cube_current(cube, year, exiobase_storage_path=exiobase_storage_path):
+        print(f"The allocation factor cube is outdated for {year}. The allocation factors are loaded from the cache instead.")
+        return None
+
+    values = cube['values'][cube['years'].get_loc(int(year))]
+    geo = np.repeat(cube['geo'].to_numpy(), len(cube['sectors']))
+    sectors = np.tile(cube['sectors'].to_numpy(), len(cube['geo']))
+
+    allocation_factor_df = pd.DataFrame(
+        values.reshape(-1, len(cube['methods'])),
+        index=pd.Index(geo + "_" + sectors),
+        columns=list(cube['methods']),
+    )
+    allocation_factor_df[GEO_SCOPE_COLUMN] = geo
+    allocation_factor_df[SECTOR_COLUMN] = sectors
+
+    # Drop combinations that are not covered by the cube
+    covered = allocation_factor_df[list(cube['methods'])].notna().any(axis=1)
+    allocation_factor_df = allocation_factor_df[covered].sort_index()
+
+    return allocation_factor_df
+
+
+def verify_allocation_factor_cube(years=None, file_path=None, exiobase_storage_path=None, rtol=1e-9):
+    """
+    Verify the allocation factor cube against allocation factors recalculated with the full
+    pipeline.
+
+    Parameters:
+        years: list of int - Defaults to all years of the cube
+        file_path: str or Path - If None, the data directory and the package data are searched
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+        rtol: float - Relative tolerance
+
+    Returns:
+        deviations_df: dataframe with the maximum absolute deviation per year and allocation
+                       factor and a column 'valid' that indicates whether all deviations are
+                       within the tolerance
+    """
+    cube = load_allocation_factor_cube(file_path)
+    if cube is None:
+        raise ValueError("No allocation factor cube found.")
+    years = list(cube['years'] if years is None else years)
+
+    def calculate_deviation(year, exiobase_storage_path=None):
+        expected = allocation_factor_table_to_array(
+            calculate_all_allocation_factors(year, exiobase_storage_path=exiobase_storage_path),
+            cube['geo'],
+            cube['sectors'],
+        )
+        actual = cube['values'][cube['years'].get_loc(int(year))]
+        deviation = np.nanmax(np.abs(actual - expected), axis=(0, 1))
+        valid = np.allclose(actual, expected, rtol=rtol, atol=0, equal_nan=True)
+        return deviation, valid
+
+    results = calculate_for_years(years, function=calculate_deviation, exiobase_storage_path=exiobase_storage_path)
+
+    deviations_df = pd.DataFrame(
+        [results[year][0] for year in years],
+        index=pd.Index(years, name='year'),
+        columns=list(cube['methods']),
+    )
+    deviations_df['valid'] = [results[year][1] for year in years]
+
+    return deviations_df
+
+
+# Directory name of the memory-mapped allocation factor store
+STORE_DIRECTORY_NAME = "allocation_factors_cube"
+
+# Memory-mapped allocation factor stores that have been opened in this process, by path
+_stores = {}
+
+
+def _get_file_signature(file_path):
+    """
+    Get the path, size and modification time of a file to detect changes.
+    """
+    stat = Path(file_path).stat()
+    return {'path': str(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def _get_store_signature(store_path):
+    """
+    Get the signatures of the files of a store to detect replaced files, or None if a file is missing.
+    """
+    try:
+        return {
+            'axes': _get_file_signature(store_path / "axes.json"),
+            'values': _get_file_signature(store_path / "values.npy"),
+        }
+    except FileNotFoundError:
+        return None
+
+
+def _get_values_signature(signature):
+    """
+    Get the size and modification time of the values file from its signature, which identify
+    the values of a store also after it has been moved or copied with its metadata.
+    """
+    return {'size': signature['size'], 'mtime_ns': signature['mtime_ns']}
+
+
+def _replace_file(file_path, write):
+    """
+    Write a file under a temporary name in the same directory and replace the file with it,
+    so that readers, including processes that have the file memory-mapped, never see a
+    partially written file.
+    """
+    temporary_path = file_path.with_name(file_path.name + f".{os.getpid()}.tmp")
+    write(temporary_path)
+    os.replace(temporary_path, file_path)
+
+
+def write_allocation_factor_store(cube, store_path=None, source=None):
+    """
+    Write an allocation factor cube as an uncompressed store that can be memory-mapped.
+
+    The store is a directory with the values as a .npy file and the label axes as json. The
+    axes record the signature of the values file they belong to.
+
+    Parameters:
+        cube: dict, c.f. load_allocation_factor_cube
+        store_path: str or Path - Defaults to the data directory
+        source: dict - Signature of the compressed cube the store is extracted from
+
+    Returns:
+        store_path: Path
+    """
+    store_path = Path(store_path) if store_path is not None else get_data_path() / STORE_DIRECTORY_NAME
+    store_path.mkdir(parents=True, exist_ok=True)
+
+    axes = {
+        'years': [int(year) for year in cube['years']],
+        'geo': list(cube['geo']),
+        'sectors': list(cube['sectors']),
+        'methods': list(cube['methods']),
+        'metadata': cube['metadata'],
+        'source': source,
+    }
+
+    def write_values(file_path):
+        with open(file_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(cube['values'], dtype=float))
+
+    def write_axes(file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(axes, f, ensure_ascii=False)
+
+    # Replace the values before the axes, so that the axes are only read with their values
+    _replace_file(store_path / "values.npy", write_values)
+    axes['values'] = _get_values_signature(_get_file_signature(store_path / "values.npy"))
+    _replace_file(store_path / "axes.json", write_axes)
+    _stores.pop(str(store_path), None)
+
+    return store_path
+
+
+def open_allocation_factor_store(store_path=None):
+    """
+    Open the allocation factor store memory-mapped, so that selections only read the
+    requested values from disk.
+
+    The store at the default location is extracted from the compressed allocation factor cube
+    when it does not exist yet or when the cube has changed. A store that has been replaced
+    since it was opened, e.g. by another process, is opened again.
+
+    Parameters:
+        store_path: str or Path - Defaults to the data directory
+
+    Returns:
+        store: dict with the same entries as load_allocation_factor_cube, with the values as
+               read-only memory-mapped array, or None if neither a store nor a cube exists
+    """
+    default_store = store_path is None
+    store_path = Path(store_path) if store_path is not None else get_data_path() / STORE_DIRECTORY_NAME
+
+    store = _stores.get(str(store_path))
+    if store is not None and store['signature'] == _get_store_signature(store_path):
+        return store
+    _stores.pop(str(store_path), None)
+
+    axes, signature = _read_store_axes(store_path)
+
+    if default_store:
+        cube_file = next((path for path in get_cube_file_paths() if path.exists()), None)
+        source = _get_file_signature(cube_file) if cube_file is not None else None
+        if source is not None and (axes is None or axes.get('source') != source):
+            write_allocation_factor_store(load_allocation_factor_cube(cube_file), store_path, source=source)
+            axes, signature = _read_store_axes(store_path)
+
+    if axes is None:
+        return None
+
+    values = np.load(store_path / "values.npy", mmap_mode='r')
+    if _get_file_signature(store_path / "values.npy") != signature['values']:
+        return None # Replaced while opening
+
+    _stores[str(store_path)] = {
+        'values': values,
+        'years': pd.Index(axes['years']),
+        'geo': pd.Index(axes['geo']),
+        'sectors': pd.Index(axes['sectors']),
+        'methods': pd.Index(axes['methods']),
+        'metadata': axes['metadata'],
+        'signature': signature,
+    }
+
+    return _stores[str(store_path)]
+
+
+def _read_store_axes(store_path):
+    """
+    Read the axes of a store and the signatures of its files, or None for both if the store
+    is missing or its values do not belong to the axes, e.g. while it is being replaced.
+    """
+    signature = _get_store_signature(store_path)
+    if signature is None:
+        return None, None
+
+    with open(store_path / "axes.json", encoding="utf-8") as f:
+        axes = json.load(f)
+    if axes.get('values') != _get_values_signature(signature['values']):
+        return None, None
+
+    return axes, signature
+
+
+def _resolve_axis(axis, selection, name):
+    """
+    Resolve a selection of labels to positions on an axis of the cube. None selects all labels.
+    """
+    if selection is None:
+        return np.arange(len(axis))
+    if isinstance(selection, (str, int, np.integer)):
+        selection = [selection]
+
+    positions = axis.get_indexer(pd.Index(list(selection)))
+    if (positions < 0).any():
+        unknown = [label for label, position in zip(selection, positions) if position < 0]
+        raise ValueError(f"Unknown {name}: {unknown}")
+
+    return positions
+
+
+def select_allocation_factors(
+    years=None,
+    geographical_scopes=None,
+    sectors=None,
+    methods=None,
+    as_dataframe=False,
+    store=None,
+):
+    """
+    Select allocation factors for any combination of years, geographical scopes, sectors and
+    allocation factors from the memory-mapped store, e.g. the total GVA allocation factor of
+    one sector in all geographical scopes and years.
+
+    Only the selected values are read from disk. A single label selects one entry, a list
+    selects several entries and None selects all entries of an axis.
+
+    Parameters:
+        years: int or list of int
+        geographical_scopes: str or list of str
+        sectors: str or list of str
+        methods: str or list of str - Allocation factor columns, c.f. ALLOCATION_FACTOR_COLUMNS
+        as_dataframe: bool - Return a dataframe instead of an array
+        store: dict - Opened store or cube. If None, the store of the data directory is opened.
+
+    Returns:
+        values: array (years x geographical scopes x sectors x methods), or a dataframe with a
+                (year, geographical scope, sector) MultiIndex and one column per allocation factor
+    """
+    if store is None:
+        store = open_allocation_factor_store()
+        if store is None:
+            raise ValueError("No allocation factor store or cube found.")
+
+    positions = [
+        _resolve_axis(store['years'], years, 'years'),
+        _resolve_axis(store['geo'], geographical_scopes, 'geographical scopes'),
+        _resolve_axis(store['sectors'], sectors, 'sectors'),
+        _resolve_axis(store['methods'], methods, 'allocation factors'),
+    ]
+    values = np.asarray(store['values'][np.ix_(*positions)])
+
+    if not as_dataframe:
+        return values
+
+    index = pd.MultiIndex.from_product(
+        [store['years'][positions[0]], store['geo'][positions[1]], store['sectors'][positions[2]]],
+        names=['year', 'geographical_scope', 'sector'],
+    )
+    return pd.DataFrame(
+        values.reshape(-1, len(positions[3])),
+        index=index,
+        columns=list(store['methods'][positions[3]]),
+    )
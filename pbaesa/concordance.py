@@ -0,0 +1,404 @@
+"""
+Concordances between EXIOBASE regions and sectors and other classifications, e.g. to aggregate
+allocation factors to groups of geographical scopes or to map ecoinvent activities to EXIOBASE.
+"""
+
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .allocation import (
+    ALLOCATION_FACTOR_COLUMNS,
+    GEO_SCOPE_COLUMN,
+    SECTOR_COLUMN,
+    calculate_population_weights,
+    get_allocation_factor_cache_key,
+    get_data_path,
+    get_population_weights,
+    load_allocation_factors,
+)
+from .allocation_cube import allocation_factor_table_to_array
+from .exiobase_index import load_exiobase_index
+
+
+# Groups of EXIOBASE geographical scopes that are available by name
+EU27 = [
+    "AT", "BE", "BG", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GR", "HR", "HU",
+    "IE", "IT", "LT", "LU", "LV", "MT", "NL", "PL", "PT", "RO", "SE", "SI", "SK",
+]
+REGION_GROUPS = {
+    "EU27": EU27,
+    "EU28": EU27 + ["GB"],
+    "GLO": sorted(load_exiobase_index()['geo']),
+    # Approximations of the ecoinvent regions with EXIOBASE geographical scopes
+    "RER": EU27 + ["GB", "CH", "NO", "WE"],
+    "RAS": ["CN", "IN", "JP", "KR", "ID", "TW", "WA"],
+    "RLA": ["BR", "MX", "WL"],
+    "RAF": ["ZA", "WF"],
+    "RNA": ["US", "CA"],
+}
+
+# Allocation factors of all geographical scopes as arrays (geo x sectors x methods), by year and inputs
+_region_components = {}
+
+
+def build_region_concordance(groups, geo):
+    """
+    Build a sparse concordance matrix that assigns geographical scopes to groups.
+
+    Groups may overlap, i.e. a geographical scope can belong to several groups.
+
+    Parameters:
+        groups: dict with group names as keys and lists of geographical scopes as values
+        geo: list of geographical scopes (order of the columns of the concordance)
+
+    Returns:
+        concordance: sparse matrix (groups x geographical scopes)
+    """
+    geo_ids = pd.Index(geo)
+    rows, cols = [], []
+    for row, (group, members) in enumerate(groups.items()):
+        member_ids = geo_ids.get_indexer(pd.Index(members))
+        if (member_ids < 0).any():
+            unknown = [member for member, member_id in zip(members, member_ids) if member_id < 0]
+            raise ValueError(f"Unknown geographical scopes in group '{group}': {unknown}")
+        rows.extend([row] * len(member_ids))
+        cols.extend(member_ids)
+
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(groups), len(geo)))
+
+
+def _get_region_components(year, exiobase_storage_path=None):
+    """
+    Get the allocation factors of all geographical scopes of a year as an array, which is
+    loaded only once per year, working directory and cache key of the inputs (c.f.
+    get_allocation_factor_cache_key).
+    """
+    cache_key = get_allocation_factor_cache_key(year, exiobase_storage_path=exiobase_storage_path)
+    key = (int(year), str(exiobase_storage_path), os.getcwd(), cache_key)
+    if key not in _region_components:
+        allocation_factor_df = load_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+        if allocation_factor_df is None:
+            return None
+        allocation_factor_df = allocation_factor_df.set_index(
+            allocation_factor_df[GEO_SCOPE_COLUMN].astype(str) + "_" + allocation_factor_df[SECTOR_COLUMN].astype(str)
+        )
+
+        exiobase_index = load_exiobase_index()
+        geo = sorted(exiobase_index['geo'])
+        sectors = exiobase_index['sectors']
+        values = allocation_factor_table_to_array(allocation_factor_df, geo, sectors)
+        _region_components[key] = (geo, sectors, values)
+
+    return _region_components[key]
+
+
+def aggregate_population_weights(groups=None):
+    """
+    Aggregate the population weights (shares of global population) to groups of geographical scopes.
+
+    Parameters:
+        groups: dict with group names as keys and lists of geographical scopes as values.
+                Defaults to REGION_GROUPS.
+
+    Returns:
+        sPOPr_groups: pandas Series with the population weight of each group
+    """
+    groups = REGION_GROUPS if groups is None else groups
+    geo = sorted(get_population_weights())
+    concordance = build_region_concordance(groups, geo)
+
+    return pd.Series(concordance @ calculate_population_weights(), index=list(groups))
+
+
+def aggregate_allocation_factors(year, groups=None, exiobase_storage_path=None):
+    """
+    Aggregate the allocation factors of all sectors to groups of geographical scopes.
+
+    The allocation factors are shares of the global Safe Operating Space, so the allocation
+    factor of a sector in a group is the sum of the allocation factors of the sector in the
+    geographical scopes of the group. All groups and sectors are aggregated with one sparse
+    product from the allocation factors of the year, which are loaded only once.
+
+    Parameters:
+        year: int
+        groups: dict with group names as keys and lists of geographical scopes as values.
+                Defaults to REGION_GROUPS.
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        aggregated_df: dataframe in the layout of load_allocation_factors with one row per group
+                       and sector, or None if the allocation factors could not be loaded
+    """
+    groups = REGION_GROUPS if groups is None else groups
+    components = _get_region_components(year, exiobase_storage_path=exiobase_storage_path)
+    if components is None:
+        return None
+    geo, sectors, values = components
+
+    #### Aggregation of the allocation factors (groups x sectors x methods) ####
+    concordance = build_region_concordance(groups, geo)
+    covered = ~np.isnan(values)
+    aggregated = concordance @ np.nan_to_num(values).reshape(len(geo), -1)
+    aggregated[(concordance @ covered.reshape(len(geo), -1)) == 0] = np.nan
+
+    group_names = np.repeat(np.array(list(groups), dtype=object), len(sectors))
+    sector_names = np.tile(np.array(sectors, dtype=object), len(groups))
+    aggregated_df = pd.DataFrame(
+        aggregated.reshape(-1, len(ALLOCATION_FACTOR_COLUMNS)),
+        index=pd.Index(group_names + "_" + sector_names),
+        columns=ALLOCATION_FACTOR_COLUMNS,
+    )
+    aggregated_df[GEO_SCOPE_COLUMN] = group_names
+    aggregated_df[SECTOR_COLUMN] = sector_names
+
+    return aggregated_df[aggregated_df[ALLOCATION_FACTOR_COLUMNS].notna().any(axis=1)]
+
+
+@lru_cache(maxsize=None)
+def load_sector_concordance():
+    """
+    Load the packaged concordance of ISIC rev.4 codes and ecoinvent locations to EXIOBASE
+    sectors and geographical scopes.
+
+    Returns:
+        sector_concordance: dict with the entries
+            'isic': pandas Series with the EXIOBASE sector id of ISIC divisions, groups and classes
+            'keywords': list of (ISIC prefix, compiled pattern, EXIOBASE sector id) that refine the
+                        sector by the activity name, e.g. the electricity source
+            'locations': dict of ecoinvent locations and EXIOBASE geographical scopes or groups
+            'countries': dict of countries that are no EXIOBASE geographical scope and the EXIOBASE
+                         Rest of World region they belong to
+            'hash': hash of the concordance data
+    """
+    file_path = os.path.join(os.path.dirname(__file__), "data", "exiobase_concordance.json")
+    with open(file_path, "rb") as f:
+        content = f.read()
+    data = json.loads(content)
+
+    sector_ids = pd.Index(load_exiobase_index()['sector_codes'])
+    isic = pd.Series(sector_ids.get_indexer(list(data['isic'].values())), index=list(data['isic']))
+
+    return {
+        'isic': isic,
+        'keywords': [
+            (prefix, re.compile(r"\b" + re.escape(keyword), re.IGNORECASE), sector_ids.get_loc(code))
+            for prefix, keyword, code in data['keywords']
+        ],
+        'locations': data['locations'],
+        'countries': data['countries'],
+        'hash': hashlib.sha256(content).hexdigest(),
+    }
+
+
+def resolve_isic_sectors(isic_codes, names=None):
+    """
+    Resolve many ISIC rev.4 codes to EXIOBASE sector ids at once.
+
+    Each code is matched to the most specific class, group or division of the concordance. Within
+    a code, the sector can be refined by keywords in the activity names, e.g. 'wheat' for ISIC 0111
+    or 'wind' for ISIC 3510.
+
+    Parameters:
+        isic_codes: list or array of ISIC rev.4 codes, e.g. '0111' or '0111:Growing of cereals ...'
+        names: list or array of activity names, optional
+
+    Returns:
+        sector_ids: array of int, -1 for codes without EXIOBASE sector
+    """
+    sector_concordance = load_sector_concordance()
+    codes = pd.Series(np.asarray(isic_codes, dtype=object)).fillna("").astype(str).str.split(":").str[0].str.strip()
+
+    # Most specific match of class (4 digits), group (3 digits) and division (2 digits)
+    sector_ids = pd.Series(-1, index=codes.index)
+    for digits in (2, 3, 4):
+        matched = codes.str[:digits].map(sector_concordance['isic']).where(codes.str.len() >= digits)
+        sector_ids = matched.fillna(sector_ids)
+
+    # Refinement by keywords, the first matching keyword applies
+    if names is not None:
+        names = pd.Series(np.asarray(names, dtype=object)).fillna("").astype(str)
+        refined = pd.Series(False, index=codes.index)
+        for prefix, pattern, sector_id in sector_concordance['keywords']:
+            match = ~refined & codes.str.startswith(prefix) & names.str.contains(pattern)
+            sector_ids[match] = sector_id
+            refined |= match
+
+    return sector_ids.to_numpy(dtype=int)
+
+
+def resolve_locations(locations):
+    """
+    Resolve many ecoinvent locations to EXIOBASE geographical scopes or groups of geographical
+    scopes (c.f. REGION_GROUPS) at once.
+
+    EXIOBASE geographical scopes are kept, ecoinvent regions are mapped to groups, subnational
+    locations (e.g. 'US-TX') to their country and other countries to the EXIOBASE Rest of World
+    region they belong to.
+
+    ecoinvent's rest-of-world location 'RoW' is deliberately approximated by the global group
+    'GLO'. RoW excludes the locations of the other activities of the same product, which
+    depend on the database, so its allocation factors are overestimated by the shares of the
+    excluded geographical scopes.
+
+    Parameters:
+        locations: list or array of str
+
+    Returns:
+        geographical_scopes: array of str, None for locations without EXIOBASE geographical scope
+    """
+    sector_concordance = load_sector_concordance()
+    locations = pd.Series(np.asarray(locations, dtype=object)).fillna("").astype(str)
+    geo = set(load_exiobase_index()['geo'])
+
+    countries = locations.str.split("-").str[0]
+    resolved = locations.map(sector_concordance['locations'])
+    resolved = resolved.fillna(countries.where(countries.isin(geo)))
+    resolved = resolved.fillna(countries.map(sector_concordance['countries']))
+
+    return resolved.astype(object).where(resolved.notna(), None).to_numpy()
+
+
+def _get_isic_code(classifications):
+    """
+    Get the ISIC code of an activity from its classifications, e.g.
+    [('ISIC rev.4 ecoinvent', '0111:Growing of cereals ...'), ('CPC', ...)].
+    """
+    for system, value in classifications or []:
+        if str(system).upper().startswith("ISIC"):
+            return str(value)
+    return None
+
+
+def build_activity_concordance(activities):
+    """
+    Map many activities to EXIOBASE sectors and geographical scopes at once.
+
+    Parameters:
+        activities: Brightway activities, list of dicts or DataFrame with the entries 'name',
+                    'location' and either 'classifications' (list of (system, value) tuples as
+                    in ecoinvent) or 'isic'
+
+    Returns:
+        concordance_df: dataframe with one row per activity and the columns 'name', 'location',
+                        'isic', 'geographical_scope' and 'sector'. The EXIOBASE sector and
+                        geographical scope are None if they could not be resolved.
+    """
+    if isinstance(activities, pd.DataFrame):
+        activities_df = activities.reset_index(drop=True)
+    else:
+        activities_df = pd.DataFrame([
+            {
+                **({'key': act.key} if hasattr(act, 'key') else {}),
+                'name': act.get('name'),
+                'location': act.get('location'),
+                'isic': act.get('isic') or _get_isic_code(act.get('classifications')),
+            }
+            for act in activities
+        ])
+    if 'isic' not in activities_df.columns:
+        activities_df['isic'] = activities_df.get('classifications', pd.Series(index=activities_df.index)).map(_get_isic_code)
+
+    sectors = np.array(load_exiobase_index()['sectors'], dtype=object)
+    sector_ids = resolve_isic_sectors(activities_df['isic'], activities_df['name'])
+
+    concordance_df = activities_df.drop(columns=['classifications'], errors='ignore').copy()
+    concordance_df['geographical_scope'] = resolve_locations(activities_df['location'])
+    concordance_df['sector'] = np.where(sector_ids >= 0, sectors[sector_ids], None)
+
+    return concordance_df
+
+
+def get_database_concordance(database_name):
+    """
+    Map all activities of a Brightway database to EXIOBASE sectors and geographical scopes.
+
+    The mapping is cached in the data directory (c.f. allocation.get_data_path) per database 
+    version, i.e. it is built again when the database or the concordance changes.
+
+    Parameters:
+        database_name: str
+
+    Returns:
+        concordance_df: dataframe, c.f. build_activity_concordance, with the activity codes as index
+    """
+    import bw2data as bd
+
+    from . import __version__
+
+    version = {
+        'database': database_name,
+        'modified': bd.databases[database_name].get('modified'),
+        'concordance': load_sector_concordance()['hash'],
+        'version': __version__,
+    }
+    cache_key = hashlib.sha256(json.dumps(version, sort_keys=True).encode("utf-8")).hexdigest()
+    file_path = get_data_path() / "concordance" / f"{database_name}_{cache_key[:16]}.csv"
+
+    if file_path.exists():
+        return pd.read_csv(file_path, index_col='code', dtype={'isic': str}).replace({np.nan: None})
+
+    activities = bd.Database(database_name)
+    concordance_df = build_activity_concordance(activities)
+    concordance_df.index = pd.Index([key[1] for key in concordance_df.pop('key')], name='code')
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    concordance_df.to_csv(file_path)
+
+    return concordance_df
+
+
+def get_activity_allocation_factors(activities, year, exiobase_storage_path=None):
+    """
+    Get the allocation factors of many activities at once.
+
+    The activities are mapped to EXIOBASE sectors and geographical scopes (c.f.
+    build_activity_concordance) and joined with the allocation factors of the year in one step.
+    Activities in groups of geographical scopes, e.g. 'GLO' or 'RER', receive the aggregated
+    allocation factors of the group.
+
+    Parameters:
+        activities: Brightway activities, list of dicts or DataFrame, c.f. build_activity_concordance
+        year: int
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        factors_df: the concordance of the activities with one column per allocation factor.
+                    Activities that could not be mapped are NaN.
+    """
+    if isinstance(activities, pd.DataFrame) and {'geographical_scope', 'sector'} <= set(activities.columns):
+        concordance_df = activities.reset_index(drop=True)
+    else:
+        concordance_df = build_activity_concordance(activities)
+
+    tables = []
+    allocation_factor_df = load_allocation_factors(year, exiobase_storage_path=exiobase_storage_path)
+    if allocation_factor_df is not None:
+        tables.append(allocation_factor_df)
+    used_groups = {geo: REGION_GROUPS[geo] for geo in concordance_df['geographical_scope'].dropna().unique() if geo in REGION_GROUPS}
+    if used_groups:
+        aggregated_df = aggregate_allocation_factors(year, groups=used_groups, exiobase_storage_path=exiobase_storage_path)
+        if aggregated_df is not None:
+            tables.append(aggregated_df)
+
+    if tables:
+        table = pd.concat(tables, ignore_index=True).rename(
+            columns={GEO_SCOPE_COLUMN: 'geographical_scope', SECTOR_COLUMN: 'sector'}
+        )[['geographical_scope', 'sector'] + ALLOCATION_FACTOR_COLUMNS]
+    else:
+        table = pd.DataFrame(columns=['geographical_scope', 'sector'] + ALLOCATION_FACTOR_COLUMNS)
+
+    unmapped = concordance_df['geographical_scope'].isna() | concordance_df['sector'].isna()
+    if unmapped.any():
+        print(f"{unmapped.sum()} activities could not be mapped to EXIOBASE, e.g.:")
+        print(concordance_df.loc[unmapped, ['name', 'location', 'isic']].head().to_string(index=False))
+
+    return concordance_df.merge(table, on=['geographical_scope', 'sector'], how='left')
@@ -0,0 +1,221 @@
+"""
+Index of EXIOBASE geographical scopes and sectors for validating and resolving allocation-factor queries.
+"""
+
+import difflib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+def build_exiobase_index(geo, sectors, sector_codes=None, pxp_products=None):
+    """
+    Build an index of geographical scopes and sectors.
+
+    The geographical scopes and sectors keep the given order and receive integer ids
+    according to their position. The flat 'region_sector' labels are sorted alphabetically,
+    as in all allocation factor dataframes.
+
+    Parameters:
+        geo: list of geographical scope abbreviations
+        sectors: list of sector names
+        sector_codes: list of sector codes, optional
+        pxp_products: list of product names and codes of the product-by-product tables, optional
+
+    Returns:
+        exiobase_index: dict with the entries
+            'geo': list of geographical scope abbreviations
+            'sectors': list of sector names
+            'sector_codes': list of sector codes
+            'geo_ids': pandas Index for resolving geographical scopes to ids
+            'sector_ids': pandas Index for resolving sector names to ids
+            'labels': pandas Index of the sorted flat 'region_sector' labels
+            'pxp_products': pandas Index of the product names and codes that are rejected
+    """
+    labels = sorted(f"{geo_scope}_{sector}" for geo_scope in geo for sector in sectors)
+
+    return {
+        'geo': list(geo),
+        'sectors': list(sectors),
+        'sector_codes': list(sector_codes) if sector_codes is not None else None,
+        'geo_ids': pd.Index(geo),
+        'sector_ids': pd.Index(sectors),
+        'labels': pd.Index(labels),
+        'pxp_products': pd.Index(pxp_products if pxp_products is not None else []),
+    }
+
+
+@lru_cache(maxsize=None)
+def load_exiobase_index():
+    """
+    Load the packaged index of EXIOBASE 3 (industry-by-industry) geographical scopes and sectors.
+
+    The allocation factors are calculated from the industry-by-industry (ixi) tables, so the
+    sectors are the 163 ixi industries. The 200 products of the product-by-product (pxp)
+    tables are only indexed to reject them with a clear message.
+
+    Returns:
+        exiobase_index: dict, c.f. build_exiobase_index
+    """
+    file_path = os.path.join(os.path.dirname(__file__), "data", "exiobase_index.json")
+    with open(file_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    return build_exiobase_index(
+        data["regions"],
+        [sector["name"] for sector in data["sectors"]],
+        [sector["code"] for sector in data["sectors"]],
+        [product[key] for product in data["pxp_products"] for key in ("name", "code")],
+    )
+
+
+def is_valid_geographical_scope(geographical_scope):
+    """
+    Check in constant time whether a geographical scope exists in EXIOBASE.
+
+    Parameters:
+        geographical_scope: str
+
+    Returns:
+        bool
+    """
+    return geographical_scope in load_exiobase_index()['geo_ids']
+
+
+def is_valid_sector(sector):
+    """
+    Check in constant time whether a sector exists in EXIOBASE.
+
+    Parameters:
+        sector: str
+
+    Returns:
+        bool
+    """
+    return sector in load_exiobase_index()['sector_ids']
+
+
+def is_pxp_product(sector):
+    """
+    Check in constant time whether a sector is a product name or code of the EXIOBASE
+    product-by-product (pxp) tables, which pbaesa does not use.
+
+    Parameters:
+        sector: str
+
+    Returns:
+        bool
+    """
+    return sector in load_exiobase_index()['pxp_products'] and not is_valid_sector(sector)
+
+
+def check_sectors(sectors):
+    """
+    Raise an error for product names or codes of the EXIOBASE product-by-product (pxp) tables.
+
+    Parameters:
+        sectors: str or list of str
+
+    Returns:
+        None
+    """
+    sectors = [sectors] if isinstance(sectors, str) else list(sectors)
+    pxp_products = sorted({sector for sector in sectors if is_pxp_product(sector)})
+    if pxp_products:
+        raise ValueError(
+            f"{pxp_products} are products of the EXIOBASE product-by-product (pxp) tables. pbaesa uses "
+            "the 163 industries of the industry-by-industry (ixi) tables, e.g. 'Cultivation of wheat' "
+            "instead of 'Wheat'."
+        )
+
+
+def _suggest(query, options, n):
+    """
+    Suggest the options closest to a query: case-insensitive matches and options containing
+    the query first, followed by the closest matches by similarity.
+    """
+    query_lower = str(query).lower()
+    options_lower = {option.lower(): option for option in options}
+
+    suggestions = [option for option in options if option.lower() == query_lower]
+    suggestions += [option for option in options if query_lower in option.lower() and option not in suggestions]
+    close_matches = difflib.get_close_matches(query_lower, list(options_lower), n=n, cutoff=0.4)
+    suggestions += [options_lower[match] for match in close_matches if options_lower[match] not in suggestions]
+
+    return suggestions[:n]
+
+
+def suggest_geographical_scopes(geographical_scope, n=5):
+    """
+    Suggest EXIOBASE geographical scopes that are similar to the given one.
+
+    Parameters:
+        geographical_scope: str
+        n: int - Maximum number of suggestions
+
+    Returns:
+        suggestions: list
+    """
+    return _suggest(geographical_scope, load_exiobase_index()['geo'], n)
+
+
+def suggest_sectors(sector, n=5):
+    """
+    Suggest EXIOBASE sectors that are similar to the given one.
+
+    Parameters:
+        sector: str
+        n: int - Maximum number of suggestions
+
+    Returns:
+        suggestions: list
+    """
+    return _suggest(sector, load_exiobase_index()['sectors'], n)
+
+
+def resolve_geographical_scopes(geographical_scopes):
+    """
+    Resolve many geographical scopes to their integer ids at once.
+
+    Parameters:
+        geographical_scopes: list or array of str
+
+    Returns:
+        geo_ids: array of int, -1 for unknown geographical scopes
+    """
+    return load_exiobase_index()['geo_ids'].get_indexer(pd.Index(geographical_scopes))
+
+
+def resolve_sectors(sectors):
+    """
+    Resolve many sector names to their integer ids at once.
+
+    Parameters:
+        sectors: list or array of str
+
+    Returns:
+        sector_ids: array of int, -1 for unknown sectors
+    """
+    return load_exiobase_index()['sector_ids'].get_indexer(pd.Index(sectors))
+
+
+def resolve_labels(geographical_scopes, sectors):
+    """
+    Resolve many combinations of geographical scope and sector to their positions in the
+    sorted 'region_sector' labels at once, e.g. to index allocation factor arrays.
+
+    Parameters:
+        geographical_scopes: list or array of str
+        sectors: list or array of str
+
+    Returns:
+        positions: array of int, -1 for unknown combinations
+    """
+    labels = (
+        pd.Series(np.asarray(geographical_scopes, dtype=object)).astype(str) + "_"
+        + pd.Series(np.asarray(sectors, dtype=object)).astype(str)
+    )
+    return load_exiobase_index()['labels'].get_indexer(labels)
@@ -2,9 +2,377 @@
 LCIA method creation and management for planetary boundaries.
 """
 
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 import bw2data as bd
-import os
+from bw2data.backends import ActivityDataset, ExchangeDataset, sqlite3_lci_db
+from bw2data.backends.utils import dict_as_exchangedataset
+from peewee import fn
+
+
+# Names of the characterization factor workbook, as distributed and as packaged
+CHARACTERIZATION_FACTORS_FILE_NAMES = [
+    "Characterization Factors_for_eco3101.xlsx",
+    "Characterization factors_for_eco3101.xlsx",
+]
+
+# Planetary boundary categories of the characterization factor workbook
+CATEGORIES = [
+    "Climate Change",
+    "Ocean Acidification",
+    "Change in Biosphere Integrity",
+    "Phosphorus Cycle",
+    "Atmospheric Aerosol Loading",
+    "Freshwater Use",
+    "Stratospheric Ozone Depletion",
+    "Land-system Change"
+]
+
+# Units of the planetary boundary categories
+UNITS = {
+    "Climate Change": "Energy imbalance at top-of-atmosphere [W/m²]",
+    "Ocean Acidification": "Aragonite saturation state [Ωₐᵣₐ]",
+    "Change in Biosphere Integrity": "Biodiversity Intactness Index [%]",
+    "Phosphorus Cycle": "P-flow from freshwater systems into the ocean [Tg P/year]",
+    "Atmospheric Aerosol Loading": "Aerosol optical depth (AOD) [-]",
+    "Freshwater Use": "Consumptive bluewater use [km³/year]",
+    "Stratospheric Ozone Depletion": "Stratospheric ozone concentration [DU]",
+    "Land-system Change": "Land available for anthropogenic occupation [millon km²]",
+    "Nitrogen Cycle": "Industrial and intentional biological fixation of N [Tg N/year]",
+}
+
+# Names of the units of the characterization factor workbook in ecoinvent biosphere databases
+UNIT_NAMES = {
+    "kg": "kilogram",
+    "kBq": "kilo Becquerel",
+    "m2": "square meter",
+    "m2*year": "square meter-year",
+    "m3": "cubic meter",
+    "m3*year": "cubic meter-year",
+    "MJ": "megajoule",
+    "Sm3": "standard cubic meter",
+}
+
+# Characterization factor of the N-supply flow (converts kg to Tg)
+N_SUPPLY_CF = 0.000000001
+
+# Metadata key of the content hash of a planetary boundary method
+HASH_KEY = "pbaesa_hash"
+
+# Database metadata key of the state in which the N-supply flows were added
+N_SUPPLY_KEY = "pbaesa_n_supply"
+
+
+def get_characterization_factors_file_path():
+    """
+    Get the path of the characterization factor workbook in the current directory or,
+    if it is not there, in the package data directory.
+
+    Returns:
+        file_path (str): Path of the workbook.
+    """
+    package_dir = os.path.join(os.path.dirname(__file__), "data")
+    for directory in [os.getcwd(), package_dir]:
+        for file_name in CHARACTERIZATION_FACTORS_FILE_NAMES:
+            file_path = os.path.join(directory, file_name)
+            if os.path.exists(file_path):
+                return file_path
+
+    raise FileNotFoundError(
+        f"Characterization factors file not found. Please ensure "
+        f"'{CHARACTERIZATION_FACTORS_FILE_NAMES[0]}' is in the current directory or "
+        f"contact the package maintainers for the data file."
+    )
+
+
+def load_characterization_factors(file_path=None):
+    """
+    Load the characterization factors of the planetary boundary categories.
+
+    Args:
+        file_path (str): Path of the workbook. If None, the workbook in the current directory
+                         or the package data directory is used.
+
+    Returns:
+        df_pb: A dataframe with the biosphere flow codes in the 'Code' column and one column
+               of characterization factors per planetary boundary category.
+    """
+    if file_path is None:
+        file_path = get_characterization_factors_file_path()
+
+    df_pb = pd.read_excel(file_path, sheet_name='Characterization Factors')
+    df_pb = df_pb.iloc[1:].reset_index(drop=True) # First row holds the units
+    df_pb[CATEGORIES] = df_pb[CATEGORIES].astype(float)
+
+    return df_pb
+
+
+def hash_method_data(biosphere_name, codes, cfs, unit):
+    """
+    Hash the content of an LCIA method, independent of the node ids of a project.
+
+    Args:
+        biosphere_name (str): Name of the biosphere database.
+        codes (list): Codes of the characterized biosphere flows.
+        cfs (list): Characterization factors.
+        unit (str): Unit of the method.
+
+    Returns:
+        hash (str): Hex digest of the method content.
+    """
+    content = [biosphere_name, unit, [[code, float(cf)] for code, cf in zip(codes, cfs)]]
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def _get_flow_ids(biosphere_name):
+    """Get the node ids of all flows of a biosphere database by code with a single query."""
+    query = (
+        ActivityDataset
+        .select(ActivityDataset.code, ActivityDataset.id)
+        .where(ActivityDataset.database == biosphere_name)
+        .tuples()
+    )
+    return dict(query)
+
+
+def _get_flow_key(name, categories, unit):
+    """Get the key of a biosphere flow by name, categories and unit, ignoring case and unspecified sub-compartments."""
+    categories = tuple(str(c).strip().lower() for c in categories if isinstance(c, str) and c.strip())
+    if categories and categories[-1] == "unspecified":
+        categories = categories[:-1]
+    unit = UNIT_NAMES.get(unit, unit)
+    return (str(name).strip().lower(), categories, str(unit).strip().lower())
+
+
+def build_biosphere_index(biosphere_name):
+    """
+    Build a hashed index of the flows of a biosphere database with a single query.
+
+    Args:
+        biosphere_name (str): Name of the biosphere database.
+
+    Returns:
+        codes (set): Codes of all flows.
+        flow_keys (dict): Code of each flow by its (name, categories, unit) key.
+    """
+    query = (
+        ActivityDataset
+        .select(ActivityDataset.code, ActivityDataset.data)
+        .where(ActivityDataset.database == biosphere_name)
+        .tuples()
+    )
+    codes, flow_keys = set(), {}
+    for code, data in query:
+        codes.add(code)
+        flow_key = _get_flow_key(data.get("name"), data.get("categories") or (), data.get("unit"))
+        flow_keys.setdefault(flow_key, code)
+
+    return codes, flow_keys
+
+
+def match_characterization_factors(df_pb, biosphere_name):
+    """
+    Match the characterization factor table to the flows of a biosphere database.
+
+    Flows are matched by code and, if the code does not exist in the biosphere database,
+    e.g. in other ecoinvent versions, by name, categories and unit. All flows are matched
+    in one pass over the table.
+
+    Args:
+        df_pb: Characterization factor table as returned by load_characterization_factors.
+        biosphere_name (str): Name of the biosphere database.
+
+    Returns:
+        df_matched: The matched rows of the table with the codes of the biosphere database in the
+                    'Code' column and how they were matched ('code' or 'name') in the 'Match' column.
+        coverage: A dataframe with one row per category and the number of flows with a non-zero
+                  characterization factor ('factors') that were matched by code or by name or
+                  remained unmatched.
+    """
+    codes, flow_keys = build_biosphere_index(biosphere_name)
+
+    matched_codes = df_pb['Code'].where(df_pb['Code'].isin(codes))
+    match = pd.Series(np.where(matched_codes.notna(), "code", "unmatched"), index=df_pb.index)
+
+    # Fall back to name, categories and unit for all rows without a matching code
+    fallback = matched_codes.isna()
+    if fallback.any():
+        rows = df_pb.loc[fallback]
+        by_name = [
+            flow_keys.get(_get_flow_key(name, (compartment, sub_compartment), unit))
+            for name, compartment, sub_compartment, unit in zip(
+                rows['Name'], rows['Compartment'], rows['Sub-Compartment'], rows['Unit']
+            )
+        ]
+        matched_codes.loc[fallback] = by_name
+        match.loc[fallback] = np.where(pd.notna(by_name), "name", "unmatched")
+
+    df_matched = df_pb.assign(Code=matched_codes, Match=match)
+
+    # Count the matches of all flows that are characterized in each category
+    characterized = df_pb[CATEGORIES].fillna(0).ne(0)
+    coverage = pd.DataFrame({
+        outcome: characterized[match == outcome].sum() for outcome in ["code", "name", "unmatched"]
+    })
+    coverage.insert(0, "factors", characterized.sum())
+
+    # A flow that is matched twice keeps its first, preferably code-based, match
+    df_matched = df_matched[df_matched['Match'] != "unmatched"]
+    df_matched = df_matched.sort_values('Match', kind="stable").drop_duplicates('Code').sort_index()
+
+    return df_matched.reset_index(drop=True), coverage
+
+
+def _is_stored(method_key, flow_ids, codes, cfs):
+    """Check if a registered method holds exactly the given characterization factors."""
+    stored = dict(bd.Method(method_key).load())
+    if len(stored) != len(codes):
+        return False
+    ids = [flow_ids.get(code) for code in codes]
+    if any(flow_id not in stored for flow_id in ids):
+        return False
+    stored_cfs = [stored[flow_id]['amount'] if isinstance(stored[flow_id], dict) else stored[flow_id] for flow_id in ids]
+    return np.array_equal(np.asarray(stored_cfs, dtype=float), np.asarray(cfs, dtype=float), equal_nan=True)
+
+
+def upsert_method(method_key, biosphere_name, codes, cfs, unit, flow_ids=None):
+    """
+    Create an LCIA method, or rewrite it only if its characterization factors or unit changed.
+
+    A content hash is stored in the method metadata, so that an unchanged method is recognised
+    without loading it. Methods without a hash, e.g. written by an earlier version, are compared
+    with the new characterization factors and only rewritten if they differ.
+
+    Args:
+        method_key (tuple): Key of the LCIA method.
+        biosphere_name (str): Name of the biosphere database.
+        codes (list): Codes of the characterized biosphere flows.
+        cfs (list): Characterization factors.
+        unit (str): Unit of the method.
+        flow_ids (dict): Node ids of the biosphere flows by code. Queried if None.
+
+    Returns:
+        status (str): 'created', 'updated' or 'unchanged'.
+    """
+    content_hash = hash_method_data(biosphere_name, codes, cfs, unit)
+
+    if method_key in bd.methods:
+        metadata = bd.methods[method_key]
+        if metadata.get(HASH_KEY) == content_hash:
+            return "unchanged"
+
+        if flow_ids is None:
+            flow_ids = _get_flow_ids(biosphere_name)
+        if metadata.get("unit") == unit and _is_stored(method_key, flow_ids, codes, cfs):
+            metadata[HASH_KEY] = content_hash
+            bd.methods.flush()
+            return "unchanged"
+        status = "updated"
+    else:
+        status = "created"
+
+    my_method = bd.Method(method_key) # Initialize Brightway25 Method object
+    myLCIAdata = [[(biosphere_name, code), cf] for code, cf in zip(codes, cfs)]
+
+    # Register and write the method to Brightway25
+    my_method.validate(myLCIAdata)
+    if status == "created":
+        my_method.register()
+    my_method.write(myLCIAdata)
+    bd.methods[method_key]["unit"] = unit # Assign correct unit
+    bd.methods[method_key][HASH_KEY] = content_hash
+    bd.methods.flush() # Save changes to methods database
+
+    return status
+
+
+def get_method_hashes(biosphere_name, df_pb):
+    """
+    Get the content hashes of all planetary boundary methods, including the nitrogen cycle.
+
+    Args:
+        biosphere_name (str): Name of the biosphere database.
+        df_pb: Characterization factor table matched to the biosphere database, as returned
+               by match_characterization_factors.
+
+    Returns:
+        hashes (dict): Content hash by method key.
+    """
+    codes = df_pb['Code'].tolist()
+    hashes = {
+        ('Planetary Boundaries', cat): hash_method_data(biosphere_name, codes, df_pb[cat].tolist(), UNITS[cat])
+        for cat in CATEGORIES
+    }
+    hashes[('Planetary Boundaries', 'Nitrogen Cycle')] = hash_method_data(
+        biosphere_name, ['N_supply'], [N_SUPPLY_CF], UNITS["Nitrogen Cycle"]
+    )
+    return hashes
+
+
+def methods_match(hashes):
+    """
+    Check if all methods are registered with the given content hashes, without loading them.
+
+    Args:
+        hashes (dict): Content hash by method key, as returned by get_method_hashes.
+
+    Returns:
+        bool: True if no method has to be written.
+    """
+    return all(
+        method_key in bd.methods and bd.methods[method_key].get(HASH_KEY) == content_hash
+        for method_key, content_hash in hashes.items()
+    )
+
+
+def update_normal_methods(biosphere_db=None, df_pb=None):
+    """
+    Create or update the LCIA methods of the planetary boundary categories from the
+    characterization factor table, rewriting only the methods that changed.
+
+    The table is matched to the flows of the biosphere database first, so that methods can
+    also be created for other ecoinvent versions.
+
+    Args:
+        biosphere_db (database): Biosphere database from ecoinvent.
+        df_pb: Characterization factor table as returned by load_characterization_factors.
+               Loaded from the workbook if None.
+
+    Returns:
+        statuses (dict): 'created', 'updated' or 'unchanged' by method key.
+        coverage: Matched and unmatched characterized flows per category, as returned by
+                  match_characterization_factors.
+    """
+    if df_pb is None:
+        df_pb = load_characterization_factors()
+    df_matched, coverage = match_characterization_factors(df_pb, biosphere_db.name)
+
+    return _write_normal_methods(biosphere_db.name, df_matched), coverage
+
+
+def _write_normal_methods(biosphere_name, df_matched):
+    """Upsert the methods of all planetary boundary categories from a matched characterization factor table."""
+    codes = df_matched['Code'].tolist()
+    flow_ids = None
+    statuses = {}
+    for cat in CATEGORIES:
+        method_key = ('Planetary Boundaries', cat) # Define method key as (framework, category)
+        if flow_ids is None and method_key in bd.methods and HASH_KEY not in bd.methods[method_key]:
+            flow_ids = _get_flow_ids(biosphere_name) # Only needed to compare methods without hash
+        statuses[method_key] = upsert_method(
+            method_key, biosphere_name, codes, df_matched[cat].tolist(), UNITS[cat], flow_ids
+        )
+
+    return statuses
 
 
 def create_normal_methods(biosphere_db=None):
@@ -18,87 +386,28 @@ def create_normal_methods(biosphere_db=None):
     standard and prospective ecoinvent v3.10.1. Other ecoinvent versions are, however, 
     supported partially.
 
+    Existing methods are only rewritten if their characterization factors changed.
+
     Args:
         biosphere_db (database): Biosphere database from ecoinvent.
         
     Returns:
         None: LCIA methods are implemented.
     """
+    statuses, coverage = update_normal_methods(biosphere_db)
 
-    # Load characterization factors for planetary boundary categories from Excel file
-    file_path_characterization_factors = "Characterization Factors_for_eco3101.xlsx"
-    
-    # Check if file exists in current directory or package data directory
-    if not os.path.exists(file_path_characterization_factors):
-        # Try to find it in the package directory
-        package_dir = os.path.dirname(__file__)
-        alt_path = os.path.join(package_dir, "data", file_path_characterization_factors)
-        if os.path.exists(alt_path):
-            file_path_characterization_factors = alt_path
-        else:
-            raise FileNotFoundError(
-                f"Characterization factors file not found. Please ensure "
-                f"'{file_path_characterization_factors}' is in the current directory or "
-                f"contact the package maintainers for the data file."
-            )
-    
-    df_pb = pd.read_excel(file_path_characterization_factors, sheet_name='Characterization Factors')
-    df_pb = df_pb.iloc[1:].reset_index(drop=True)
-
-    # Collect existing planetary boundary methods
-    m = [met for met in bd.methods if "Planetary Boundaries" in str(met)]
-
-    # Define list of planetary boundary category names
-    categories = [
-        "Climate Change",
-        "Ocean Acidification",
-        "Change in Biosphere Integrity",
-        "Phosphorus Cycle",
-        "Atmospheric Aerosol Loading",
-        "Freshwater Use",
-        "Stratospheric Ozone Depletion",
-        "Land-system Change"
-    ]
-
-    # Define corresponding units for each planetary boundary category
-    units = {
-        "Climate Change": "Energy imbalance at top-of-atmosphere [W/m²]",
-        "Ocean Acidification": "Aragonite saturation state [Ωₐᵣₐ]",
-        "Change in Biosphere Integrity": "Biodiversity Intactness Index [%]",
-        "Phosphorus Cycle": "P-flow from freshwater systems into the ocean [Tg P/year]",
-        "Atmospheric Aerosol Loading": "Aerosol optical depth (AOD) [-]",
-        "Freshwater Use": "Consumptive bluewater use [km³/year]",
-        "Stratospheric Ozone Depletion": "Stratospheric ozone concentration [DU]",
-        "Land-system Change": "Land available for anthropogenic occupation [millon km²]"
-    }
-
-    # Iterate over each category to create and register LCIA methods
-    for cat in categories:
-        
-        method_key = ('Planetary Boundaries', cat)  # Define method key as (framework, category)
-
-        if method_key not in m:
-            my_method = bd.Method(method_key) # Initialize Brightway25 Method object
-
-            myLCIAdata = [] # Initialize list to store LCIA data
-
-            # Collect characterization factors for the current category
-            for index, row in df_pb.iterrows(): 
-                myLCIAdata.append([(biosphere_db.name, row['Code']), row[cat]])
-
-            # Register and write the method to Brightway25
-            my_method.validate(myLCIAdata)
-            my_method.register()
-            my_method.write(myLCIAdata)
-            bd.methods[method_key]["unit"] = units[cat] # Assign correct unit
-            bd.methods.flush() # Save changes to methods database
+    unmatched = coverage[coverage['unmatched'] > 0]
+    if not unmatched.empty:
+        print(f"Characterized flows not found in '{biosphere_db.name}':")
+        for cat, row in unmatched.iterrows():
+            print(f"- {cat}: {row['unmatched']} of {row['factors']}")
 
     # Display all LCIA methods for the Planetary Boundary Framework
     m = [met for met in bd.methods if "Planetary Boundaries" in str(met)]
 
     print("The following planetary boundary categories are now available as LCIA-methods:")
     for method in m:
-        print(f"- {method}")
+        print(f"- {method}" + (f" ({statuses[method]})" if method in statuses else ""))
 
     return None
 
@@ -168,50 +477,78 @@ def add_n_supply_flow_to_foreground_system(biosphere_db=None, process_ids=[]):
     return None         
 
 
-def add_n_supply_flow_to_databases(biosphere_db=None):
+def add_n_supply_flow_to_databases(biosphere_db=None, databases=None):
     """
     Adds elementary flow of N-supply to soil to all processes that supply nitrogen to 
     agricultural systems that are not custom processes.
 
+    The fertiliser supply processes of all databases, e.g. of many prospective scenarios, are
+    identified with one query. The missing exchanges of databases with the 'sqlite' backend
+    are inserted in bulk, with one transaction per database, which is then marked dirty for
+    reprocessing. Other backends, e.g. 'iotable', do not process rows inserted into the
+    exchange table, so their exchanges are saved one by one. Databases are not patched in
+    parallel, as all databases of a project share one SQLite file, which admits a single
+    writer. Projects can be patched in parallel with provision_projects.
+
     Args:
         biosphere_db (database): Biosphere database from ecoinvent.
+        databases (list): Names of the databases to patch. If None, all databases are patched.
         
     Returns:
         None: N-supply flow added to processes.
     """
     new_bf = create_n_supply_flow(biosphere_db)
-
-    for db_name in bd.databases:
-        db = bd.Database(db_name)
-        # Step 1: Identify ecoinvent processes (fertiliser supply systems)
-        n_search = [act for act in db if 'nutrient' in act['name']]
-
-        if not n_search:
+    if databases is None:
+        databases = list(bd.databases)
+
+    # Step 1: Identify ecoinvent processes (fertiliser supply systems) of all databases
+    options = ['inorganic nitrogen fertiliser, as N', 'organic nitrogen fertiliser, as N']
+    fertilisers = (
+        ActivityDataset
+        .select(ActivityDataset.database, ActivityDataset.code)
+        .where(
+            ActivityDataset.database.in_(databases)
+            & ActivityDataset.product.in_(options)
+            & (fn.INSTR(ActivityDataset.name, 'nutrient') > 0)
+        )
+        .tuples()
+    )
+
+    # Processes that already have the nitrogen flow
+    patched = set(
+        ExchangeDataset
+        .select(ExchangeDataset.output_database, ExchangeDataset.output_code)
+        .where(
+            (ExchangeDataset.input_database == new_bf['database'])
+            & (ExchangeDataset.input_code == new_bf['code'])
+            & (ExchangeDataset.type == 'biosphere')
+            & ExchangeDataset.output_database.in_(databases)
+        )
+        .tuples()
+    )
+
+    missing = defaultdict(list)
+    for key in fertilisers:
+        if key not in patched:
+            missing[key[0]].append(key)
+
+    # Step 2: Add dummy nitrogen flow to each of the identified processes, in bulk per database
+    for db_name, keys in missing.items():
+        if bd.databases[db_name].get('backend', 'sqlite') != 'sqlite':
+            for key in keys:
+                bd.get_activity(key).new_exchange(input=new_bf, amount=1, type='biosphere').save()
+            print(f'N-flow added to {len(keys)} processes in {db_name}.')
             continue
-        
-        all_supply = pd.DataFrame(n_search)
 
-        # Filter for relevant nitrogen fertiliser types
-        options = ['inorganic nitrogen fertiliser, as N', 'organic nitrogen fertiliser, as N']
-        N = all_supply[all_supply['reference product'].isin(options)]
-
-        # Step 2: Add dummy nitrogen flow to each of the identified processes
-        for index, n in N.iterrows():
-            act_ID = n['code']  # Use activity code as unique identifier
-            rev_N = [act for act in db if act_ID in act['code']][0] # Retrieve activity
-
-            # Check if the nitrogen flow is already included
-            exchangeN = [exc for exc in rev_N.exchanges() if 'biosphere' in exc['type'] and exc['input'] == (biosphere_db.name, 'N_supply')]
-
-
-            if len(exchangeN)<1:
-                # Add nitrogen flow exchange if not present
-                rev_N.new_exchange(input=new_bf,amount=1,type='biosphere').save()
-                rev_N.save()
-                exchangeN = [exc for exc in rev_N.exchanges() if 'biosphere' in exc['type'] and exc['input'] == (biosphere_db.name, 'N_supply')]  
-                print('N-flow added to {} - {}. Exchanges: {}'.format(rev_N['reference product'],rev_N['name'],len(exchangeN)))
-            else:
-                print('N-flow already added to {} - {}. Exchanges: {}'.format(rev_N['reference product'],rev_N['name'],len(exchangeN)))
+        exchanges = [
+            dict_as_exchangedataset({'input': new_bf.key, 'output': key, 'amount': 1, 'type': 'biosphere'})
+            for key in keys
+        ]
+        with sqlite3_lci_db.atomic():
+            for i in range(0, len(exchanges), 125): # Stay below the SQLite variable limit
+                ExchangeDataset.insert_many(exchanges[i:i + 125]).execute()
+        bd.databases.set_dirty(db_name)
+        print(f'N-flow added to {len(keys)} processes in {db_name}.')
 
     return None         
 
@@ -228,8 +565,51 @@ def add_n_supply_flow(biosphere_db=None, process_ids=[]):
     Returns:
         None: N-supply flow added to processes.
     """
+    if is_n_supply_patched(process_ids):
+        print("N-supply flows already added to all databases!")
+        return None
+
     add_n_supply_flow_to_foreground_system(biosphere_db, process_ids)
     add_n_supply_flow_to_databases(biosphere_db)
+    mark_n_supply_patched(process_ids)
+
+    return None
+
+
+def _get_n_supply_marker(db_name, process_ids):
+    """Get the state of a database, which changes whenever the database is modified."""
+    return {"modified": bd.databases[db_name].get("modified"), "process_ids": sorted(process_ids)}
+
+
+def is_n_supply_patched(process_ids=[]):
+    """
+    Check if the N-supply flows were added to all databases and none of them was modified since.
+
+    Args:
+        process_ids (list): List of codes that identify custom processes in their respective database.
+
+    Returns:
+        bool: True if no database has to be patched.
+    """
+    return all(
+        bd.databases[db_name].get(N_SUPPLY_KEY) == _get_n_supply_marker(db_name, process_ids)
+        for db_name in bd.databases
+    )
+
+
+def mark_n_supply_patched(process_ids=[]):
+    """
+    Record the current state of all databases after the N-supply flows were added.
+
+    Args:
+        process_ids (list): List of codes that identify custom processes in their respective database.
+
+    Returns:
+        None: State stored in the database metadata.
+    """
+    for db_name in bd.databases:
+        bd.databases[db_name][N_SUPPLY_KEY] = _get_n_supply_marker(db_name, process_ids)
+    bd.databases.flush()
 
     return None
 
@@ -249,26 +629,9 @@ def create_n_cycle_method(biosphere_db=None, process_ids=[]):
     # Add N-supply elementary flow to all processes that supply nitrogen to agricultural systems
     add_n_supply_flow(biosphere_db, process_ids)
 
-    # Collect existing planetary boundary methods
-    m = [met for met in bd.methods if "Planetary Boundaries" in str(met)]
-
-    # Define unit for LCIA method
-    units = {"Nitrogen Cycle": "Industrial and intentional biological fixation of N [Tg N/year]"}   
-    
-    # Define the method key for the nitrogen cycle
+    # Create the method, or rewrite it if its characterization factor changed
     method_key = ('Planetary Boundaries', 'Nitrogen Cycle')
-    if method_key not in m:
-        my_method = bd.Method(method_key)
-
-        # Link the dummy nitrogen flow to its characterization factor (value converts kg to Tg)
-        myLCIAdata = [[(biosphere_db.name, 'N_supply'), 0.000000001]]
-
-        # Register and write the LCIA method
-        my_method.validate(myLCIAdata)
-        my_method.register()
-        bd.methods[method_key]["unit"] = units["Nitrogen Cycle"]  # Assign correct unit
-        my_method.write(myLCIAdata)
-        bd.methods.flush() # Commit method to database
+    upsert_method(method_key, biosphere_db.name, ['N_supply'], [N_SUPPLY_CF], UNITS["Nitrogen Cycle"])
 
     # Display all LCIA methods for the Planetary Boundary Framework
     m = [met for met in bd.methods if "Planetary Boundaries" in str(met)]
@@ -280,6 +643,99 @@ def create_n_cycle_method(biosphere_db=None, process_ids=[]):
     return None
 
 
+def _provision_project(job):
+    """
+    Create or update the methods and N-supply flows of one project. Runs in a worker process.
+    """
+    project, biosphere_name, process_ids, df_pb = job
+
+    start = time.perf_counter()
+    unmatched = None
+    try:
+        bd.projects.set_current(project)
+
+        df_matched, coverage = match_characterization_factors(df_pb, biosphere_name)
+        unmatched = int(coverage['unmatched'].sum())
+
+        if methods_match(get_method_hashes(biosphere_name, df_matched)) and is_n_supply_patched(process_ids):
+            status = "skipped"
+        else:
+            biosphere_db = bd.Database(biosphere_name)
+            add_n_supply_flow(biosphere_db, process_ids)
+            statuses = _write_normal_methods(biosphere_name, df_matched)
+            statuses[('Planetary Boundaries', 'Nitrogen Cycle')] = upsert_method(
+                ('Planetary Boundaries', 'Nitrogen Cycle'), biosphere_name,
+                ['N_supply'], [N_SUPPLY_CF], UNITS["Nitrogen Cycle"],
+            )
+            status = "updated" if any(s != "unchanged" for s in statuses.values()) else "patched"
+        error = None
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+
+    return {
+        "project": project, "status": status, "unmatched": unmatched,
+        "seconds": time.perf_counter() - start, "error": error,
+    }
+
+
+def _set_base_directories(base_dir, base_logs_dir, project):
+    """
+    Use the Brightway base directories of the parent process in a worker process.
+    """
+    bd.projects.change_base_directories(Path(base_dir), Path(base_logs_dir), project_name=project, update=False)
+
+
+def provision_projects(projects, biosphere_name, process_ids=[], processes=1, file_path=None):
+    """
+    Creates or updates the planetary boundary LCIA methods and N-supply flows in many
+    Brightway projects.
+
+    The characterization factor table is read once. Each project is processed in its own
+    project context, optionally in a pool of worker processes. Projects whose methods and
+    N-supply flows are up to date are skipped without loading any method or scanning any
+    database.
+
+    Args:
+        projects (list): Names of the Brightway projects.
+        biosphere_name (str): Name of the biosphere database in all projects.
+        process_ids (list): List of codes that identify custom processes in their respective database.
+        processes (int): Number of worker processes. If 1, projects are processed in the current process.
+        file_path (str): Path of the characterization factor workbook. If None, the workbook in
+                         the current directory or the package data directory is used.
+
+    Returns:
+        report: A dataframe with one row per project and the columns 'status' ('skipped',
+                'patched', 'updated' or 'failed'), 'unmatched' (number of characterization factors
+                of flows missing in the biosphere database), 'seconds' and 'error'.
+    """
+    missing = [project for project in projects if project not in bd.projects]
+    if missing:
+        raise ValueError(f"Unknown Brightway projects: {missing}")
+
+    df_pb = load_characterization_factors(file_path)
+    jobs = [(project, biosphere_name, list(process_ids), df_pb) for project in projects]
+
+    current = bd.projects.current
+    if processes == 1 or len(jobs) <= 1:
+        results = [_provision_project(job) for job in jobs]
+        bd.projects.set_current(current)
+    else:
+        # Fresh interpreters, so that no database connection of this process is shared
+        context = multiprocessing.get_context("spawn")
+        # The project directories are subdirectories of the base directories
+        base_directories = (str(bd.projects.dir.parent), str(bd.projects.logs_dir.parent), current)
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=context, initializer=_set_base_directories, initargs=base_directories
+        ) as executor:
+            results = list(executor.map(_provision_project, jobs))
+
+    report = pd.DataFrame(results).set_index("project")
+    for project, row in report.iterrows():
+        print(f"- {project}: {row['status']} in {row['seconds']:.1f} s" + (f" ({row['error']})" if row['error'] else ""))
+
+    return report
+
+
 def create_pbaesa_methods(biosphere_db=None, process_ids=[]):
     """
     Creates and registers LCIA methods for all global planetary boundary categories 
@@ -0,0 +1,751 @@
+"""
+Iterative, power series and out-of-core solutions of the Leontief system for the vectors that
+enter the allocation factors.
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator, gmres
+
+from .allocation import (
+    ALLOCATION_FACTOR_COLUMNS,
+    calculate_allocation_factor_samples,
+    calculate_total_FCE_multiplier,
+    get_data_path,
+    p,
+    prefetch_exiobase_years,
+    prepare_allocation_arrays,
+)
+
+
+# Default memory budget of the chunked calculations in bytes
+DEFAULT_MEMORY_BUDGET = 2**30
+
+
+def solve_leontief(A, b, transpose=False, x0=None, rtol=1e-10, maxiter=1000):
+    """
+    Solve (I - A) x = b, or (I - A)^T x = b, i.e. calculate L b or L^T b without the Leontief
+    inverse L, with restarted GMRES.
+
+    Parameters:
+        A: array or sparse matrix - Technical coefficients (n x n)
+        b: array (n) - Right-hand side
+        transpose: boolean - Solve the transposed system
+        x0: array (n), optional - Starting point, e.g. the solution of the previous year
+        rtol: float - Tolerance of the relative residual
+        maxiter: int - Maximum number of restarts
+
+    Returns:
+        x: array (n)
+        info: dict with the number of 'iterations', the relative 'residual' and whether the
+              solver 'converged'
+    """
+    A_op = A.T if transpose else A
+    n = len(b)
+    operator = LinearOperator((n, n), matvec=lambda x: x - A_op @ x, dtype=float)
+
+    iterations = [0]
+
+    def count(_):
+        iterations[0] += 1
+
+    x, status = gmres(
+        operator, b, x0=x0, rtol=rtol, atol=0.0, restart=50, maxiter=maxiter,
+        callback=count, callback_type='pr_norm',
+    )
+    residual = np.linalg.norm(b - operator.matvec(x)) / np.linalg.norm(b)
+
+    return x, {'iterations': iterations[0], 'residual': residual, 'converged': status == 0}
+
+
+def get_series_weights(A, transpose=False, max_steps=100):
+    """
+    Find positive weights w and a contraction factor rho < 1 with which every term of the
+    series of L b (or L^T b) shrinks at least by rho in the weighted norm sum(w * |t|).
+
+    The weights are the first terms of the series of L^T e (or L e), for which the
+    contraction factor can be evaluated exactly.
+
+    Parameters:
+        A: array or sparse matrix - Technical coefficients (n x n)
+        transpose: boolean - Weights for the series of L^T b
+        max_steps: int - Maximum number of terms of the weights
+
+    Returns:
+        w: array (n)
+        rho: float
+    """
+    M = A if transpose else A.T
+    e = np.ones(A.shape[0])
+    w, term = e.copy(), e
+    for _ in range(max_steps):
+        term = M @ term
+        w += term
+        rho = np.max((M @ w) / w)
+        if rho < 1:
+            return w, rho
+
+    raise ValueError("The series of the Leontief inverse does not converge (spectral radius of A >= 1).")
+
+
+def calculate_leontief_series(A, b, transpose=False, tol=1e-4, max_order=1000, weights=None):
+    """
+    Approximate L b (or L^T b) by the truncated power series of A, with the order chosen
+    automatically so that an a-posteriori bound of the relative error is below the tolerance.
+
+    The remainder after the order K is bounded by rho / (1 - rho) ||A^K b||_w in the weighted
+    norm of get_series_weights.
+
+    Parameters:
+        A: array or sparse matrix - Technical coefficients (n x n)
+        b: array (n) - Right-hand side
+        transpose: boolean - Approximate L^T b
+        tol: float - Tolerance of the error bound relative to the weighted norm of the result
+        max_order: int - Maximum order of the series
+        weights: tuple, optional - Output of get_series_weights, to avoid recomputation
+
+    Returns:
+        x: array (n)
+        info: dict with the 'order', the relative error 'bound', the absolute error bound of
+              each entry ('entry_bounds') and whether the tolerance was met ('converged')
+    """
+    w, rho = weights if weights is not None else get_series_weights(A, transpose)
+    A_op = A.T if transpose else A
+
+    x = b.astype(float)
+    term = x
+    for order in range(1, max_order + 1):
+        term = A_op @ term
+        x = x + term
+
+        # All further terms together are at most rho / (1 - rho) times the last one
+        remainder = rho / (1 - rho) * (np.abs(term) @ w)
+        if remainder <= tol * (np.abs(x) @ w):
+            break
+
+    norm = np.abs(x) @ w
+    return x, {
+        'order': order,
+        'bound': remainder / norm,
+        'entry_bounds': remainder / w,
+        'converged': remainder <= tol * norm,
+    }
+
+
+def calculate_diagonal_series(A):
+    """
+    Calculate the series I + A + A^2 truncated after the second order on the diagonal only,
+    which costs no matrix product.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+
+    Returns:
+        diagonal: array (n)
+    """
+    return 1 + np.diagonal(A) + np.einsum('ij,ji->i', A, A)
+
+
+def calculate_block_diagonal(A, blocks):
+    """
+    Calculate the diagonal of the Leontief inverse of each diagonal block of A, e.g. of the
+    domestic supply chains of each geographical scope.
+
+    As A is non-negative, the result is a lower bound of the diagonal of L that only misses
+    the supply chains that leave the block and return to it.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        blocks: array (n) - Block of each sector, e.g. 'geo_index' of prepare_allocation_arrays
+
+    Returns:
+        diagonal: array (n)
+    """
+    blocks = np.asarray(blocks)
+    diagonal = np.empty(len(blocks))
+    for block in np.unique(blocks):
+        idx = np.flatnonzero(blocks == block)
+        diagonal[idx] = np.diagonal(np.linalg.inv(np.identity(len(idx)) - A[np.ix_(idx, idx)]))
+    return diagonal
+
+
+def estimate_diagonal_error(A, diagonal, remainder=None, samples=20, rtol=1e-10, seed=0):
+    """
+    Estimate the relative error of an approximate diagonal of the Leontief inverse from the
+    exact diagonal entries of a sample of sectors, each of which costs one solve of
+    (I - A) x = e_i.
+
+    Half of the sample are the sectors with the largest relative remainders, where an outdated
+    remainder has the largest effect, the other half is drawn at random.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        diagonal: array (n) - Approximate diagonal of L
+        remainder: array (n), optional - Remainder of the diagonal beyond its truncated series
+        samples: int - Number of sampled sectors
+        rtol: float - Tolerance of the relative residuals of the solves
+        seed: int - Seed of the random sample
+
+    Returns:
+        error: float - Maximum relative error of the sampled diagonal entries
+        sectors: array of the sampled sectors
+    """
+    n = len(diagonal)
+    samples = min(samples, n)
+    largest = np.argsort(-np.abs(remainder / diagonal))[:samples // 2] if remainder is not None else np.array([], dtype=int)
+    others = np.setdiff1d(np.arange(n), largest)
+    sectors = np.concatenate([largest, np.random.default_rng(seed).choice(others, samples - len(largest), replace=False)])
+
+    error = 0.0
+    for i in sectors:
+        unit = np.zeros(n)
+        unit[i] = 1
+        column, _ = solve_leontief(A, unit, rtol=rtol)
+        error = max(error, abs(diagonal[i] - column[i]) / abs(column[i]))
+
+    return float(error), np.sort(sectors)
+
+
+def calculate_leontief_vectors(
+    A, v, previous=None, rtol=1e-10, method=None, tol=1e-4, blocks=None, diagonal_tol=1e-4, refresh_every=5,
+    diagonal_samples=20,
+):
+    """
+    Calculate the products of the Leontief inverse L = (I - A)^-1 that enter the total FCE and
+    total GVA allocation factors.
+
+    Without previous results, L is calculated once. Otherwise, e.g. for the next EXIOBASE year,
+    the vector products are solved with GMRES starting from the previous solutions, and the
+    diagonal of L is obtained from its truncated series plus the remainder of the previous year,
+    which changes little between consecutive years. As the remainder is carried over from year
+    to year, the error of the diagonal is estimated on a sample of sectors (c.f.
+    estimate_diagonal_error). If the method is chosen automatically, L is calculated again to
+    refresh the remainder when this error exceeds diagonal_tol, or refresh_every years after
+    the last refresh.
+
+    With the 'series' method, the vector products are approximated by truncated power series
+    of A up to a tolerance, and the diagonal by the inverses of the diagonal blocks of A, or by
+    its second-order series if no blocks are given. No bound of the diagonal is available
+    without the inverse; both approximations are lower bounds.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        v: array (n) - Value added coefficients V / x
+        previous: dict, optional - Output of this function for a system with the same sectors
+        rtol: float - Tolerance of the relative residuals of the iterative solutions
+        method: str, optional - 'exact', 'iterative' or 'series'. If None, 'iterative' is used
+            if previous results are given and 'exact' otherwise.
+        tol: float - Tolerance of the relative error bounds of the 'series' method
+        blocks: array (n), optional - Block of each sector for the diagonal of the 'series'
+            method, e.g. 'geo_index' of prepare_allocation_arrays
+        diagonal_tol: float - Tolerance of the estimated relative error of the diagonal, above
+            which the remainder is refreshed
+        refresh_every: int, optional - Number of iterative years after which the remainder is
+            refreshed. If None, it is only refreshed when the error exceeds diagonal_tol.
+        diagonal_samples: int - Number of sectors on which the error of the diagonal is estimated
+
+    Returns:
+        vectors: dict with the entries
+            'col_sums': column sums of L, L^T e (n)
+            'L_inv_col_sums': L (1 / col_sums) (n)
+            'top_multiplier': numerator L^T v of the type I GVA multiplier (n)
+            'diagonal': diagonal of L (n)
+            'remainder': diagonal of L minus its truncated series (n)
+            'age': number of years since the remainder was calculated from L
+            'report': dict with the 'method', the solver info of each vector and, for the
+                      'iterative' method, the estimated relative error of the 'diagonal'. If L
+                      was calculated again to refresh the remainder, 'refreshed' gives the reason.
+    """
+    automatic = method is None
+    if automatic:
+        method = 'exact' if previous is None or len(previous['col_sums']) != len(v) else 'iterative'
+        if method == 'iterative' and refresh_every is not None and (previous.get('age') or 0) + 1 > refresh_every:
+            vectors = calculate_leontief_vectors(A, v, method='exact')
+            vectors['report']['refreshed'] = f"{refresh_every} years since the last refresh"
+            return vectors
+    if method not in ('exact', 'iterative', 'series'):
+        raise ValueError(f"Unknown method '{method}', use 'exact', 'iterative' or 'series'.")
+
+    series = calculate_diagonal_series(A)
+
+    if method == 'exact':
+        L = np.linalg.inv(np.identity(len(v)) - A)
+        col_sums = L.sum(axis=0)
+        vectors = {
+            'col_sums': col_sums,
+            'L_inv_col_sums': L @ (1 / col_sums),
+            'top_multiplier': L.T @ v,
+            'diagonal': np.diagonal(L).copy(),
+        }
+        vectors['remainder'] = vectors['diagonal'] - series
+        vectors['age'] = 0
+        vectors['report'] = {'method': 'exact'}
+        return vectors
+
+    report = {'method': method}
+    if method == 'series':
+        weights = get_series_weights(A, transpose=True)
+        col_sums, report['col_sums'] = calculate_leontief_series(A, np.ones(len(v)), transpose=True, tol=tol, weights=weights)
+        L_inv_col_sums, report['L_inv_col_sums'] = calculate_leontief_series(A, 1 / col_sums, tol=tol)
+        top_multiplier, report['top_multiplier'] = calculate_leontief_series(A, v, transpose=True, tol=tol, weights=weights)
+        if blocks is not None:
+            remainder = calculate_block_diagonal(A, blocks) - series
+        else:
+            remainder = np.zeros(len(v))
+    else:
+        col_sums, report['col_sums'] = solve_leontief(
+            A, np.ones(len(v)), transpose=True, x0=previous['col_sums'], rtol=rtol
+        )
+        L_inv_col_sums, report['L_inv_col_sums'] = solve_leontief(
+            A, 1 / col_sums, x0=previous['L_inv_col_sums'], rtol=rtol
+        )
+        top_multiplier, report['top_multiplier'] = solve_leontief(
+            A, v, transpose=True, x0=previous['top_multiplier'], rtol=rtol
+        )
+        remainder = previous['remainder']
+        error, sectors = estimate_diagonal_error(
+            A, series + remainder, remainder=remainder, samples=diagonal_samples, rtol=rtol
+        )
+        report['diagonal'] = {'error': error, 'sectors': len(sectors)}
+        if automatic and error > diagonal_tol:
+            vectors = calculate_leontief_vectors(A, v, method='exact')
+            vectors['report']['refreshed'] = f"estimated diagonal error {error:.1e}"
+            return vectors
+
+    return {
+        'col_sums': col_sums,
+        'L_inv_col_sums': L_inv_col_sums,
+        'top_multiplier': top_multiplier,
+        'diagonal': series + remainder,
+        'remainder': remainder,
+        'age': (previous.get('age') or 0) + 1 if method == 'iterative' else None,
+        'report': report,
+    }
+
+
+def verify_leontief_vectors(A, v, vectors):
+    """
+    Compare vectors of calculate_leontief_vectors with the ones of the exact Leontief inverse.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        v: array (n) - Value added coefficients V / x
+        vectors: dict - Output of calculate_leontief_vectors
+
+    Returns:
+        errors: dict with the maximum relative error of each vector and of the total FCE
+                multiplier 's'
+    """
+    exact = calculate_leontief_vectors(A, v)
+
+    errors = {}
+    for key in ['col_sums', 'L_inv_col_sums', 'top_multiplier', 'diagonal']:
+        scale = np.maximum(np.abs(exact[key]), np.finfo(float).tiny)
+        errors[key] = float(np.max(np.abs(vectors[key] - exact[key]) / scale))
+
+    s_exact = calculate_total_FCE_multiplier_from_vectors(exact)
+    errors['s'] = float(np.max(np.abs(calculate_total_FCE_multiplier_from_vectors(vectors) - s_exact) / s_exact))
+
+    return errors
+
+
+def calculate_total_FCE_multiplier_from_vectors(vectors):
+    """
+    Calculate the row sums of the marginal supply-chain matrix S_marginal (c.f. Equations 3-7)
+    from the vectors of calculate_leontief_vectors.
+
+    Parameters:
+        vectors: dict - Output of calculate_leontief_vectors
+
+    Returns:
+        s: array (n)
+    """
+    return 1 + vectors['col_sums'] / vectors['diagonal'] * vectors['L_inv_col_sums']
+
+
+def _get_value_added_coefficients(arrays):
+    """Get the value added coefficients V / x of all sectors, zero for sectors without output."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(arrays['V'] / arrays['x'], nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def calculate_allocation_factors_from_vectors(arrays, vectors):
+    """
+    Calculate all allocation factors from the vectors of calculate_leontief_vectors.
+
+    Parameters:
+        arrays: dict - Output of prepare_allocation_arrays
+        vectors: dict - Output of calculate_leontief_vectors
+
+    Returns:
+        aSoSOS_j_df: A dataframe including all allocation factors of each sector in each geographical scope.
+    """
+    samples = calculate_allocation_factor_samples(
+        arrays, arrays['Y_fce'][:, :, None], arrays['V'][:, None], arrays['sPOPr'][:, None],
+        s=calculate_total_FCE_multiplier_from_vectors(vectors),
+        top_multiplier=vectors['top_multiplier'][:, None],
+    )
+    return pd.DataFrame({col: samples[col][:, 0] for col in ALLOCATION_FACTOR_COLUMNS}, index=arrays['labels'])
+
+
+def calculate_allocation_factors_for_years(
+    years, rtol=1e-10, verify=False, depth=1, diagonal_tol=1e-4, refresh_every=5, exiobase_storage_path=None,
+):
+    """
+    Calculate all allocation factors for consecutive years without inverting the Leontief
+    matrix of every year.
+
+    The first year is solved exactly. Each following year is solved iteratively, starting
+    from the vectors of the previous year, unless the estimated error of the diagonal of L
+    exceeds diagonal_tol or refresh_every years have passed since the last exact solution
+    (c.f. calculate_leontief_vectors). The EXIOBASE data of the next years is parsed in the
+    background while a year is calculated.
+
+    Parameters:
+        years: list of int - Years in the order of calculation, preferably consecutive
+        rtol: float - Tolerance of the relative residuals of the iterative solutions
+        verify: boolean - Also compare each iterative year with the exact Leontief inverse
+        depth: int - Number of years that are parsed ahead
+        diagonal_tol: float - Tolerance of the estimated relative error of the diagonal of L
+        refresh_every: int, optional - Number of iterative years after which L is calculated again
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        results: dict with the years as keys and tuples of the allocation factor dataframe and
+                 the convergence report (including the 'errors' against the exact inverse if
+                 verify is True) as values
+    """
+    results = {}
+    previous = None
+    for year in prefetch_exiobase_years(years, depth=depth, exiobase_storage_path=exiobase_storage_path):
+        arrays = prepare_allocation_arrays(year, exiobase_storage_path=exiobase_storage_path, leontief=False)
+        v = _get_value_added_coefficients(arrays)
+
+        vectors = calculate_leontief_vectors(
+            arrays['A'], v, previous=previous, rtol=rtol, diagonal_tol=diagonal_tol, refresh_every=refresh_every
+        )
+        report = vectors['report']
+        if verify and report['method'] == 'iterative':
+            report['errors'] = verify_leontief_vectors(arrays['A'], v, vectors)
+
+        aSoSOS_j_df = calculate_allocation_factors_from_vectors(arrays, vectors)
+
+        if report['method'] == 'iterative':
+            iterations = [report[key]['iterations'] for key in ['col_sums', 'L_inv_col_sums', 'top_multiplier']]
+            converged = all(report[key]['converged'] for key in ['col_sums', 'L_inv_col_sums', 'top_multiplier'])
+            print(
+                f"{year}: solved iteratively in {sum(iterations)} GMRES iterations (converged: {converged}, "
+                f"estimated diagonal error: {report['diagonal']['error']:.1e} on {report['diagonal']['sectors']} sectors)"
+            )
+        elif 'refreshed' in report:
+            print(f"{year}: solved with the Leontief inverse (refreshed: {report['refreshed']})")
+        else:
+            print(f"{year}: solved with the Leontief inverse")
+
+        results[year] = (aSoSOS_j_df, report)
+        previous = vectors
+
+    return results
+
+
+def get_series_error_bounds(A, v, vectors, diagonal_samples=20):
+    """
+    Get the error bounds of the allocation factor multipliers from the 'series' vectors of
+    calculate_leontief_vectors.
+
+    The total GVA multiplier only depends on the series of L^T v, so its relative error has a
+    first-order bound. The total FCE multiplier also depends on the diagonal of L, which has no
+    bound without the inverse. Its error is only estimated on a sample of sectors (c.f.
+    estimate_diagonal_error), so no bound of the total FCE multiplier is given.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        v: array (n) - Value added coefficients V / x
+        vectors: dict - Output of calculate_leontief_vectors with the 'series' method
+        diagonal_samples: int - Number of sectors on which the error of the diagonal is estimated
+
+    Returns:
+        bounds: dict with the entries
+            'total_FCE_bound': None
+            'total_FCE_series_bound': first-order bound of the relative error of the total FCE
+                multiplier due to the series only, without the error of the diagonal
+            'total_GVA_bound': first-order bound of the relative error of the total GVA multiplier
+            'diagonal': estimated relative 'error' of the diagonal on a number of 'sectors'
+    """
+    report = vectors['report']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = {
+            key: np.nan_to_num(report[key]['entry_bounds'] / np.abs(vectors[key]), nan=0.0, posinf=np.inf)
+            for key in ['col_sums', 'L_inv_col_sums', 'top_multiplier']
+        }
+    error, sectors = estimate_diagonal_error(
+        A, vectors['diagonal'], remainder=vectors['remainder'], samples=diagonal_samples
+    )
+
+    return {
+        'total_FCE_bound': None,
+        'total_FCE_series_bound': float(np.max(relative['col_sums'] + relative['L_inv_col_sums'])),
+        'total_GVA_bound': float(np.max(relative['top_multiplier'][v > 0], initial=0.0)),
+        'diagonal': {'error': error, 'sectors': len(sectors)},
+    }
+
+
+def approximate_allocation_factors(year, tol=1e-4, refine_diagonal=True, exiobase_storage_path=None):
+    """
+    Approximate all allocation factors of a year with truncated power series instead of the
+    Leontief inverse, for fast exploration.
+
+    The order of each series is chosen automatically for the tolerance. The diagonal of L is
+    taken from the domestic supply chains of each geographical scope, which misses supply
+    chains that leave a geographical scope and return to it. Its error cannot be bounded
+    without the inverse and is estimated on a sample of sectors (c.f. get_series_error_bounds).
+    If the estimate exceeds the tolerance, the diagonal is calculated from the inverse, or,
+    without refine_diagonal, the total FCE allocation factors are left out.
+    benchmark_allocation_factors measures the actual errors.
+
+    Parameters:
+        year: int
+        tol: float - Tolerance of the relative error bounds of the series and of the estimated
+            relative error of the diagonal of L
+        refine_diagonal: boolean - Calculate the diagonal of L from the inverse if its
+            estimated error exceeds tol. If False, the total FCE allocation factors are left out
+            in this case.
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        aSoSOS_j_df: A dataframe including the allocation factors of each sector in each
+            geographical scope. The total FCE allocation factors are within tol only up to the
+            estimated error of the diagonal, and are missing if this estimate exceeds tol and
+            the diagonal is not refined.
+        report: dict with the order and error bound of each vector product and the bounds of
+            get_series_error_bounds. 'total_FCE_bound' is only given if the diagonal has been
+            refined, which is recorded in report['diagonal']['refined'].
+    """
+    arrays = prepare_allocation_arrays(year, exiobase_storage_path=exiobase_storage_path, leontief=False)
+    v = _get_value_added_coefficients(arrays)
+    vectors = calculate_leontief_vectors(arrays['A'], v, method='series', tol=tol, blocks=arrays['geo_index'])
+    report = vectors['report']
+    report.update(get_series_error_bounds(arrays['A'], v, vectors))
+    report['diagonal']['refined'] = False
+
+    diagonal_error = report['diagonal']['error']
+    if diagonal_error > tol and refine_diagonal:
+        vectors['diagonal'] = np.diagonal(np.linalg.inv(np.identity(len(v)) - arrays['A'])).copy()
+        report['diagonal']['refined'] = True
+        report['total_FCE_bound'] = report['total_FCE_series_bound']
+
+    aSoSOS_j_df = calculate_allocation_factors_from_vectors(arrays, vectors)
+    if diagonal_error > tol and not refine_diagonal:
+        print(
+            f"The estimated error of the diagonal of the Leontief inverse ({diagonal_error:.1e}) exceeds "
+            f"the tolerance of {tol:.1e}. The total FCE allocation factors are left out."
+        )
+        aSoSOS_j_df = aSoSOS_j_df.drop(columns=ALLOCATION_FACTOR_COLUMNS[0])
+
+    return aSoSOS_j_df, report
+
+
+def benchmark_allocation_factors(year, tol=1e-4, exiobase_storage_path=None):
+    """
+    Compare the power series approximation of the allocation factors with the exact
+    calculation via the Leontief inverse of pymrio's calc_L.
+
+    Parameters:
+        year: int
+        tol: float - Tolerance of the relative error bounds of the series
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        benchmark: dict with the 'exact_seconds' and 'series_seconds' of the Leontief part,
+                   the maximum relative 'errors' of each allocation factor and the 'report'
+                   of the approximation
+    """
+    arrays = prepare_allocation_arrays(year, exiobase_storage_path=exiobase_storage_path, leontief=False)
+    A, v = arrays['A'], _get_value_added_coefficients(arrays)
+
+    start = time.perf_counter()
+    L = p.calc_L(pd.DataFrame(A)).to_numpy()
+    s = calculate_total_FCE_multiplier(L)
+    top_multiplier = L.T @ v
+    exact_seconds = time.perf_counter() - start
+    del L
+
+    start = time.perf_counter()
+    vectors = calculate_leontief_vectors(A, v, method='series', tol=tol, blocks=arrays['geo_index'])
+    series_seconds = time.perf_counter() - start
+
+    # Vectors that reproduce the exact total FCE multiplier s
+    exact = calculate_allocation_factors_from_vectors(
+        arrays, {'col_sums': s - 1, 'diagonal': 1, 'L_inv_col_sums': 1, 'top_multiplier': top_multiplier}
+    )
+    approximation = calculate_allocation_factors_from_vectors(arrays, vectors)
+
+    errors = {}
+    for col in ALLOCATION_FACTOR_COLUMNS:
+        scale = np.abs(exact[col]).max()
+        errors[col] = float((approximation[col] - exact[col]).abs().max() / scale) if scale > 0 else 0.0
+
+    return {
+        'exact_seconds': exact_seconds,
+        'series_seconds': series_seconds,
+        'errors': errors,
+        'report': vectors['report'],
+    }
+
+
+def get_block_size(n, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Get the number of columns of an n x n float matrix that fit into the memory budget,
+    allowing for one temporary copy of each block.
+
+    Parameters:
+        n: int - Number of rows
+        memory_budget: int - Memory budget in bytes, at least one column and its copy (16 n)
+
+    Returns:
+        block_size: int
+    """
+    if memory_budget < 2 * 8 * n:
+        raise ValueError(
+            f"The memory budget of {memory_budget} bytes does not fit one column of {n} rows and its copy "
+            f"({2 * 8 * n} bytes)."
+        )
+    return int(min(n, memory_budget // (2 * 8 * n)))
+
+
+def write_leontief_memmap(
+    A, file_path, memory_budget=DEFAULT_MEMORY_BUDGET, block_size=None, overwrite_a=False
+):
+    """
+    Calculate the Leontief inverse in column blocks from one LU factorization of I - A and
+    write it to a memory-mapped .npy file in column-major order, so that column blocks can be
+    read contiguously.
+
+    Besides the memory budget, the LU factorization takes one n x n float matrix (8 n^2 bytes).
+    With overwrite_a, it is calculated in the memory of A and no further n x n matrix is held.
+
+    Parameters:
+        A: array - Technical coefficients (n x n)
+        file_path: str or Path - Path of the .npy file
+        memory_budget: int - Memory budget of the column blocks in bytes, at least 16 n
+        block_size: int, optional - Number of columns per block, overrides the memory budget
+        overwrite_a: boolean - If True, A is overwritten with the LU factorization of I - A
+
+    Returns:
+        file_path: str or Path
+    """
+    n = len(A)
+    block_size = block_size or get_block_size(n, memory_budget)
+
+    # Step 1: I - A, in place of A if allowed
+    I_minus_A = np.negative(A, out=A if overwrite_a else None)
+    I_minus_A.flat[::n + 1] += 1
+
+    # Step 2: Factorize the transpose, which is Fortran-ordered for a C-ordered A, so that
+    # LAPACK works in place, and solve the transposed system below
+    lu = lu_factor(I_minus_A.T, overwrite_a=True, check_finite=False)
+    del I_minus_A
+
+    L = np.lib.format.open_memmap(file_path, mode='w+', dtype=np.float64, shape=(n, n), fortran_order=True)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        unit_columns = np.zeros((n, stop - start), order='F')
+        unit_columns[np.arange(start, stop), np.arange(stop - start)] = 1
+        L[:, start:stop] = lu_solve(lu, unit_columns, trans=1, overwrite_b=True, check_finite=False)
+    L.flush()
+    del L
+
+    return file_path
+
+
+def calculate_total_FCE_multiplier_chunked(L, memory_budget=DEFAULT_MEMORY_BUDGET, block_size=None):
+    """
+    Calculate the row sums s of the marginal supply-chain matrix S_marginal (c.f. Equations 3-7)
+    from column blocks of the Leontief inverse, e.g. of a memory-mapped file.
+
+    Column sums and diagonal entries are taken from each block, and L (1 / column sums) is
+    accumulated column by column, so that the result is identical at any block size.
+
+    Parameters:
+        L: array or str or Path - Leontief inverse (n x n), or path of a .npy file of it
+        memory_budget: int - Memory budget of the column blocks in bytes
+        block_size: int, optional - Number of columns per block, overrides the memory budget
+
+    Returns:
+        s: array (n)
+    """
+    if not isinstance(L, np.ndarray):
+        L = np.load(L, mmap_mode='r')
+    n = L.shape[0]
+    block_size = block_size or get_block_size(n, memory_budget)
+
+    col_sums = np.empty(n)
+    diagonal = np.empty(n)
+    L_inv_col_sums = np.zeros(n)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        L_block = np.asfortranarray(L[:, start:stop])
+        col_sums[start:stop] = L_block.sum(axis=0)
+        diagonal[start:stop] = L_block[np.arange(start, stop), np.arange(stop - start)]
+        for j in range(stop - start):
+            L_inv_col_sums += L_block[:, j] / col_sums[start + j]
+        del L_block
+
+    return 1 + col_sums / diagonal * L_inv_col_sums
+
+
+def calculate_total_FCE_allocation_factor_chunked(
+    year, memory_budget=DEFAULT_MEMORY_BUDGET, block_size=None, file_path=None, exiobase_storage_path=None
+):
+    """
+    Calculate allocation factors based on total FCE for a specific year without holding the
+    Leontief inverse, or any other n x n matrix than the technical coefficients, which are
+    overwritten with the LU factorization of I - A, in memory.
+
+    The Leontief inverse is written to a memory-mapped file in column blocks and read back
+    block by block within the memory budget.
+
+    Parameters:
+        year: int
+        memory_budget: int - Memory budget of the column blocks in bytes
+        block_size: int, optional - Number of columns per block, overrides the memory budget
+        file_path: str or Path, optional - Path of the .npy file of the Leontief inverse, which
+            is kept. If None, a temporary file in the pbaesa data directory is used.
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        total_FCE_df: A dataframe including the allocation factors based on total FCE for a specified year.
+    """
+    arrays = prepare_allocation_arrays(year, exiobase_storage_path=exiobase_storage_path, leontief=False)
+
+    temporary = file_path is None
+    if temporary:
+        get_data_path().mkdir(parents=True, exist_ok=True)
+        handle, file_path = tempfile.mkstemp(suffix='.npy', dir=get_data_path())
+        os.close(handle)
+
+    try:
+        write_leontief_memmap(
+            arrays.pop('A'), file_path, memory_budget=memory_budget, block_size=block_size, overwrite_a=True
+        )
+        s = calculate_total_FCE_multiplier_chunked(file_path, memory_budget=memory_budget, block_size=block_size)
+    finally:
+        if temporary:
+            os.remove(file_path)
+
+    #### Calculation of Equations 1 and 8 ####
+    FR = arrays['Y_fce'] / arrays['Y_fce'].sum(axis=0, keepdims=True)
+    total_FCE = s * (FR @ arrays['sPOPr'])
+
+    return pd.DataFrame(
+        {"Allocation factor calculated via total final consumption expenditure": total_FCE}, index=arrays['labels']
+    )
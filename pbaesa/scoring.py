@@ -0,0 +1,350 @@
+"""
+Scoring of inventories with all planetary boundary LCIA methods in one sparse product, and
+contribution analysis of the scores.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import bw2data as bd
+import bw2calc as bc
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+
+# Characterization matrices that have been loaded in this process, by project and methods version
+_characterization_matrices = {}
+
+
+def get_pb_methods():
+    """
+    Get the registered planetary boundary LCIA methods.
+
+    Returns:
+        methods (list): LCIA method keys.
+    """
+    return [met for met in bd.methods if "Planetary Boundaries" in str(met)]
+
+
+def build_characterization_matrix(methods, biosphere_dict):
+    """
+    Build one sparse characterization matrix with a row for each LCIA method.
+
+    Parameters:
+        methods (list): LCIA method keys.
+        biosphere_dict (dict): Mapping of biosphere node ids to column indices, e.g. lca.dicts.biosphere.
+
+    Returns:
+        C: Sparse matrix (methods x biosphere flows) with the characterization factors.
+    """
+    rows, cols, values = [], [], []
+    for row, method_key in enumerate(methods):
+        for flow, cf in bd.Method(method_key).load():
+            col = biosphere_dict.get(bd.get_id(flow))
+            if col is None:
+                continue # Flow does not occur in the inventory
+            rows.append(row)
+            cols.append(col)
+            values.append(cf['amount'] if isinstance(cf, dict) else cf)
+
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(methods), len(biosphere_dict)))
+
+
+def _get_methods_version(methods):
+    """
+    Get a hash of the LCIA methods and their processed data, which changes whenever a method
+    is written again.
+    """
+    versions = []
+    for method_key in methods:
+        stat = os.stat(bd.Method(method_key).filepath_processed())
+        versions.append([list(method_key), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(versions).encode("utf-8")).hexdigest()
+
+
+def load_characterization_matrix(methods=None):
+    """
+    Load the characterization matrix of all LCIA methods over all characterized biosphere flows.
+
+    The matrix is built once per project and cached in the project directory, so that it is
+    only built again when a method is (re)written.
+
+    Parameters:
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+
+    Returns:
+        characterization: dict with the entries
+            'C': sparse matrix (methods x characterized biosphere flows)
+            'flow_ids': pandas Index of the biosphere node ids of the columns
+            'methods': list of LCIA method keys of the rows
+    """
+    if methods is None:
+        methods = get_pb_methods()
+    methods = [tuple(method_key) for method_key in methods]
+
+    version = _get_methods_version(methods)
+    key = (bd.projects.current, version)
+    if key in _characterization_matrices:
+        return _characterization_matrices[key]
+
+    file_path = Path(bd.projects.dir) / "pbaesa" / f"characterization_matrix_{version[:16]}.npz"
+    if file_path.exists():
+        with np.load(file_path, allow_pickle=False) as data:
+            flow_ids = pd.Index(data['flow_ids'])
+            C = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=(len(methods), len(flow_ids)))
+    else:
+        flow_ids = pd.Index(sorted({bd.get_id(flow) for method_key in methods for flow, _ in bd.Method(method_key).load()}))
+        C = build_characterization_matrix(methods, dict(zip(flow_ids, range(len(flow_ids)))))
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, "wb") as f:
+            np.savez(f, data=C.data, indices=C.indices, indptr=C.indptr, flow_ids=flow_ids.to_numpy(dtype=np.int64))
+
+    _characterization_matrices[key] = {'C': C, 'flow_ids': flow_ids, 'methods': methods}
+
+    return _characterization_matrices[key]
+
+
+def get_characterization_matrix(methods=None, biosphere_dict=None):
+    """
+    Get the cached characterization matrix of all LCIA methods with the columns arranged like
+    the biosphere matrix of an LCA.
+
+    Parameters:
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        biosphere_dict (dict): Mapping of biosphere node ids to column indices, e.g. lca.dicts.biosphere.
+
+    Returns:
+        C: Sparse matrix (methods x biosphere flows) with the characterization factors.
+    """
+    characterization = load_characterization_matrix(methods)
+
+    flow_ids = list(biosphere_dict.keys())
+    positions = characterization['flow_ids'].get_indexer(flow_ids)
+    characterized = positions >= 0
+    columns = np.array([biosphere_dict[flow_id] for flow_id in flow_ids], dtype=int)
+
+    # Selection matrix that moves each characterized flow to its column in the biosphere matrix
+    selection = sparse.csr_matrix(
+        (np.ones(characterized.sum()), (positions[characterized], columns[characterized])),
+        shape=(len(characterization['flow_ids']), len(biosphere_dict)),
+    )
+
+    return (characterization['C'] @ selection).tocsr()
+
+
+def load_multilca(demands, methods):
+    """
+    Load the technosphere and biosphere matrices of any number of functional units and
+    factorize the technosphere matrix once, without solving any demand.
+
+    Parameters:
+        demands (dict): Dictionary with functional unit names as keys and
+                        {activity id: amount} dictionaries as values.
+        methods (list): LCIA method keys.
+
+    Returns:
+        mlca: bw2calc MultiLCA with loaded matrices
+        technosphere_lu: SuperLU factorization of the technosphere matrix
+    """
+    config = {"impact_categories": methods}
+    data_objs = bd.get_multilca_data_objs(functional_units=demands, method_config=config)
+    mlca = bc.MultiLCA(demands=demands, method_config=config, data_objs=data_objs)
+    mlca.load_lci_data()
+
+    return mlca, splu(mlca.technosphere_matrix.tocsc())
+
+
+def solve_supply_arrays(mlca, technosphere_lu, demands):
+    """
+    Solve the supply arrays of some functional units with the factorized technosphere matrix.
+
+    Parameters:
+        mlca: bw2calc MultiLCA of load_multilca
+        technosphere_lu: SuperLU factorization of load_multilca
+        demands (dict): Dictionary with functional unit names as keys and
+                        {activity id: amount} dictionaries as values.
+
+    Returns:
+        supply: array (activities x functional units) in the order of the demands
+    """
+    mlca.build_demand_array(demands)
+
+    return technosphere_lu.solve(np.column_stack([mlca.demand_arrays[name] for name in demands]))
+
+
+def calculate_pb_scores(demands, methods=None, batch_size=100):
+    """
+    Calculate the scores of any number of functional units for all LCIA methods at once.
+
+    All demands are solved with one factorization of the technosphere matrix. The supply
+    arrays of batches of functional units are solved and characterized with a single
+    sparse-dense product with the product of the cached characterization matrix and the
+    biosphere matrix, so that only the scores of all functional units are kept.
+
+    Parameters:
+        demands (dict): Dictionary with functional unit names as keys and
+                        {activity id: amount} dictionaries as values.
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        batch_size (int): Number of functional units that are solved and characterized at once.
+
+    Returns:
+        scores_df: A dataframe with one row per functional unit and one column per LCIA method.
+    """
+    if methods is None:
+        methods = get_pb_methods()
+    methods = [tuple(method_key) for method_key in methods]
+
+    mlca, technosphere_lu = load_multilca(demands, methods)
+    names = list(demands)
+
+    #### Characterization of all functional units (functional units x methods) ####
+    CB = get_characterization_matrix(methods, mlca.dicts.biosphere) @ mlca.biosphere_matrix
+    scores = np.empty((len(names), len(methods)))
+    for start in range(0, len(names), batch_size):
+        batch = slice(start, min(start + batch_size, len(names)))
+        supply_batch = solve_supply_arrays(mlca, technosphere_lu, {name: demands[name] for name in names[batch]})
+        scores[batch] = (CB @ supply_batch).T
+
+    return pd.DataFrame(scores, index=names, columns=pd.Index(methods, tupleize_cols=False))
+
+
+def get_top_contributions(contributions, n):
+    """
+    Get the n largest contributions by absolute value of each column with a partial sort.
+
+    Parameters:
+        contributions: array (contributors x columns)
+        n (int): Number of contributors.
+
+    Returns:
+        indices: array (n x columns) - Rows of the contributors, largest first
+        values: array (n x columns) - Contributions, largest first
+    """
+    n = min(n, len(contributions))
+    magnitudes = np.abs(contributions)
+    if n < len(contributions):
+        indices = np.argpartition(-magnitudes, n - 1, axis=0)[:n]
+    else:
+        indices = np.broadcast_to(np.arange(n)[:, None], contributions.shape).copy()
+    order = np.argsort(-np.take_along_axis(magnitudes, indices, axis=0), axis=0, kind='stable')
+    indices = np.take_along_axis(indices, order, axis=0)
+
+    return indices, np.take_along_axis(contributions, indices, axis=0)
+
+
+def calculate_pb_contributions(demands, methods=None, n=10, batch_size=100):
+    """
+    Calculate the n processes and elementary flows with the largest contributions to the scores
+    of any number of functional units for all LCIA methods.
+
+    The technosphere matrix is factorized once. The supply arrays are solved and characterized
+    with the cached characterization matrix for batches of functional units at a time, and
+    only the scores and the top n of each functional unit and method are kept, so that memory
+    use apart from the results does not grow with the number of functional units.
+
+    Parameters:
+        demands (dict): Dictionary with functional unit names as keys and
+                        {activity id: amount} dictionaries as values.
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        n (int): Number of contributing processes and elementary flows.
+        batch_size (int): Number of functional units that are solved and analysed at once.
+
+    Returns:
+        contributions: dict with the entries
+            'functional_units': list of functional unit names (f)
+            'methods': list of LCIA method keys (m)
+            'scores': array (f x m) - Total scores
+            'process_ids': array (f x m x n) - Node ids of the contributing processes, largest contribution first
+            'process_contributions': array (f x m x n) - Scores of the contributing processes
+            'flow_ids': array (f x m x n) - Node ids of the contributing elementary flows
+            'flow_contributions': array (f x m x n) - Scores of the contributing elementary flows
+    """
+    if methods is None:
+        methods = get_pb_methods()
+    methods = [tuple(method_key) for method_key in methods]
+
+    mlca, technosphere_lu = load_multilca(demands, methods)
+    names = list(demands)
+
+    # Node ids of the columns of the technosphere and biosphere matrices
+    activity_ids = np.empty(len(mlca.dicts.activity), dtype=np.int64)
+    for node_id, col in mlca.dicts.activity.items():
+        activity_ids[col] = node_id
+    biosphere_ids = np.empty(len(mlca.dicts.biosphere), dtype=np.int64)
+    for node_id, row in mlca.dicts.biosphere.items():
+        biosphere_ids[row] = node_id
+
+    # Only characterized elementary flows can contribute
+    C = get_characterization_matrix(methods, mlca.dicts.biosphere).tocsc()
+    characterized = np.flatnonzero(np.diff(C.indptr))
+    C_flows = C[:, characterized].toarray()
+    B_flows = mlca.biosphere_matrix.tocsr()[characterized]
+    CB = (C @ mlca.biosphere_matrix).toarray()
+
+    f, m = len(names), len(methods)
+    n_processes, n_flows = min(n, len(activity_ids)), min(n, len(characterized))
+    contributions = {
+        'functional_units': names,
+        'methods': methods,
+        'scores': np.empty((f, m)),
+        'process_ids': np.empty((f, m, n_processes), dtype=np.int64),
+        'process_contributions': np.empty((f, m, n_processes)),
+        'flow_ids': np.empty((f, m, n_flows), dtype=np.int64),
+        'flow_contributions': np.empty((f, m, n_flows)),
+    }
+
+    for start in range(0, f, batch_size):
+        batch = slice(start, min(start + batch_size, f))
+        supply_batch = solve_supply_arrays(mlca, technosphere_lu, {name: demands[name] for name in names[batch]})
+        contributions['scores'][batch] = (CB @ supply_batch).T
+        inventory_batch = B_flows @ supply_batch
+
+        for row in range(m):
+            # Step 1: Process contributions (activities x functional units)
+            indices, values = get_top_contributions(CB[row][:, None] * supply_batch, n_processes)
+            contributions['process_ids'][batch, row] = activity_ids[indices].T
+            contributions['process_contributions'][batch, row] = values.T
+
+            # Step 2: Elementary flow contributions (characterized flows x functional units)
+            if n_flows:
+                indices, values = get_top_contributions(C_flows[row][:, None] * inventory_batch, n_flows)
+                contributions['flow_ids'][batch, row] = biosphere_ids[characterized[indices]].T
+                contributions['flow_contributions'][batch, row] = values.T
+
+    return contributions
+
+
+def get_contributions_df(contributions, kind="process"):
+    """
+    Convert the top contributions of calculate_pb_contributions to a long dataframe.
+
+    Parameters:
+        contributions (dict): Result of calculate_pb_contributions.
+        kind (str): "process" or "flow".
+
+    Returns:
+        contributions_df: A dataframe with the functional unit, method, rank, node id, contribution
+                          and share of the score for each contributor.
+    """
+    if kind not in ("process", "flow"):
+        raise ValueError('kind must be "process" or "flow".')
+    ids, values = contributions[f'{kind}_ids'], contributions[f'{kind}_contributions']
+    f, m, n = ids.shape
+
+    scores = np.repeat(contributions['scores'], n, axis=1).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.where(scores != 0, values.ravel() / scores, np.nan)
+
+    return pd.DataFrame({
+        'functional_unit': np.repeat(np.asarray(contributions['functional_units'], dtype=object), m * n),
+        'method': np.tile(pd.Index(contributions['methods'], tupleize_cols=False).to_numpy().repeat(n), f),
+        'rank': np.tile(np.arange(1, n + 1), f * m),
+        'id': ids.ravel(),
+        'contribution': values.ravel(),
+        'share': shares,
+    })
@@ -0,0 +1,317 @@
+"""
+Structural path analysis of planetary boundary impacts with a pruned traversal of the supply chains.
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+import pandas as pd
+import bw2data as bd
+import bw2calc as bc
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from .aesa import get_activity_id
+from .allocation import load_matrices
+from .scoring import get_characterization_matrix, get_pb_methods
+
+
+PATH_COLUMNS = ["category", "rank", "path", "depth", "amount", "direct", "upstream", "share"]
+
+
+def calculate_upstream_totals(A, intensities):
+    """
+    Calculate the impacts of the whole upstream supply chain of one unit of output of each
+    node for all categories at once with one factorization of (I - A)^T.
+
+    Parameters:
+        A: sparse matrix or array - Technical coefficients (n x n), column j holds the inputs
+           of one unit of output of node j
+        intensities: array - Direct impacts of one unit of output of each node (categories x n)
+
+    Returns:
+        upstream: array (n x categories)
+    """
+    n = A.shape[0]
+    I_A = (sparse.identity(n, format='csc') - sparse.csc_matrix(A)).T.tocsc()
+    return splu(I_A).solve(np.ascontiguousarray(np.atleast_2d(intensities).T, dtype=float))
+
+
+def traverse_paths(A, direct, upstream, demand, k=10, cutoff=1e-4, max_depth=10, max_queue=100000, max_calculations=1000000):
+    """
+    Find the k supply-chain paths with the largest direct impacts of one category by a
+    best-first traversal from the functional unit upstream.
+
+    Paths are expanded in the order of the impacts of their upstream supply chains, which are
+    taken from the memoized upstream totals. Paths whose upstream impacts are below the cutoff
+    share of the total impact are pruned. If the queue grows beyond twice max_queue, only the
+    max_queue paths with the largest upstream impacts are kept. If all coefficients and impacts
+    are non-negative, the traversal stops as soon as no remaining path can enter the top k.
+
+    Parameters:
+        A: sparse matrix - Technical coefficients (n x n) in CSC format
+        direct: array - Direct impacts of one unit of output of each node (n)
+        upstream: array - Upstream impacts of one unit of output of each node (n)
+        demand: array - Final demand (n)
+        k: int - Number of paths
+        cutoff: float - Share of the total impact below which paths are pruned
+        max_depth: int - Maximum number of upstream steps of a path
+        max_queue: int - Number of paths that are kept in the queue when it is trimmed
+        max_calculations: int - Maximum number of paths that are expanded
+
+    Returns:
+        paths: list of (direct impact, amount, upstream impact, path) tuples, largest direct impact first
+        report: dict with the total impact, the number of expanded, pruned and dropped paths and
+                whether the traversal was complete
+    """
+    total = float(demand @ upstream)
+    threshold = cutoff * abs(total)
+    nonnegative = (A.data >= 0).all() and (direct >= 0).all() and (demand >= 0).all()
+
+    counter = itertools.count()
+    queue = []
+    for root in np.flatnonzero(demand):
+        value = demand[root] * upstream[root]
+        if abs(value) >= threshold:
+            queue.append((-abs(value), next(counter), demand[root], (int(root),)))
+    heapq.heapify(queue)
+
+    top = []
+    report = {'total': total, 'expanded': 0, 'pruned': 0, 'dropped': 0, 'complete': True}
+    while queue:
+        if report['expanded'] >= max_calculations:
+            report['complete'] = False
+            break
+        priority, _, amount, path = heapq.heappop(queue)
+
+        # No path below this one can have a larger direct impact than the smallest of the top k
+        if nonnegative and len(top) == k and -priority <= top[0][0]:
+            break
+        report['expanded'] += 1
+
+        node = path[-1]
+        impact = amount * direct[node]
+        if impact != 0:
+            entry = (abs(impact), next(counter), (impact, amount, amount * upstream[node], path))
+            if len(top) < k:
+                heapq.heappush(top, entry)
+            elif entry[0] > top[0][0]:
+                heapq.heapreplace(top, entry)
+
+        if len(path) > max_depth:
+            continue
+        start, stop = A.indptr[node], A.indptr[node + 1]
+        for supplier, coefficient in zip(A.indices[start:stop], A.data[start:stop]):
+            supplier_amount = amount * coefficient
+            value = supplier_amount * upstream[supplier]
+            if abs(value) < threshold or value == 0:
+                report['pruned'] += 1
+                continue
+            heapq.heappush(queue, (-abs(value), next(counter), supplier_amount, path + (int(supplier),)))
+
+        # Bound the queue to the paths with the largest upstream impacts
+        if len(queue) > 2 * max_queue:
+            report['dropped'] += len(queue) - max_queue
+            report['complete'] = False
+            queue = heapq.nsmallest(max_queue, queue)
+            heapq.heapify(queue)
+
+    return [entry[2] for entry in sorted(top, reverse=True)], report
+
+
+def structural_path_analysis(
+    A, intensities, demand, categories=None, labels=None, k=10, cutoff=1e-4, max_depth=10, max_queue=100000,
+    max_calculations=1000000,
+):
+    """
+    Structural path analysis of any number of impact categories.
+
+    The upstream totals of all nodes are calculated once for all categories and reused by the
+    pruned traversals of each category.
+
+    Parameters:
+        A: sparse matrix or array - Technical coefficients (n x n), column j holds the inputs
+           of one unit of output of node j
+        intensities: array - Direct impacts of one unit of output of each node (categories x n)
+        demand: array - Final demand (n)
+        categories: list, optional - Names of the categories, defaults to their positions
+        labels: list, optional - Names of the nodes that are used in the paths, defaults to their positions
+        k: int - Number of paths per category
+        cutoff: float - Share of the total impact of a category below which paths are pruned
+        max_depth: int - Maximum number of upstream steps of a path
+        max_queue: int - Number of paths that are kept in the queue when it is trimmed
+        max_calculations: int - Maximum number of paths that are expanded per category
+
+    Returns:
+        paths_df: A dataframe with the top k paths per category. Paths start at the functional
+                  unit and list the upstream nodes. 'amount' is the output of the last node
+                  that is required along the path, 'direct' its direct impact, 'upstream' the
+                  impact of its whole supply chain and 'share' the share of the direct impact
+                  in the total impact of the category.
+        report_df: A dataframe with the total impact, the share covered by the returned paths and
+                   the traversal statistics per category.
+    """
+    A = sparse.csc_matrix(A)
+    A.sum_duplicates()
+    intensities = np.atleast_2d(np.asarray(intensities, dtype=float))
+    demand = np.asarray(demand, dtype=float)
+    if A.shape[0] != A.shape[1] or intensities.shape[1] != A.shape[0] or len(demand) != A.shape[0]:
+        raise ValueError("A must be square and match the columns of the intensities and the length of the demand.")
+    if categories is None:
+        categories = list(range(len(intensities)))
+    if labels is None:
+        labels = list(range(A.shape[0]))
+
+    # Step 1: Memoized upstream totals of all nodes and categories
+    upstream = calculate_upstream_totals(A, intensities)
+
+    # Step 2: Pruned traversal per category
+    rows, reports = [], []
+    for c, category in enumerate(categories):
+        paths, report = traverse_paths(
+            A, intensities[c], upstream[:, c], demand, k=k, cutoff=cutoff, max_depth=max_depth,
+            max_queue=max_queue, max_calculations=max_calculations,
+        )
+        total = report['total']
+        for rank, (impact, amount, upstream_impact, path) in enumerate(paths, start=1):
+            rows.append([
+                category, rank, tuple(labels[node] for node in path), len(path) - 1, amount, impact,
+                upstream_impact, impact / total if total else np.nan,
+            ])
+        report['covered'] = sum(path[0] for path in paths) / total if total else np.nan
+        reports.append(report)
+
+    paths_df = pd.DataFrame(rows, columns=PATH_COLUMNS)
+    report_df = pd.DataFrame(reports, index=pd.Index(categories, name="category", tupleize_cols=False))
+    report_df = report_df[['total', 'covered', 'expanded', 'pruned', 'dropped', 'complete']]
+
+    return paths_df, report_df
+
+
+def get_technosphere_coefficients(lca):
+    """
+    Get the technical coefficients, the direct impacts and the final demand per unit of output
+    of the activities of a Brightway LCA.
+
+    Parameters:
+        lca: bw2calc LCA after lci()
+
+    Returns:
+        A: sparse matrix (activities x activities) in CSC format
+        diagonal: array - Production amounts of the activities
+        demand: array - Final demand in the order of the activities
+    """
+    n = len(lca.dicts.activity)
+    if len(lca.dicts.product) != n or set(lca.dicts.product) != set(lca.dicts.activity):
+        raise ValueError("Structural path analysis needs one reference product per activity.")
+
+    # Products in the order of the activities
+    order = np.empty(n, dtype=int)
+    for node_id, row in lca.dicts.product.items():
+        order[lca.dicts.activity[node_id]] = row
+    T = lca.technosphere_matrix.tocsr()[order].tocsc()
+    diagonal = T.diagonal()
+
+    # A = I - T D^-1 with the production amounts D on the diagonal of T
+    A = (sparse.diags(diagonal) - T) @ sparse.diags(1 / diagonal)
+    A = sparse.csc_matrix(A)
+    A.eliminate_zeros()
+
+    return A, diagonal, lca.demand_array[order]
+
+
+def calculate_pb_paths(demand, methods=None, k=10, cutoff=1e-4, max_depth=10, max_queue=100000, max_calculations=1000000):
+    """
+    Find the supply-chain paths of the technosphere with the largest impacts of a functional
+    unit for each planetary boundary category.
+
+    Parameters:
+        demand (dict): Functional unit with Brightway activities, node ids or keys as keys and amounts as values.
+        methods (list): LCIA method keys. If None, all registered planetary boundary methods are used.
+        k (int): Number of paths per category.
+        cutoff (float): Share of the total impact of a category below which paths are pruned.
+        max_depth (int): Maximum number of upstream steps of a path.
+        max_queue (int): Number of paths that are kept in the queue when it is trimmed.
+        max_calculations (int): Maximum number of paths that are expanded per category.
+
+    Returns:
+        paths_df: A dataframe with the top k paths per planetary boundary category, with the node
+                  ids of the activities in 'path' and their names in 'names'.
+        report_df: A dataframe with the total impact, the share covered by the returned paths and
+                   the traversal statistics per category.
+    """
+    if methods is None:
+        methods = get_pb_methods()
+    methods = [tuple(method_key) for method_key in methods]
+
+    lca = bc.LCA({get_activity_id(act): amount for act, amount in demand.items()})
+    lca.lci()
+
+    A, diagonal, demand_array = get_technosphere_coefficients(lca)
+
+    #### Direct impacts per unit of output (methods x activities) ####
+    CB = get_characterization_matrix(methods, lca.dicts.biosphere) @ lca.biosphere_matrix
+    intensities = np.asarray(CB.todense()) / diagonal
+
+    node_ids = np.empty(len(diagonal), dtype=np.int64)
+    for node_id, col in lca.dicts.activity.items():
+        node_ids[col] = node_id
+
+    paths_df, report_df = structural_path_analysis(
+        A, intensities, demand_array, categories=[method_key[1] for method_key in methods],
+        labels=node_ids.tolist(), k=k, cutoff=cutoff, max_depth=max_depth, max_queue=max_queue,
+        max_calculations=max_calculations,
+    )
+
+    names = {node_id: bd.get_node(id=node_id)['name'] for node_id in set(itertools.chain(*paths_df['path']))}
+    paths_df.insert(3, 'names', [tuple(names[node_id] for node_id in path) for path in paths_df['path']])
+
+    return paths_df, report_df
+
+
+def calculate_exiobase_paths(
+    year, intensities, demand, k=10, cutoff=1e-4, max_depth=10, max_queue=100000, max_calculations=1000000,
+    exiobase_storage_path=None,
+):
+    """
+    Find the supply-chain paths of EXIOBASE with the largest impacts of a final demand.
+
+    Parameters:
+        year: int
+        intensities: DataFrame or Series - Direct impacts per unit of output of each sector, with
+                     'region_sector' labels or (region, sector) tuples as index and one column per category
+        demand: Series or dict - Final demand with 'region_sector' labels or (region, sector) tuples as keys
+        k: int - Number of paths per category
+        cutoff: float - Share of the total impact of a category below which paths are pruned
+        max_depth: int - Maximum number of upstream steps of a path
+        max_queue: int - Number of paths that are kept in the queue when it is trimmed
+        max_calculations: int - Maximum number of paths that are expanded per category
+        exiobase_storage_path: str or Path, optional
+            Custom path for storing exiobase data. If None, defaults to ~/.pbaesa_data/exiobase
+
+    Returns:
+        paths_df: A dataframe with the top k paths per category with the 'region_sector' labels of the sectors.
+        report_df: A dataframe with the total impact, the share covered by the returned paths and
+                   the traversal statistics per category.
+    """
+    A = load_matrices(year, return_L=False, return_Y=False, return_A=True, exiobase_storage_path=exiobase_storage_path)
+    labels = [f"{region}_{sector}" for region, sector in A.index]
+
+    def flat(index):
+        return [f"{label[0]}_{label[1]}" if isinstance(label, tuple) else label for label in index]
+
+    intensities = pd.DataFrame(intensities)
+    intensities.index = flat(intensities.index)
+    demand = pd.Series(demand, dtype=float)
+    demand.index = flat(demand.index)
+
+    unknown = (set(intensities.index) | set(demand.index)) - set(labels)
+    if unknown:
+        raise ValueError(f"Unknown EXIOBASE sectors: {sorted(unknown)[:5]}")
+
+    return structural_path_analysis(
+        A.to_numpy(), intensities.reindex(labels, fill_value=0).to_numpy().T, demand.reindex(labels, fill_value=0).to_numpy(),
+        categories=list(intensities.columns), labels=labels, k=k, cutoff=cutoff, max_depth=max_depth,
+        max_queue=max_queue, max_calculations=max_calculations,
+    )
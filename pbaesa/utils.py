@@ -2,7 +2,21 @@
 Utility functions to normalize and plot AESA results.
 """
 
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Define the Safe Operating Space thresholds for each category (based on PB framework)
+SAFE_OPERATING_SPACE = {
+    "Climate Change": float("1"),
+    "Ocean Acidification": float("0.688"),
+    "Change in Biosphere Integrity": float("10"),
+    "Phosphorus Cycle": float("10"),
+    "Nitrogen Cycle": float("62"),
+    "Atmospheric Aerosol Loading": float("0.11"),
+    "Freshwater Use": float("4000"),
+    "Stratospheric Ozone Depletion": float("14.5"),
+    "Land-system Change": float("85.1")
+}
 
 def calculate_exploitation_of_SOS(mlca_scores):
     """
@@ -15,23 +29,10 @@ def calculate_exploitation_of_SOS(mlca_scores):
     Returns:
         dict: A dictionary with method keys and their normalized SOS exploitation values.
     """
-    # Define the Safe Operating Space thresholds for each category (based on PB framework)
-    safe_operating_space = {
-        "Climate Change": float("1"),
-        "Ocean Acidification": float("0.688"),
-        "Change in Biosphere Integrity": float("10"),
-        "Phosphorus Cycle": float("10"),
-        "Nitrogen Cycle": float("62"),
-        "Atmospheric Aerosol Loading": float("0.11"),
-        "Freshwater Use": float("4000"),
-        "Stratospheric Ozone Depletion": float("14.5"),
-        "Land-system Change": float("85.1")
-    }
-
     exploitation_of_SOS = {}
     for key, value in mlca_scores.items():
         category = key[0][1]  # Extract planetary boundary category from method key
-        divisor = safe_operating_space.get(category)
+        divisor = SAFE_OPERATING_SPACE.get(category)
         if divisor:  # Only compute if the category has a defined threshold
             exploitation_of_SOS[key] = value / divisor
         else:
@@ -40,12 +41,13 @@ def calculate_exploitation_of_SOS(mlca_scores):
     return exploitation_of_SOS
 
 
-def plot_exploitation_of_SOS(exploitation_of_SOS):
+def draw_exploitation_of_SOS(ax, exploitation_of_SOS):
     """
-    Plots a bar chart of the exploitation of the Safe Operating Space for each
-    planetary boundary category.
+    Draws a bar chart of the exploitation of the Safe Operating Space for each
+    planetary boundary category on the given axes.
 
     Parameters:
+        ax (Axes): Matplotlib axes to draw on.
         exploitation_of_SOS (dict): Dictionary of SOS exploitation values.
     """
     # Extract labels (categories) and values (normalized impacts)
@@ -53,22 +55,23 @@ def plot_exploitation_of_SOS(exploitation_of_SOS):
     values = list(exploitation_of_SOS.values())
 
     # Create bar plot
-    plt.figure(figsize=(12, 6))
-    plt.bar(labels, values)
-    plt.xlabel('Earth-system process')
-    plt.ylabel('Exploitation of Safe Operating Space')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.show()
+    ax.bar(labels, values)
+    ax.set_xlabel('Earth-system process')
+    ax.set_ylabel('Exploitation of Safe Operating Space')
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
 
     return None
 
-def plot_AESA(exploitation_of_SOS, total_fce, total_gva):
+def draw_AESA(ax, exploitation_of_SOS, total_fce, total_gva):
     """
-    Plots a bar chart of the exploitation of the Safe Operating Space for each
-    planetary boundary category against the system-specific share of Safe Operating Space based on total GVA and FCE.
+    Draws a bar chart of the exploitation of the Safe Operating Space for each
+    planetary boundary category against the system-specific share of Safe Operating Space 
+    based on total GVA and FCE on the given axes.
 
     Parameters:
+        ax (Axes): Matplotlib axes to draw on.
         exploitation_of_SOS (dict): Dictionary of SOS exploitation values.
         total_FCE (float): system-specific share of Safe Operating Space based on total FCE.
         total_GVA (float): system-specific share of Safe Operating Space based on total GVA.
@@ -85,17 +88,17 @@ def plot_AESA(exploitation_of_SOS, total_fce, total_gva):
 
 
     # Create bar plot
-    plt.figure(figsize=(12, 6))
-    plt.bar(labels, values, color=bar_color)
-    plt.xlabel('Earth-system process')
-    plt.ylabel('Exploitation of Safe Operating Space')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.axhline(y=total_fce, color=fce_color, linestyle='--',)
-    plt.axhline(y=total_gva, color=gva_color, linestyle='--',)
+    ax.bar(labels, values, color=bar_color)
+    ax.set_xlabel('Earth-system process')
+    ax.set_ylabel('Exploitation of Safe Operating Space')
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.axhline(y=total_fce, color=fce_color, linestyle='--',)
+    ax.axhline(y=total_gva, color=gva_color, linestyle='--',)
 
     # Add italic labels at the top right
-    plt.text(
+    ax.text(
         x=len(labels) - 0.3,  # near the right edge
         y=total_fce * 1.02,       # slightly above the red line
         s='Final Consumption Expenditure',    # your text here (in italics)
@@ -105,7 +108,7 @@ def plot_AESA(exploitation_of_SOS, total_fce, total_gva):
         va='bottom',
         style='italic'
     )
-    plt.text(
+    ax.text(
         x=len(labels) - 0.3,
         y=total_gva * 1.02,
         s='Gross Value Added',
@@ -116,6 +119,125 @@ def plot_AESA(exploitation_of_SOS, total_fce, total_gva):
         style='italic'
     )
 
+    return None
+
+def plot_exploitation_of_SOS(exploitation_of_SOS):
+    """
+    Plots a bar chart of the exploitation of the Safe Operating Space for each
+    planetary boundary category.
+
+    Parameters:
+        exploitation_of_SOS (dict): Dictionary of SOS exploitation values.
+    """
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    draw_exploitation_of_SOS(plt.gca(), exploitation_of_SOS)
+    plt.tight_layout()
     plt.show()
 
-    return None
\ No newline at end of file
+    return None
+
+def plot_AESA(exploitation_of_SOS, total_fce, total_gva):
+    """
+    Plots a bar chart of the exploitation of the Safe Operating Space for each
+    planetary boundary category against the system-specific share of Safe Operating Space based on total GVA and FCE.
+
+    Parameters:
+        exploitation_of_SOS (dict): Dictionary of SOS exploitation values.
+        total_FCE (float): system-specific share of Safe Operating Space based on total FCE.
+        total_GVA (float): system-specific share of Safe Operating Space based on total GVA.
+    """
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    draw_AESA(plt.gca(), exploitation_of_SOS, total_fce, total_gva)
+    plt.tight_layout()
+    plt.show()
+
+    return None
+
+# Figure that is reused for all charts rendered in the current process
+_render_figure = None
+
+def _get_render_figure():
+    """
+    Returns the figure used for rendering charts in the current process. The figure is 
+    attached to the non-interactive Agg canvas, so that it is never shown and never 
+    registered with pyplot.
+    """
+    global _render_figure
+    if _render_figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        _render_figure = Figure(figsize=(12, 6))
+        FigureCanvasAgg(_render_figure)
+        _render_figure.add_subplot()
+        # Fixed margins instead of tight_layout avoid an additional draw per chart
+        _render_figure.subplots_adjust(left=0.08, right=0.98, top=0.95, bottom=0.3)
+    return _render_figure
+
+def _render_chart(job):
+    """
+    Renders a single chart to a file with the reused figure of the current process.
+
+    Parameters:
+        job (tuple): File path, SOS exploitation values, total FCE, total GVA and dpi.
+
+    Returns:
+        str: Path of the written file.
+    """
+    file_path, exploitation_of_SOS, total_fce, total_gva, dpi = job
+
+    fig = _get_render_figure()
+    ax = fig.axes[0]
+    ax.clear()
+
+    if total_fce is None or total_gva is None:
+        draw_exploitation_of_SOS(ax, exploitation_of_SOS)
+    else:
+        draw_AESA(ax, exploitation_of_SOS, total_fce, total_gva)
+
+    fig.savefig(file_path, dpi=dpi)
+
+    return file_path
+
+def render_AESA_charts(charts, output_dir, file_format="png", processes=1, dpi=100):
+    """
+    Renders AESA bar charts of many systems directly to files without displaying them.
+
+    Charts are drawn with the non-interactive Agg canvas on a single figure per process 
+    that is cleared and reused for every chart, so that no figures accumulate. Rendering 
+    can be distributed over a process pool.
+
+    Parameters:
+        charts (dict): Dictionary with file names (without extension) as keys and tuples of
+                       (exploitation_of_SOS, total_fce, total_gva) as values. If total_fce or
+                       total_gva is None, only the exploitation of the Safe Operating Space is drawn.
+        output_dir (str or Path): Directory the charts are written to.
+        file_format (str): File format of the charts, e.g. 'png', 'svg' or 'pdf'.
+        processes (int): Number of worker processes. If 1, charts are rendered in the current process,
+                         if None, one worker process is used per CPU.
+        dpi (int): Resolution of raster formats.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for name, (exploitation_of_SOS, total_fce, total_gva) in charts.items():
+        file_path = os.path.join(str(output_dir), f"{name}.{file_format}")
+        jobs.append((file_path, exploitation_of_SOS, total_fce, total_gva, dpi))
+
+    if processes == 1 or len(jobs) <= 1:
+        return [_render_chart(job) for job in jobs]
+
+    # Hand out jobs in chunks to keep the inter-process overhead small
+    workers = processes or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        file_paths = list(executor.map(_render_chart, jobs, chunksize=chunksize))
+
+    return file_paths
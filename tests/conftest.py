@@ -0,0 +1,101 @@
+"""Shared fixtures for the pbaesa test suite."""
+
+import zipfile
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pbaesa import allocation
+from pbaesa.exiobase_index import load_exiobase_index
+
+
+SYNTHETIC_SECTORS = ["Cultivation of wheat", "Mining of iron ores"]
+
+SYNTHETIC_CATEGORIES = [
+    "Final consumption expenditure by households",
+    "Final consumption expenditure by non-profit organisations serving households (NPISH)",
+    "Final consumption expenditure by government",
+    "Gross fixed capital formation",
+]
+
+
+def build_synthetic_exiobase(seed=42):
+    """
+    Build a small EXIOBASE-like system with all 49 EXIOBASE regions and two sectors.
+
+    The regions are kept in the (unsorted) EXIOBASE order, so that tests also cover the
+    sorting of the flat 'region_sector' labels.
+    """
+    rng = np.random.default_rng(seed)
+    geo = load_exiobase_index()['geo']
+    index = pd.MultiIndex.from_product([geo, SYNTHETIC_SECTORS], names=["region", "sector"])
+    n = len(index)
+
+    Z = pd.DataFrame(rng.uniform(0, 1, (n, n)) * (rng.uniform(0, 1, (n, n)) < 0.2), index=index, columns=index)
+    Y = pd.DataFrame(
+        rng.uniform(0, 10, (n, len(geo) * len(SYNTHETIC_CATEGORIES))),
+        index=index,
+        columns=pd.MultiIndex.from_product([geo, SYNTHETIC_CATEGORIES], names=["region", "category"]),
+    )
+    x = pd.DataFrame({"indout": Z.sum(axis=1) + Y.sum(axis=1)}, index=index)
+    A = Z / x["indout"].to_numpy()
+
+    F = pd.DataFrame(
+        rng.uniform(0, 1, (7, n)),
+        index=[
+            "Taxes less subsidies on products purchased: Total",
+            "Other net taxes on production",
+            "Compensation of employees; wages, salaries, & employers' social contributions: Low-skilled",
+            "Compensation of employees; wages, salaries, & employers' social contributions: Medium-skilled",
+            "Compensation of employees; wages, salaries, & employers' social contributions: High-skilled",
+            "Operating surplus: Consumption of fixed capital",
+            "Operating surplus: Remaining net operating surplus",
+        ],
+        columns=index,
+    )
+
+    return SimpleNamespace(A=A, Y=Y, Z=Z, x=x, factor_inputs=SimpleNamespace(F=F))
+
+
+def write_synthetic_archive(file_path, exio3):
+    """Write an archive that only contains the label file of the synthetic system."""
+    labels = exio3.x.index.to_frame(index=False)
+    labels["unit"] = "M.EUR"
+    with zipfile.ZipFile(file_path, "w") as archive:
+        archive.writestr("IOT_2022_ixi/unit.txt", labels.to_csv(sep="\t", index=False))
+
+
+def install_synthetic_exiobase(tmp_path, monkeypatch):
+    """
+    Replace the EXIOBASE archive of the year 2022 with a small synthetic system. Parsing
+    the archive returns the synthetic system, its label file can be read directly.
+
+    The archive is placed in the default storage folder of a temporary home directory and
+    its path is returned, so that it can also be passed as exiobase_storage_path.
+    """
+    exio3 = build_synthetic_exiobase()
+    storage_path = tmp_path / ".pbaesa_data" / "exiobase"
+    storage_path.mkdir(parents=True)
+    write_synthetic_archive(storage_path / "IOT_2022_ixi.zip", exio3)
+
+    monkeypatch.setattr(allocation.p, "parse_exiobase3", lambda path: exio3)
+    monkeypatch.setattr(allocation.Path, "home", lambda: tmp_path)
+
+    return storage_path
+
+
+@pytest.fixture
+def synthetic_exiobase(tmp_path, monkeypatch):
+    """Storage path of the synthetic EXIOBASE archive."""
+    return install_synthetic_exiobase(tmp_path, monkeypatch)
+
+
+@pytest.fixture(scope="session")
+def reference_allocation_factors(tmp_path_factory):
+    """Allocation factors of the synthetic system calculated step by step with the dataframe pipeline."""
+    tmp_path = tmp_path_factory.mktemp("reference")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        storage_path = install_synthetic_exiobase(tmp_path, monkeypatch)
+        return allocation.calculate_all_allocation_factors(2022, exiobase_storage_path=storage_path)
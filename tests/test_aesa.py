@@ -0,0 +1,164 @@
+"""Test the scoring, batch and Monte Carlo assessment on a small Brightway project."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+bd = pytest.importorskip("bw2data")
+import bw2calc as bc
+from bw2data.tests import bw2test
+
+from pbaesa import aesa, scoring
+
+
+def write_test_databases():
+    """Write a biosphere and a technosphere database with two processes and two PB methods."""
+    bio = bd.Database("biosphere")
+    bio.write({
+        ("biosphere", "co2"): {"name": "Carbon dioxide", "type": "emission", "categories": ("air",), "unit": "kilogram"},
+        ("biosphere", "water"): {"name": "Water", "type": "natural resource", "categories": ("water",), "unit": "cubic meter"},
+    })
+    bd.Database("technosphere").write({
+        ("technosphere", "wheat"): {
+            "name": "wheat grain production", "location": "DE", "unit": "kilogram",
+            "reference product": "wheat grain",
+            "exchanges": [
+                {"input": ("technosphere", "wheat"), "amount": 1, "type": "production"},
+                {"input": ("technosphere", "electricity"), "amount": 0.5, "type": "technosphere",
+                 "uncertainty type": 2, "loc": np.log(0.5), "scale": 0.2},
+                {"input": ("biosphere", "co2"), "amount": 2, "type": "biosphere"},
+                {"input": ("biosphere", "water"), "amount": 3, "type": "biosphere"},
+            ],
+        },
+        ("technosphere", "electricity"): {
+            "name": "electricity production", "location": "DE", "unit": "kilowatt hour",
+            "reference product": "electricity",
+            "exchanges": [
+                {"input": ("technosphere", "electricity"), "amount": 1, "type": "production"},
+                {"input": ("biosphere", "co2"), "amount": 1, "type": "biosphere"},
+            ],
+        },
+    })
+    for category, flow, cf in [("Climate Change", "co2", 1e-3), ("Freshwater Use", "water", 0.1)]:
+        method = bd.Method(("Planetary Boundaries", category))
+        method.register()
+        method.write([(("biosphere", flow), cf)])
+
+
+@bw2test
+def test_run_batch_aesa(monkeypatch):
+    """Test that all functional units are scored and joined with their allocation factors."""
+    write_test_databases()
+    monkeypatch.setattr(
+        aesa, "get_allocation_factors",
+        lambda df, exiobase_storage_path=None: pd.DataFrame(
+            {col: 0.01 for col in aesa.ALLOCATION_FACTOR_COLUMNS}, index=df.index
+        ),
+    )
+    aesa_df = aesa.run_batch_aesa([
+        {"activity": ("technosphere", "wheat"), "geographical_scope": "DE", "sector": "Cultivation of wheat", "year": 2022},
+        {"activity": ("technosphere", "electricity"), "geographical_scope": "DE", "sector": "Cultivation of wheat",
+         "year": 2022, "amount": 2, "name": "power"},
+    ])
+
+    assert len(aesa_df) == 4
+    scores = aesa_df.set_index(["name", "category"])["score"]
+    assert scores[("0", "Climate Change")] == pytest.approx(2.5e-3)
+    assert scores[("power", "Climate Change")] == pytest.approx(2e-3)
+    assert scores[("0", "Freshwater Use")] == pytest.approx(0.3)
+    assert (aesa_df[aesa.ALLOCATION_FACTOR_COLUMNS] == 0.01).all().all()
+
+
+@bw2test
+def test_run_monte_carlo_aesa():
+    """Test the streamed statistics of the Monte Carlo assessment."""
+    write_test_databases()
+
+    deterministic = aesa.run_monte_carlo_aesa(
+        {("technosphere", "wheat"): 1}, iterations=10, batch_size=3, use_distributions=False
+    )
+    assert deterministic.loc["Climate Change", "mean"] == pytest.approx(2.5e-3)
+    assert deterministic.loc["Climate Change", "std"] == pytest.approx(0, abs=1e-12)
+    assert deterministic.loc["Freshwater Use", "mean"] == pytest.approx(0.3 / 4000)
+
+    stochastic = aesa.run_monte_carlo_aesa(
+        {("technosphere", "wheat"): 1}, iterations=200, batch_size=64,
+        cf_uncertainty={"Climate Change": 0.2}, assigned_share=2.5e-3, seed=1,
+    )
+    assert stochastic["iterations"].eq(200).all()
+    assert stochastic.loc["Climate Change", "std"] > 0
+    assert stochastic.loc["Climate Change", "min"] < 2.5e-3 < stochastic.loc["Climate Change", "max"]
+    assert 0 < stochastic.loc["Climate Change", "probability_exceeding_assigned_share"] < 1
+
+
+@bw2test
+def test_calculate_pb_scores(monkeypatch):
+    """Test that all methods are scored at once and that the characterization matrix is cached per project."""
+    write_test_databases()
+    monkeypatch.setattr(scoring, "_characterization_matrices", {})
+    wheat, electricity = bd.get_id(("technosphere", "wheat")), bd.get_id(("technosphere", "electricity"))
+
+    scores_df = scoring.calculate_pb_scores({"wheat": {wheat: 1}, "power": {electricity: 2}})
+    for method_key in scoring.get_pb_methods():
+        lca = bc.LCA({wheat: 1}, method=method_key)
+        lca.lci()
+        lca.lcia()
+        assert scores_df.at["wheat", method_key] == pytest.approx(lca.score)
+    assert scores_df.at["power", ("Planetary Boundaries", "Climate Change")] == pytest.approx(2e-3)
+    batched_df = scoring.calculate_pb_scores({"wheat": {wheat: 1}, "power": {electricity: 2}}, batch_size=1)
+    pd.testing.assert_frame_equal(batched_df, scores_df)
+
+    # The cached matrix is reused from the project directory and rebuilt when a method changes
+    scoring._characterization_matrices.clear()
+    monkeypatch.setattr(scoring, "build_characterization_matrix", None)
+    characterization = scoring.load_characterization_matrix()
+    assert characterization['C'].shape == (2, 2)
+
+    monkeypatch.undo()
+    bd.Method(("Planetary Boundaries", "Climate Change")).write([(("biosphere", "co2"), 2e-3)])
+    scores_df = scoring.calculate_pb_scores({"wheat": {wheat: 1}})
+    assert scores_df.at["wheat", ("Planetary Boundaries", "Climate Change")] == pytest.approx(5e-3)
+
+
+@bw2test
+def test_calculate_pb_contributions(monkeypatch):
+    """Test the top process and elementary flow contributions of several functional units in batches."""
+    write_test_databases()
+    wheat, electricity = bd.get_id(("technosphere", "wheat")), bd.get_id(("technosphere", "electricity"))
+    co2, water = bd.get_id(("biosphere", "co2")), bd.get_id(("biosphere", "water"))
+
+    # The supply arrays are only solved batch by batch
+    solve_supply_arrays, batches = scoring.solve_supply_arrays, []
+
+    def solve_batch(mlca, technosphere_lu, demands):
+        batches.append(list(demands))
+        return solve_supply_arrays(mlca, technosphere_lu, demands)
+
+    monkeypatch.setattr(scoring, "solve_supply_arrays", solve_batch)
+
+    demands = {"wheat": {wheat: 1}, "power": {electricity: 2}}
+    contributions = scoring.calculate_pb_contributions(demands, n=5, batch_size=1)
+    assert batches == [["wheat"], ["power"]]
+    scores_df = scoring.calculate_pb_scores(demands, contributions['methods'])
+    assert contributions['scores'] == pytest.approx(scores_df.to_numpy())
+    climate = contributions['methods'].index(("Planetary Boundaries", "Climate Change"))
+    assert contributions['process_ids'].shape == (2, 2, 2)
+    assert list(contributions['process_ids'][0, climate]) == [wheat, electricity]
+    assert contributions['process_contributions'][0, climate] == pytest.approx([2e-3, 0.5e-3])
+    assert contributions['process_contributions'][1, climate] == pytest.approx([2e-3, 0])
+    assert list(contributions['flow_ids'][0, climate]) == [co2, water]
+    assert contributions['flow_contributions'][0, climate] == pytest.approx([2.5e-3, 0])
+    assert contributions['scores'][0, climate] == pytest.approx(2.5e-3)
+
+    contributions_df = scoring.get_contributions_df(contributions, kind="flow")
+    assert len(contributions_df) == 8
+    first = contributions_df.iloc[0]
+    assert (first['functional_unit'], first['method'], first['rank']) == ("wheat", contributions['methods'][0], 1)
+    assert first['id'] == contributions['flow_ids'][0, 0, 0]
+
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(50, 7))
+    indices, top = scoring.get_top_contributions(values, 4)
+    expected = np.argsort(-np.abs(values), axis=0)[:4]
+    assert np.array_equal(indices, expected)
+    assert np.array_equal(top, np.take_along_axis(values, expected, axis=0))
@@ -0,0 +1,303 @@
+"""Test allocation factor lookups on a small allocation factors file."""
+
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from pbaesa import allocation
+
+
+@pytest.fixture
+def allocation_factors_file(tmp_path, monkeypatch):
+    """Write a small allocation factors file to a temporary working directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(allocation.Path, "home", lambda: tmp_path)
+    index = ["AT_Cultivation of wheat", "DE_Cultivation of wheat", "DE_Mining of iron ores"]
+    df = pd.DataFrame(
+        {
+            col: [0.1 * (i + 1) + j for i in range(len(index))]
+            for j, col in enumerate(allocation.ALLOCATION_FACTOR_COLUMNS)
+        },
+        index=index,
+    )
+    df[allocation.GEO_SCOPE_COLUMN] = df.index.str.split('_').str[0]
+    df[allocation.SECTOR_COLUMN] = df.index.str.split('_').str[1]
+    df.to_excel("Allocation Factors_2022.xlsx")
+    return df
+
+
+def test_get_all_allocation_factor(allocation_factors_file):
+    """Test that a single combination is found in the allocation factors file."""
+    filtered_df = allocation.get_all_allocation_factor("DE", "Cultivation of wheat", 2022)
+    assert len(filtered_df) == 1
+    assert allocation.get_total_GVA_allocation_factor("DE", "Cultivation of wheat", 2022) == pytest.approx(2.2)
+
+
+def test_calculate_total_GVA_per_sector(monkeypatch):
+    """Test that the type I GVA multiplier divides value added by the output of each sector."""
+    labels = ["AT_Cultivation of wheat", "AT_Mining of iron ores", "DE_Cultivation of wheat"]
+    V = pd.Series([2.0, 3.0, 5.0], index=labels)
+    x = pd.DataFrame(
+        {"indout": [10.0, 20.0, 40.0]},
+        index=pd.MultiIndex.from_tuples([label.split("_") for label in labels], names=["region", "sector"]),
+    )
+    L = pd.DataFrame([[1.2, 0.1, 0.3], [0.2, 1.1, 0.0], [0.4, 0.2, 1.5]], index=labels, columns=labels)
+    monkeypatch.setattr(allocation, "calculate_GVA_per_sector", lambda year, **kwargs: V)
+    monkeypatch.setattr(allocation, "prepare_L_matrix", lambda year, **kwargs: L)
+    monkeypatch.setattr(allocation, "get_index", lambda year, **kwargs: pd.Index(labels))
+    monkeypatch.setattr(allocation, "load_satellites", lambda year, **kwargs: x)
+
+    total_GVA_j = allocation.calculate_total_GVA_per_sector(2022)
+
+    # total GVA_j = (L^T v)_j x_j with the value-added coefficients v = V / x
+    v = V / x["indout"].to_numpy()
+    expected = L.T.dot(v) * x["indout"].to_numpy()
+    assert total_GVA_j.iloc[:, 0].tolist() == pytest.approx(expected.tolist())
+
+
+def test_get_allocation_factors(allocation_factors_file):
+    """Test that many combinations are resolved at once and aligned with the request."""
+    requested = pd.DataFrame(
+        {
+            "geographical_scope": ["DE", "AT", "XX"],
+            "sector": ["Mining of iron ores", "Cultivation of wheat", "Cultivation of wheat"],
+            "year": [2022, 2022, 2022],
+        },
+        index=pd.Index(["a", "b", "c"], name="functional_unit"),
+    )
+    factors_df = allocation.get_allocation_factors(requested)
+
+    # The index of the request is not modified
+    assert requested.index.name == "functional_unit"
+    assert list(factors_df.index) == ["a", "b", "c"]
+
+    assert list(factors_df.columns) == allocation.ALLOCATION_FACTOR_COLUMNS
+    expected = allocation_factors_file[allocation.ALLOCATION_FACTOR_COLUMNS]
+    assert factors_df.iloc[0].tolist() == pytest.approx(expected.iloc[2].tolist())
+    assert factors_df.iloc[1].tolist() == pytest.approx(expected.iloc[0].tolist())
+    assert factors_df.iloc[2].isna().all()
+
+
+def test_allocation_factor_samples_match_pipeline(synthetic_exiobase, reference_allocation_factors):
+    """Test that the batched calculation without perturbation reproduces the dataframe pipeline."""
+    arrays = allocation.prepare_allocation_arrays(2022, exiobase_storage_path=synthetic_exiobase)
+    samples = allocation.calculate_allocation_factor_samples(
+        arrays, arrays["Y_fce"][:, :, None], arrays["V"][:, None], arrays["sPOPr"][:, None]
+    )
+
+    assert list(arrays["labels"]) == list(reference_allocation_factors.index)
+    for col in allocation.ALLOCATION_FACTOR_COLUMNS:
+        expected = reference_allocation_factors[col].to_numpy(dtype=float)
+        assert samples[col][:, 0] == pytest.approx(expected, rel=1e-9, abs=1e-15)
+
+
+def test_calculate_allocation_factor_uncertainty(synthetic_exiobase):
+    """Test that the Monte Carlo percentiles are ordered and reproducible with a seed."""
+    kwargs = dict(iterations=120, batch_size=50, seed=1, exiobase_storage_path=synthetic_exiobase)
+    uncertainty_df = allocation.calculate_allocation_factor_uncertainty(2022, **kwargs)
+
+    for col in allocation.ALLOCATION_FACTOR_COLUMNS:
+        assert (uncertainty_df[(col, "p2.5")] <= uncertainty_df[(col, "p50")]).all()
+        assert (uncertainty_df[(col, "p50")] <= uncertainty_df[(col, "p97.5")]).all()
+
+    pd.testing.assert_frame_equal(
+        uncertainty_df, allocation.calculate_allocation_factor_uncertainty(2022, **kwargs)
+    )
+
+
+def test_exiobase_manifest(synthetic_exiobase, monkeypatch):
+    """Test that scope and index are read from the manifest without parsing the archive."""
+    def fail(path):
+        raise AssertionError("The archive must not be parsed")
+
+    monkeypatch.setattr(allocation.p, "parse_exiobase3", fail)
+
+    num_geo, num_sectors, geo = allocation.define_scope(2022, exiobase_storage_path=synthetic_exiobase)
+    assert (num_geo, num_sectors) == (49, 98)
+    assert geo[:3] == ["AT", "BE", "BG"]
+
+    save_index = allocation.get_index(2022, exiobase_storage_path=synthetic_exiobase)
+    assert save_index.is_monotonic_increasing
+    assert save_index[0] == "AT_Cultivation of wheat"
+    assert (synthetic_exiobase / "manifest_2022.json").exists()
+
+    # Manifest is reused from the json cache in a new process
+    allocation._manifests.clear()
+    assert allocation.load_exiobase_manifest(2022, exiobase_storage_path=synthetic_exiobase)["num_sectors"] == 98
+
+
+def test_exiobase_manifest_without_archive(tmp_path, monkeypatch):
+    """Test that a missing archive raises an error naming the year and the storage path."""
+    monkeypatch.setattr(allocation, "download_exiobase_data", lambda year, exiobase_storage_path=None: None)
+
+    with pytest.raises(FileNotFoundError, match=f"1990 in {tmp_path}"):
+        allocation.load_exiobase_manifest(1990, exiobase_storage_path=tmp_path)
+
+
+def test_regional_resolution_of_total_GVA(synthetic_exiobase):
+    """Test that the regional resolution is numeric and distributes the total GVA of each sector."""
+    total_GVA_per_geo_scope = allocation.add_regional_resolution_to_total_GVA_of_sector(
+        2022, exiobase_storage_path=synthetic_exiobase
+    )
+    total_GVA_j = allocation.calculate_total_GVA_per_sector(2022, exiobase_storage_path=synthetic_exiobase)
+
+    assert (total_GVA_per_geo_scope.dtypes == float).all()
+    assert total_GVA_per_geo_scope.index.is_monotonic_increasing
+    assert list(total_GVA_per_geo_scope.columns) == sorted(total_GVA_per_geo_scope.columns)
+    assert total_GVA_per_geo_scope.sum(axis=1).to_numpy() == pytest.approx(total_GVA_j[0].to_numpy())
+
+
+def _sum_shared_L(handle):
+    """Attach to the shared matrices in a worker process and sum L."""
+    return float(allocation.attach_shared_matrices(handle)["L"].sum())
+
+
+def test_shared_matrices(synthetic_exiobase):
+    """Test that published matrices are zero-copy views that workers can attach to."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    handle = allocation.publish_shared_matrices(2022, exiobase_storage_path=synthetic_exiobase)
+    try:
+        L = allocation.load_matrices(2022, return_Y=False, exiobase_storage_path=synthetic_exiobase)
+        shared = allocation.attach_shared_matrices(handle, as_dataframes=True)
+
+        pd.testing.assert_frame_equal(shared["L"], L, check_names=False)
+        assert shared["x"].shape == (98, 1)
+        assert not shared["L"].to_numpy().flags.writeable
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            sums = list(executor.map(_sum_shared_L, [handle, handle]))
+        assert sums == pytest.approx([L.to_numpy().sum()] * 2)
+    finally:
+        allocation.release_shared_matrices(handle)
+
+
+def test_prefetch_exiobase_years(synthetic_exiobase, monkeypatch):
+    """Test that each year is parsed once in multi-year runs and parsing errors are raised."""
+    exio3 = allocation.p.parse_exiobase3(None)
+    shutil.copy(synthetic_exiobase / "IOT_2022_ixi.zip", synthetic_exiobase / "IOT_2021_ixi.zip")
+
+    parsed = []
+
+    def parse(path):
+        parsed.append(os.path.basename(path))
+        return exio3
+    monkeypatch.setattr(allocation.p, "parse_exiobase3", parse)
+
+    def total_output(year, exiobase_storage_path=None):
+        x = allocation.load_satellites(year, return_F=False, return_z=False, exiobase_storage_path=exiobase_storage_path)
+        Z = allocation.load_satellites(year, return_F=False, return_x=False, exiobase_storage_path=exiobase_storage_path)
+        return float(x.to_numpy().sum()), Z.shape
+
+    results = allocation.calculate_for_years([2021, 2022], function=total_output, exiobase_storage_path=synthetic_exiobase)
+
+    assert list(results) == [2021, 2022]
+    assert results[2021] == results[2022]
+    assert parsed == ["IOT_2021_ixi.zip", "IOT_2022_ixi.zip"]
+    assert not allocation._prefetched_exiobase
+
+    def broken(path):
+        raise OSError("corrupt archive")
+    monkeypatch.setattr(allocation.p, "parse_exiobase3", broken)
+    with pytest.raises(OSError):
+        list(allocation.prefetch_exiobase_years([2022], exiobase_storage_path=synthetic_exiobase))
+
+
+def test_prefetch_overlaps_parsing_and_calculation(synthetic_exiobase, monkeypatch):
+    """Test that the next year is parsed while the current year is calculated, but not more than depth years ahead."""
+    exio3 = allocation.p.parse_exiobase3(None)
+    years = [2020, 2021, 2022]
+    for year in years[:-1]:
+        shutil.copy(synthetic_exiobase / "IOT_2022_ixi.zip", synthetic_exiobase / f"IOT_{year}_ixi.zip")
+
+    parse_started = {year: threading.Event() for year in years}
+
+    def parse(path):
+        parse_started[int(os.path.basename(path)[4:8])].set()
+        return exio3
+    monkeypatch.setattr(allocation.p, "parse_exiobase3", parse)
+
+    overlaps = {}
+
+    def calculate(year, exiobase_storage_path=None):
+        if year + 1 in parse_started:
+            overlaps[year] = parse_started[year + 1].wait(timeout=10)
+        if year + 2 in parse_started:
+            time.sleep(0.2)
+            overlaps[year] &= not parse_started[year + 2].is_set()
+        return year
+
+    results = allocation.calculate_for_years(years, function=calculate, depth=1, exiobase_storage_path=synthetic_exiobase)
+
+    assert list(results) == years
+    assert overlaps == {2020: True, 2021: True}
+
+
+def test_allocation_factor_cache(synthetic_exiobase, tmp_path, monkeypatch):
+    """Test that cached allocation factors are reused across working directories and invalidated by changed inputs."""
+    monkeypatch.setenv("PBAESA_DATA_DIR", str(tmp_path / "data"))
+    index = allocation.get_index(2022, exiobase_storage_path=synthetic_exiobase)
+
+    calculations = []
+
+    def calculate(year, exiobase_storage_path=None):
+        calculations.append(year)
+        return pd.DataFrame({col: 0.5 for col in allocation.ALLOCATION_FACTOR_COLUMNS}, index=index)
+    monkeypatch.setattr(allocation, "calculate_all_allocation_factors", calculate)
+
+    for working_directory in ["first", "second"]:
+        (tmp_path / working_directory).mkdir()
+        monkeypatch.chdir(tmp_path / working_directory)
+        df = allocation.load_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase)
+        assert len(df) == len(index)
+        assert df.loc["DE_Cultivation of wheat", allocation.SECTOR_COLUMN] == "Cultivation of wheat"
+    assert calculations == [2022]
+    assert len(list((tmp_path / "data" / "allocation_factors").glob("*.csv"))) == 1
+    assert not list(tmp_path.glob("*/Allocation Factors_2022.xlsx"))
+
+    # Changed population weights invalidate the cache
+    weights = allocation.get_population_weights()
+    monkeypatch.setattr(allocation, "get_population_weights", lambda: {**weights, "DE": 0.02})
+    allocation.load_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase)
+    assert calculations == [2022, 2022]
+
+    # A changed archive invalidates the cache
+    key = allocation.get_allocation_factor_cache_key(2022, exiobase_storage_path=synthetic_exiobase)
+    with open(synthetic_exiobase / "IOT_2022_ixi.zip", "ab") as f:
+        f.write(b"\0")
+    assert allocation.get_allocation_factor_cache_key(2022, exiobase_storage_path=synthetic_exiobase) != key
+
+
+def test_allocation_factors_file_with_changed_inputs(synthetic_exiobase, tmp_path, monkeypatch):
+    """Test that an exported allocation factors file is only used for the inputs it was calculated from."""
+    monkeypatch.setenv("PBAESA_DATA_DIR", str(tmp_path / "data"))
+    index = allocation.get_index(2022, exiobase_storage_path=synthetic_exiobase)
+
+    calculations = []
+
+    def calculate(year, exiobase_storage_path=None):
+        calculations.append(year)
+        return pd.DataFrame({col: 0.1 * len(calculations) for col in allocation.ALLOCATION_FACTOR_COLUMNS}, index=index)
+    monkeypatch.setattr(allocation, "calculate_all_allocation_factors", calculate)
+
+    (tmp_path / "first").mkdir()
+    monkeypatch.chdir(tmp_path / "first")
+    allocation.export_all_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase)
+    assert calculations == [2022]
+
+    # The file is used for the same inputs
+    shutil.rmtree(tmp_path / "data" / "allocation_factors")
+    df = allocation.load_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase)
+    assert calculations == [2022]
+    assert df[allocation.ALLOCATION_FACTOR_COLUMNS[0]].iloc[0] == pytest.approx(0.1)
+
+    # Changed population weights invalidate the file in the same working directory
+    weights = allocation.get_population_weights()
+    monkeypatch.setattr(allocation, "get_population_weights", lambda: {**weights, "DE": 0.02})
+    df = allocation.load_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase)
+    assert calculations == [2022, 2022]
+    assert df[allocation.ALLOCATION_FACTOR_COLUMNS[0]].iloc[0] == pytest.approx(0.2)
@@ -0,0 +1,120 @@
+"""Test the precomputed allocation factor cube on the synthetic EXIOBASE system."""
+
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pbaesa import allocation, allocation_cube
+
+
+@pytest.fixture
+def cube_file(synthetic_exiobase, reference_allocation_factors, tmp_path, monkeypatch):
+    """Build a cube of two years from the reference allocation factors in a temporary data directory."""
+    monkeypatch.setenv("PBAESA_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(allocation_cube, "_cubes", {})
+    monkeypatch.setattr(allocation_cube, "_stores", {})
+    shutil.copy(synthetic_exiobase / "IOT_2022_ixi.zip", synthetic_exiobase / "IOT_2021_ixi.zip")
+    monkeypatch.setattr(
+        allocation_cube,
+        "calculate_all_allocation_factors",
+        lambda year, exiobase_storage_path=None: reference_allocation_factors.copy(),
+    )
+    return allocation_cube.build_allocation_factor_cube([2021, 2022], exiobase_storage_path=synthetic_exiobase)
+
+
+def test_allocation_factor_cube(cube_file, synthetic_exiobase, reference_allocation_factors, monkeypatch):
+    """Test that lookups read the cube without calculation and that the cube can be verified."""
+    assert cube_file == allocation_cube.get_cube_file_paths()[0]
+    cube = allocation_cube.load_allocation_factor_cube()
+    assert cube['values'].shape == (2, 49, 163, 4)
+    assert list(cube['years']) == [2021, 2022]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Allocation factors must not be calculated")
+    monkeypatch.setattr(allocation, "calculate_all_allocation_factors", fail)
+    monkeypatch.setattr(allocation, "load_cached_allocation_factors", fail)
+
+    allocation_factor_df = allocation.load_allocation_factors(2021, exiobase_storage_path=synthetic_exiobase)
+    assert list(allocation_factor_df.index) == list(reference_allocation_factors.index)
+    np.testing.assert_allclose(
+        allocation_factor_df[allocation.ALLOCATION_FACTOR_COLUMNS].to_numpy(),
+        reference_allocation_factors[allocation.ALLOCATION_FACTOR_COLUMNS].to_numpy(dtype=float),
+    )
+    filtered_df = allocation.get_all_allocation_factor("DE", "Mining of iron ores", 2022)
+    assert len(filtered_df) == 1
+    assert allocation_cube.get_allocation_factors_from_cube(1995) is None
+
+    deviations_df = allocation_cube.verify_allocation_factor_cube(exiobase_storage_path=synthetic_exiobase)
+    assert deviations_df['valid'].all()
+
+
+def test_outdated_allocation_factor_cube(cube_file, synthetic_exiobase, monkeypatch):
+    """Test that a cube built from other inputs or another version falls through to the cache."""
+    assert allocation_cube.get_allocation_factors_from_cube(2022, exiobase_storage_path=synthetic_exiobase) is not None
+
+    # Changed population weights change the cache key of the year
+    get_population_weights = allocation.get_population_weights
+    weights = get_population_weights()
+    monkeypatch.setattr(allocation, "get_population_weights", lambda: {**weights, "DE": 0.02})
+    assert allocation_cube.get_allocation_factors_from_cube(2022, exiobase_storage_path=synthetic_exiobase) is None
+
+    cached_df = pd.DataFrame({col: [0.5] for col in allocation.ALLOCATION_FACTOR_COLUMNS})
+    monkeypatch.setattr(allocation, "load_cached_allocation_factors", lambda year, exiobase_storage_path=None: cached_df)
+    assert allocation.load_allocation_factors(2022, exiobase_storage_path=synthetic_exiobase) is cached_df
+    monkeypatch.setattr(allocation, "get_population_weights", get_population_weights)
+
+    # A cube of another pbaesa version
+    assert allocation_cube.get_allocation_factors_from_cube(2022, exiobase_storage_path=synthetic_exiobase) is not None
+    monkeypatch.setitem(allocation_cube.load_allocation_factor_cube()['metadata'], 'version', '0.0.0')
+    assert allocation_cube.get_allocation_factors_from_cube(2022, exiobase_storage_path=synthetic_exiobase) is None
+
+
+def test_select_allocation_factors(cube_file, reference_allocation_factors):
+    """Test that selections from the memory-mapped store match the cube."""
+    store = allocation_cube.open_allocation_factor_store()
+    assert isinstance(store['values'], np.memmap)
+    assert (cube_file.parent / allocation_cube.STORE_DIRECTORY_NAME / "values.npy").exists()
+
+    total_gva = allocation.ALLOCATION_FACTOR_COLUMNS[2]
+    values = allocation_cube.select_allocation_factors(sectors="Cultivation of wheat", methods=total_gva)
+    assert values.shape == (2, 49, 1, 1)
+
+    df = allocation_cube.select_allocation_factors(
+        years=2022, geographical_scopes=["DE", "AT"], sectors="Cultivation of wheat", as_dataframe=True
+    )
+    assert list(df.index.get_level_values('geographical_scope')) == ["DE", "AT"]
+    np.testing.assert_allclose(
+        df.to_numpy(),
+        reference_allocation_factors.loc[["DE_Cultivation of wheat", "AT_Cultivation of wheat"]].to_numpy(dtype=float),
+    )
+
+    with pytest.raises(ValueError):
+        allocation_cube.select_allocation_factors(geographical_scopes="XX")
+
+
+def test_replace_allocation_factor_store(cube_file, tmp_path):
+    """Test that a store is replaced without changing the values of readers that have it open."""
+    cube = allocation_cube.load_allocation_factor_cube()
+    store_path = tmp_path / "store"
+    allocation_cube.write_allocation_factor_store(cube, store_path)
+    store = allocation_cube.open_allocation_factor_store(store_path)
+    old_values = np.array(store['values'])
+    assert allocation_cube.open_allocation_factor_store(store_path) is store
+
+    smaller_cube = {**cube, 'years': cube['years'][:1], 'values': cube['values'][:1] + 1}
+    allocation_cube.write_allocation_factor_store(smaller_cube, store_path)
+    assert not list(store_path.glob("*.tmp"))
+    np.testing.assert_array_equal(store['values'], old_values)
+
+    # Another process replaced the store: it is opened again with the new axes
+    allocation_cube._stores[str(store_path)] = store
+    replaced = allocation_cube.open_allocation_factor_store(store_path)
+    assert replaced['values'].shape == (1, 49, 163, 4)
+    assert list(replaced['years']) == [2021]
+
+    # Values that do not belong to the axes are not opened
+    with open(store_path / "values.npy", "wb") as f:
+        np.save(f, old_values)
+    assert allocation_cube.open_allocation_factor_store(store_path) is None
@@ -0,0 +1,136 @@
+"""Test region and sector concordances of allocation factors."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pbaesa import allocation, concordance
+
+
+@pytest.fixture
+def allocation_factors(tmp_path, monkeypatch):
+    """Write allocation factors of all geographical scopes for two sectors to a temporary working directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(allocation.Path, "home", lambda: tmp_path)
+    monkeypatch.setattr(concordance, "_region_components", {})
+
+    geo = sorted(concordance.REGION_GROUPS["GLO"])
+    index = [f"{geo_scope}_{sector}" for geo_scope in geo for sector in ["Cultivation of wheat", "Mining of iron ores"]]
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.uniform(0, 1e-3, (len(index), 4)), index=index, columns=allocation.ALLOCATION_FACTOR_COLUMNS)
+    df = allocation.add_scope_columns(df)
+    df.to_excel("Allocation Factors_2022.xlsx")
+    return df
+
+
+def test_aggregate_allocation_factors(allocation_factors):
+    """Test that allocation factors of groups are the sums over their geographical scopes."""
+    groups = {"DACH": ["DE", "AT", "CH"], "EU27": concordance.EU27}
+    aggregated_df = concordance.aggregate_allocation_factors(2022, groups=groups)
+
+    assert len(aggregated_df) == 4
+    columns = allocation.ALLOCATION_FACTOR_COLUMNS
+    for group, members in groups.items():
+        expected = allocation_factors.loc[[f"{member}_Mining of iron ores" for member in members], columns].sum()
+        np.testing.assert_allclose(aggregated_df.loc[f"{group}_Mining of iron ores", columns].to_numpy(dtype=float), expected)
+
+    filtered_df = allocation.get_all_allocation_factor("EU27", "Mining of iron ores", 2022)
+    assert filtered_df[columns].to_numpy(dtype=float) == pytest.approx(aggregated_df.loc[["EU27_Mining of iron ores"], columns].to_numpy(dtype=float))
+
+    assert concordance.aggregate_population_weights()["GLO"] == pytest.approx(1, abs=1e-3)
+    with pytest.raises(ValueError):
+        concordance.aggregate_allocation_factors(2022, groups={"Sales": ["DE", "XX"]})
+
+
+ACTIVITIES = [
+    {"name": "wheat production", "location": "DE", "classifications": [("ISIC rev.4 ecoinvent", "0111:Growing of cereals")]},
+    {"name": "electricity production, wind, onshore", "location": "US-TX",
+     "classifications": [("CPC", "17100"), ("ISIC rev.4 ecoinvent", "3510:Electric power generation")]},
+    {"name": "iron ore mine operation", "location": "RER", "classifications": [("ISIC rev.4 ecoinvent", "0710:Mining of iron ores")]},
+    {"name": "iron ore beneficiation", "location": "TH", "isic": "0710"},
+    {"name": "unknown process", "location": "XX", "classifications": []},
+]
+
+
+def test_build_activity_concordance():
+    """Test that ISIC codes and ecoinvent locations are mapped to EXIOBASE sectors and geographical scopes."""
+    concordance_df = concordance.build_activity_concordance(ACTIVITIES)
+
+    assert list(concordance_df['sector'][:4]) == [
+        "Cultivation of wheat", "Production of electricity by wind", "Mining of iron ores", "Mining of iron ores"
+    ]
+    assert list(concordance_df['geographical_scope'][:4]) == ["DE", "US", "RER", "WA"]
+    assert concordance_df.loc[4, ['geographical_scope', 'sector']].isna().all()
+
+
+def test_get_activity_allocation_factors(allocation_factors):
+    """Test that activities are joined with the allocation factors of their geographical scope or group."""
+    factors_df = concordance.get_activity_allocation_factors(ACTIVITIES, 2022)
+    columns = allocation.ALLOCATION_FACTOR_COLUMNS
+
+    assert len(factors_df) == len(ACTIVITIES)
+    np.testing.assert_allclose(
+        factors_df.loc[0, columns].to_numpy(dtype=float),
+        allocation_factors.loc["DE_Cultivation of wheat", columns].to_numpy(dtype=float),
+    )
+    rer = [f"{member}_Mining of iron ores" for member in concordance.REGION_GROUPS["RER"]]
+    np.testing.assert_allclose(factors_df.loc[2, columns].to_numpy(dtype=float), allocation_factors.loc[rer, columns].sum())
+    assert factors_df.loc[[1, 4], columns].isna().all().all()
+
+
+def test_get_database_concordance(tmp_path, monkeypatch):
+    """Test that the concordance of a database is cached until the database changes."""
+    bd = pytest.importorskip("bw2data")
+    from bw2data.tests import bw2test
+
+    monkeypatch.setenv("PBAESA_DATA_DIR", str(tmp_path))
+
+    @bw2test
+    def run():
+        db = bd.Database("ecoinvent")
+        db.write({
+            ("ecoinvent", f"a{i}"): {
+                "name": activity["name"], "location": activity["location"], "unit": "kilogram",
+                "classifications": activity.get("classifications", []),
+            }
+            for i, activity in enumerate(ACTIVITIES[:3])
+        })
+        concordance_df = concordance.get_database_concordance("ecoinvent")
+        assert concordance_df.loc["a1", "sector"] == "Production of electricity by wind"
+
+        def fail(activities):
+            raise AssertionError("The concordance must be read from the cache")
+        monkeypatch.setattr(concordance, "build_activity_concordance", fail)
+        cached_df = concordance.get_database_concordance("ecoinvent")
+        assert cached_df.loc["a2", "geographical_scope"] == "RER"
+        assert len(list((tmp_path / "concordance").glob("ecoinvent_*.csv"))) == 1
+
+    run()
+
+
+def test_aggregate_allocation_factors_with_changed_inputs(synthetic_exiobase, tmp_path, monkeypatch):
+    """Test that the loaded allocation factors of all geographical scopes follow the cache key of the inputs."""
+    monkeypatch.setenv("PBAESA_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(concordance, "_region_components", {})
+    monkeypatch.chdir(tmp_path)
+    index = allocation.get_index(2022, exiobase_storage_path=synthetic_exiobase)
+
+    calculations = []
+
+    def calculate(year, exiobase_storage_path=None):
+        calculations.append(year)
+        return pd.DataFrame({col: 1e-3 * len(calculations) for col in allocation.ALLOCATION_FACTOR_COLUMNS}, index=index)
+
+    monkeypatch.setattr(allocation, "calculate_all_allocation_factors", calculate)
+
+    groups = {"DACH": ["DE", "AT", "CH"]}
+    column = allocation.ALLOCATION_FACTOR_COLUMNS[0]
+    aggregated_df = concordance.aggregate_allocation_factors(2022, groups=groups, exiobase_storage_path=synthetic_exiobase)
+    assert aggregated_df.loc["DACH_Cultivation of wheat", column] == pytest.approx(3e-3)
+
+    # Changed population weights give new allocation factors
+    weights = allocation.get_population_weights()
+    monkeypatch.setattr(allocation, "get_population_weights", lambda: {**weights, "DE": 0.02})
+    aggregated_df = concordance.aggregate_allocation_factors(2022, groups=groups, exiobase_storage_path=synthetic_exiobase)
+    assert calculations == [2022, 2022]
+    assert aggregated_df.loc["DACH_Cultivation of wheat", column] == pytest.approx(6e-3)
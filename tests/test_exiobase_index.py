@@ -0,0 +1,57 @@
+"""Test validation, suggestions and resolution with the packaged EXIOBASE index."""
+
+import numpy as np
+import pytest
+
+from pbaesa import allocation, exiobase_index
+
+
+def test_packaged_index_dimensions():
+    """Test that the packaged index covers all geographical scopes and sectors."""
+    index = exiobase_index.load_exiobase_index()
+    assert len(index['geo']) == 49
+    assert len(index['sectors']) == 163
+    assert len(index['labels']) == 49 * 163
+    assert len(index['pxp_products']) == 2 * 200
+    assert index['labels'].is_monotonic_increasing
+
+
+def test_validation_and_suggestions():
+    """Test constant-time validation and fuzzy suggestions for misspelled queries."""
+    assert exiobase_index.is_valid_geographical_scope("DE")
+    assert not exiobase_index.is_valid_geographical_scope("XX")
+    assert exiobase_index.is_valid_sector("Cultivation of wheat")
+    assert not exiobase_index.is_valid_sector("Cultivation of weat")
+
+    assert exiobase_index.suggest_sectors("Cultivation of weat")[0] == "Cultivation of wheat"
+    assert exiobase_index.suggest_sectors("cultivation of wheat")[0] == "Cultivation of wheat"
+    assert "DE" in exiobase_index.suggest_geographical_scopes("de")
+
+
+def test_resolve_many():
+    """Test that many names are resolved to integer positions at once."""
+    index = exiobase_index.load_exiobase_index()
+
+    geo_ids = exiobase_index.resolve_geographical_scopes(["AT", "WM", "XX"])
+    assert geo_ids.tolist() == [0, 48, -1]
+
+    sector_ids = exiobase_index.resolve_sectors(["Cultivation of wheat", "unknown"])
+    assert sector_ids.tolist() == [1, -1]
+
+    positions = exiobase_index.resolve_labels(["DE", "AT", "XX"], ["Cultivation of wheat"] * 3)
+    assert positions[2] == -1
+    assert index['labels'][positions[:2]].tolist() == ["DE_Cultivation of wheat", "AT_Cultivation of wheat"]
+    assert np.all(positions[:2] >= 0)
+
+
+def test_reject_pxp_products():
+    """Test that product names and codes of the product-by-product tables are rejected."""
+    assert exiobase_index.is_pxp_product("Wheat")
+    assert exiobase_index.is_pxp_product("p01.b")
+    assert not exiobase_index.is_pxp_product("Cultivation of wheat")
+
+    exiobase_index.check_sectors(["Cultivation of wheat", "unknown"])
+    with pytest.raises(ValueError, match="product-by-product"):
+        exiobase_index.check_sectors("Wheat")
+    with pytest.raises(ValueError, match="ixi"):
+        allocation.get_allocation_factors([{"geographical_scope": "DE", "sector": "Wheat", "year": 2022}])
@@ -37,3 +37,38 @@ def test_allocation_module_import():
     """Test that the allocation module can be imported."""
     from pbaesa import allocation
     assert allocation is not None
+
+
+def _run_in_new_interpreter(code):
+    """Run code in a new interpreter and return its output."""
+    import subprocess
+    import sys
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_import_time():
+    """Test that importing pbaesa is fast and that looking up allocation factors does not load heavy dependencies."""
+    output = _run_in_new_interpreter(
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import pbaesa\n"
+        "print(time.perf_counter() - start)\n"
+        "from pbaesa import allocation, allocation_cube, utils\n"
+        "print(sorted(m for m in ('bw2data', 'bw2calc', 'pymrio', 'matplotlib') if any(k.startswith(m + '.') for k in sys.modules)))\n"
+    )
+    import_time, loaded_modules = output.splitlines()[-2:]
+
+    assert float(import_time) < 0.5
+    assert loaded_modules == "[]"
+
+
+def test_lazy_function_import():
+    """Test that the main functions are imported on first use."""
+    output = _run_in_new_interpreter(
+        "import sys, pbaesa\n"
+        "pbaesa.get_all_allocation_factor\n"
+        "print(*(any(k.startswith(m + '.') for k in sys.modules) for m in ('bw2data', 'pymrio')))\n"
+    )
+    assert output.splitlines()[-1] == "False False"
@@ -0,0 +1,223 @@
+"""Test the creation and incremental update of the planetary boundary LCIA methods."""
+
+import pandas as pd
+import pytest
+
+bd = pytest.importorskip("bw2data")
+from bw2data.tests import bw2test
+
+from pbaesa import lcia
+
+
+def write_biosphere():
+    """Write a biosphere database with two flows."""
+    bio = bd.Database("biosphere")
+    bio.write({
+        ("biosphere", "co2"): {"name": "Carbon dioxide", "type": "emission", "categories": ("air",), "unit": "kilogram"},
+        ("biosphere", "water"): {"name": "Water", "type": "natural resource", "categories": ("water",), "unit": "cubic meter"},
+    })
+    return bio
+
+
+def build_characterization_factors():
+    """Build a characterization factor table of both flows for all categories."""
+    df_pb = pd.DataFrame({
+        "Code": ["co2", "water"],
+        "Name": ["Carbon dioxide", "Water"],
+        "Compartment": ["air", "water"],
+        "Sub-Compartment": ["unspecified", "unspecified"],
+        "Unit": ["kg", "m3"],
+    })
+    for i, cat in enumerate(lcia.CATEGORIES):
+        df_pb[cat] = [float(i), 0.5 * i]
+    return df_pb
+
+
+def test_load_characterization_factors():
+    """Test that the packaged workbook is found and its factors are numeric."""
+    df_pb = lcia.load_characterization_factors()
+    assert df_pb['Code'].is_unique
+    assert (df_pb[lcia.CATEGORIES].dtypes == float).all()
+
+
+@bw2test
+def test_update_normal_methods(monkeypatch):
+    """Test that only methods with changed characterization factors are rewritten."""
+    bio = write_biosphere()
+    df_pb = build_characterization_factors()
+
+    statuses, _ = lcia.update_normal_methods(bio, df_pb)
+    assert set(statuses.values()) == {"created"}
+    method_key = ('Planetary Boundaries', 'Climate Change')
+    assert bd.methods[method_key]["unit"] == lcia.UNITS["Climate Change"]
+    assert sorted(cf for _, cf in bd.Method(method_key).load()) == [0.0, 0.0]
+
+    # Unchanged methods are recognised by their hash without being loaded
+    monkeypatch.setattr(lcia, "_is_stored", lambda *args: pytest.fail("Method was loaded"))
+    statuses, _ = lcia.update_normal_methods(bio, df_pb)
+    assert set(statuses.values()) == {"unchanged"}
+    monkeypatch.undo()
+
+    df_pb.loc[1, "Freshwater Use"] = 42.0
+    statuses, _ = lcia.update_normal_methods(bio, df_pb)
+    assert statuses.pop(('Planetary Boundaries', 'Freshwater Use')) == "updated"
+    assert set(statuses.values()) == {"unchanged"}
+    assert 42.0 in [cf for _, cf in bd.Method(('Planetary Boundaries', 'Freshwater Use')).load()]
+
+    # Methods written without a hash are compared with the table and not rewritten
+    for cat in lcia.CATEGORIES:
+        del bd.methods[('Planetary Boundaries', cat)][lcia.HASH_KEY]
+    bd.methods.flush()
+    monkeypatch.setattr(bd.Method, "write", lambda *args: pytest.fail("Method was rewritten"))
+    statuses, _ = lcia.update_normal_methods(bio, df_pb)
+    assert set(statuses.values()) == {"unchanged"}
+    assert all(lcia.HASH_KEY in bd.methods[key] for key in statuses)
+
+
+@bw2test
+def test_match_characterization_factors():
+    """Test that flows are matched by code, then by name, categories and unit."""
+    write_biosphere()
+    bd.Database("biosphere").new_activity(
+        code="urban-co2", name="Carbon dioxide", type="emission",
+        categories=("air", "urban air close to ground"), unit="kilogram",
+    ).save()
+    df_pb = build_characterization_factors()
+    df_pb.loc[2] = ["old-co2", "carbon dioxide", "air", "urban air close to ground", "kg"] + [1.0] * len(lcia.CATEGORIES)
+    df_pb.loc[3] = ["old-water", "Water", "water", "surface water", "m3"] + [2.0] * len(lcia.CATEGORIES)
+    df_pb.loc[4] = ["old-land", "Occupation, forest", "natural resource", "land", "m2*year"] + [0.0] * len(lcia.CATEGORIES)
+
+    df_matched, coverage = lcia.match_characterization_factors(df_pb, "biosphere")
+    assert df_matched['Code'].tolist() == ["co2", "water", "urban-co2"]
+    assert df_matched['Match'].tolist() == ["code", "code", "name"]
+    # Flows without a characterization factor are not counted
+    assert coverage.loc["Climate Change"].tolist() == [2, 0, 1, 1]
+    assert coverage.loc["Freshwater Use"].tolist() == [4, 2, 1, 1]
+
+
+def write_technosphere(name="technosphere"):
+    """Write a technosphere database with a nitrogen fertiliser and a wheat production process."""
+    bd.Database(name).write({
+        (name, "fertiliser"): {
+            "name": "nutrient supply from ammonium nitrate", "unit": "kilogram",
+            "reference product": "inorganic nitrogen fertiliser, as N",
+            "exchanges": [{"input": (name, "fertiliser"), "amount": 1, "type": "production"}],
+        },
+        (name, "phosphate"): {
+            "name": "nutrient supply from single superphosphate", "unit": "kilogram",
+            "reference product": "inorganic phosphorus fertiliser, as P2O5",
+            "exchanges": [{"input": (name, "phosphate"), "amount": 1, "type": "production"}],
+        },
+        (name, "wheat"): {
+            "name": "wheat grain production", "unit": "kilogram", "reference product": "wheat grain",
+            "exchanges": [
+                {"input": (name, "wheat"), "amount": 1, "type": "production"},
+                {"input": (name, "fertiliser"), "amount": 0.02, "type": "technosphere"},
+            ],
+        },
+    })
+
+
+@bw2test
+def test_add_n_supply_flow_to_databases():
+    """Test that the N-supply flow is added once to the nitrogen fertilisers of all databases."""
+    bio = write_biosphere()
+    for name in ["scenario 2030", "scenario 2050"]:
+        write_technosphere(name)
+    lcia.add_n_supply_flow_to_databases(bio, databases=["scenario 2030"])
+    lcia.add_n_supply_flow_to_databases(bio)
+    lcia.add_n_supply_flow_to_databases(bio)
+
+    for name in ["scenario 2030", "scenario 2050"]:
+        fertiliser = bd.get_activity((name, "fertiliser"))
+        assert [(exc.input.key, exc['amount']) for exc in fertiliser.biosphere()] == [(("biosphere", "N_supply"), 1)]
+        assert not list(bd.get_activity((name, "phosphate")).biosphere())
+        assert bd.databases[name]["dirty"]
+
+
+@bw2test
+def test_add_n_supply_flow_to_databases_of_other_backends(monkeypatch):
+    """Test that the exchanges of databases with other backends than sqlite are saved one by one."""
+    bio = write_biosphere()
+    for name in ["scenario 2030", "scenario 2050"]:
+        write_technosphere(name)
+    bd.databases["scenario 2050"]["backend"] = "iotable"
+
+    bulk_inserts = []
+    insert_many = lcia.ExchangeDataset.insert_many
+    monkeypatch.setattr(
+        lcia.ExchangeDataset, "insert_many",
+        lambda rows: bulk_inserts.append([row['output_database'] for row in rows]) or insert_many(rows),
+    )
+    saved = []
+    save = bd.backends.proxies.Exchange.save
+    monkeypatch.setattr(
+        bd.backends.proxies.Exchange, "save", lambda exc, *args, **kwargs: saved.append(exc.output.key) or save(exc, *args, **kwargs)
+    )
+    lcia.add_n_supply_flow_to_databases(bio)
+
+    assert bulk_inserts == [["scenario 2030"]]
+    assert saved == [("scenario 2050", "fertiliser")]
+
+
+@bw2test
+def test_provision_projects(monkeypatch):
+    """Test that all projects are provisioned once and skipped when nothing changed."""
+    monkeypatch.setattr(lcia, "load_characterization_factors", lambda file_path=None: build_characterization_factors())
+    for project in ["scenario 1", "scenario 2"]:
+        bd.projects.set_current(project)
+        write_biosphere()
+        write_technosphere()
+
+    report = lcia.provision_projects(["scenario 1", "scenario 2"], "biosphere")
+    assert report['status'].tolist() == ["updated", "updated"]
+    assert bd.projects.current == "scenario 2"
+    assert report['unmatched'].tolist() == [0, 0]
+    hashes = lcia.get_method_hashes("biosphere", build_characterization_factors())
+    assert len(hashes) == len(lcia.CATEGORIES) + 1
+    assert lcia.methods_match(hashes)
+    fertiliser = bd.get_activity(("technosphere", "fertiliser"))
+    assert [exc.input.key for exc in fertiliser.biosphere()] == [("biosphere", "N_supply")]
+
+    report = lcia.provision_projects(["scenario 1", "scenario 2"], "biosphere")
+    assert report['status'].tolist() == ["skipped", "skipped"]
+
+    # A modified database is patched again, without rewriting any method
+    bd.projects.set_current("scenario 1")
+    bd.get_activity(("technosphere", "wheat")).save()
+    report = lcia.provision_projects(["scenario 1", "scenario 2"], "biosphere")
+    assert report['status'].tolist() == ["patched", "skipped"]
+
+    with pytest.raises(ValueError):
+        lcia.provision_projects(["unknown"], "biosphere")
+
+
+@bw2test
+def test_provision_projects_in_parallel():
+    """Test that a pool of worker processes gives the same report as the serial run."""
+    projects = ["parallel 1", "parallel 2", "serial 1", "serial 2"]
+    for project in projects:
+        bd.projects.set_current(project)
+        write_biosphere()
+        write_technosphere()
+    bd.projects.set_current("serial 1")
+
+    # The characterization factors are passed to the workers, which do not see this test module
+    file_path = lcia.get_characterization_factors_file_path()
+    serial = lcia.provision_projects(projects[2:], "biosphere", file_path=file_path)
+    parallel = lcia.provision_projects(projects[:2], "biosphere", processes=2, file_path=file_path)
+
+    assert bd.projects.current == "serial 1"
+    columns = ['status', 'unmatched']
+    assert parallel[columns].to_numpy().tolist() == serial[columns].to_numpy().tolist()
+    assert parallel['status'].tolist() == ["updated", "updated"]
+    assert parallel['error'].isna().all()
+
+    bd.projects.set_current("parallel 2")
+    fertiliser = bd.get_activity(("technosphere", "fertiliser"))
+    assert [exc.input.key for exc in fertiliser.biosphere()] == [("biosphere", "N_supply")]
+
+    # The methods written by the workers are up to date
+    report = lcia.provision_projects(projects[:2], "biosphere", processes=2, file_path=file_path)
+    assert report['status'].tolist() == ["skipped", "skipped"]
+    assert bd.projects.current == "parallel 2"
@@ -0,0 +1,196 @@
+"""Test the iterative Leontief solutions on the synthetic EXIOBASE system."""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from pbaesa import allocation, leontief
+
+
+def perturb(A, seed=0, scale=0.01):
+    """Perturb the technical coefficients like the next EXIOBASE year."""
+    rng = np.random.default_rng(seed)
+    return A * (1 + scale * rng.standard_normal(A.shape))
+
+
+def test_calculate_allocation_factors_for_years(synthetic_exiobase, reference_allocation_factors):
+    """Test that the first year is solved exactly and reproduces the dataframe pipeline."""
+    results = leontief.calculate_allocation_factors_for_years([2022], exiobase_storage_path=synthetic_exiobase)
+    aSoSOS_j_df, report = results[2022]
+
+    assert report['method'] == 'exact'
+    assert list(aSoSOS_j_df.index) == list(reference_allocation_factors.index)
+    for col in allocation.ALLOCATION_FACTOR_COLUMNS:
+        expected = reference_allocation_factors[col].to_numpy(dtype=float)
+        assert aSoSOS_j_df[col].to_numpy() == pytest.approx(expected, rel=1e-9, abs=1e-15)
+
+
+def test_warm_started_leontief_vectors(synthetic_exiobase):
+    """Test that the next year is solved from the previous vectors with a small error."""
+    arrays = allocation.prepare_allocation_arrays(2022, exiobase_storage_path=synthetic_exiobase, leontief=False)
+    A, v = arrays['A'], arrays['V'] / arrays['x']
+    previous = leontief.calculate_leontief_vectors(A, v)
+
+    A_next = perturb(A)
+    vectors = leontief.calculate_leontief_vectors(A_next, v, previous=previous)
+    report = vectors['report']
+    assert report['method'] == 'iterative'
+    assert all(report[key]['converged'] for key in ['col_sums', 'L_inv_col_sums', 'top_multiplier'])
+
+    errors = leontief.verify_leontief_vectors(A_next, v, vectors)
+    assert errors['col_sums'] < 1e-8
+    assert errors['top_multiplier'] < 1e-8
+    assert errors['diagonal'] < 1e-3
+    assert errors['s'] < 1e-3
+
+    # The previous solution is a better starting point than zero
+    _, cold = leontief.solve_leontief(A_next, np.ones(len(v)), transpose=True)
+    assert report['col_sums']['iterations'] < cold['iterations']
+
+
+def build_drifting_system(n=300, seed=1):
+    """Build a system with strong inter-sectoral trade whose coefficients drift from year to year."""
+    rng = np.random.default_rng(seed)
+    A = rng.uniform(0, 1, (n, n)) * (rng.uniform(0, 1, (n, n)) < 0.2)
+    A *= rng.uniform(0.3, 0.8, n) / A.sum(axis=0)
+    years = [A]
+    for _ in range(7):
+        years.append(years[-1] * (1 + 0.05 * rng.standard_normal((n, n))))
+    return years, rng.uniform(0.1, 0.5, n)
+
+
+def test_refreshed_diagonal():
+    """Test that the drift of the carried-over diagonal is estimated and refreshed."""
+    years, v = build_drifting_system()
+
+    # Without refresh, the error of the diagonal grows and is estimated from the sampled sectors
+    previous = leontief.calculate_leontief_vectors(years[0], v)
+    for A in years[1:]:
+        previous = leontief.calculate_leontief_vectors(A, v, previous=previous, method='iterative')
+    errors = leontief.verify_leontief_vectors(years[-1], v, previous)
+    assert errors['diagonal'] > 1e-4
+    assert 0.5 * errors['diagonal'] < previous['report']['diagonal']['error'] <= errors['diagonal'] * (1 + 1e-6)
+
+    # Automatic refresh keeps the error within the tolerance
+    previous, methods = None, []
+    for A in years:
+        previous = leontief.calculate_leontief_vectors(A, v, previous=previous, diagonal_tol=1e-4, refresh_every=None)
+        methods.append(previous['report']['method'])
+        assert leontief.verify_leontief_vectors(A, v, previous)['diagonal'] < 1e-4
+    assert methods[1] == 'iterative'
+    assert methods.count('exact') > 1
+
+    # Periodic refresh
+    previous, ages = None, []
+    for A in years:
+        previous = leontief.calculate_leontief_vectors(A, v, previous=previous, diagonal_tol=1, refresh_every=2)
+        ages.append(previous['age'])
+    assert ages == [0, 1, 2, 0, 1, 2, 0, 1]
+
+
+def test_leontief_series_bound():
+    """Test that the automatic order keeps the actual error below the a-posteriori bound."""
+    rng = np.random.default_rng(1)
+    A = rng.uniform(0, 1, (300, 300)) * (rng.uniform(0, 1, (300, 300)) < 0.2)
+    A *= rng.uniform(0.3, 0.8, 300) / A.sum(axis=0)
+    L = np.linalg.inv(np.identity(300) - A)
+    b = rng.uniform(0, 1, 300)
+
+    for transpose, exact in [(False, L @ b), (True, L.T @ b)]:
+        w, rho = leontief.get_series_weights(A, transpose)
+        for tol in [1e-2, 1e-4, 1e-8]:
+            x, info = leontief.calculate_leontief_series(A, b, transpose=transpose, tol=tol)
+            assert info['converged']
+            assert info['bound'] <= tol
+            assert np.abs(x - exact) @ w <= info['bound'] * (np.abs(x) @ w) * (1 + 1e-9)
+            assert np.all(np.abs(x - exact) <= info['entry_bounds'] * (1 + 1e-9))
+
+
+def test_series_error_bounds_with_strong_trade():
+    """Test that the total FCE multiplier has no bound when supply chains cross geographical scopes."""
+    rng = np.random.default_rng(3)
+    regions, sectors = 10, 30
+    n = regions * sectors
+    A = rng.uniform(0, 1, (n, n)) * (rng.uniform(0, 1, (n, n)) < 0.3)
+    A *= rng.uniform(0.4, 0.8, n) / A.sum(axis=0)
+    blocks = np.repeat(np.arange(regions), sectors)
+    v = rng.uniform(0.1, 0.5, n)
+
+    vectors = leontief.calculate_leontief_vectors(A, v, method='series', tol=1e-6, blocks=blocks)
+    bounds = leontief.get_series_error_bounds(A, v, vectors)
+    errors = leontief.verify_leontief_vectors(A, v, vectors)
+
+    # Most supply chains leave the geographical scope, so the error of the diagonal dominates
+    assert errors['s'] > 1e-3
+    assert errors['s'] > bounds['total_FCE_series_bound']
+    assert bounds['total_FCE_bound'] is None
+    assert 0 < bounds['diagonal']['error'] <= errors['diagonal'] * (1 + 1e-6)
+    assert errors['top_multiplier'] <= bounds['total_GVA_bound']
+
+
+def test_approximate_allocation_factors(synthetic_exiobase, reference_allocation_factors):
+    """Test that the approximation is within its tolerance of the exact allocation factors."""
+    aSoSOS_j_df, report = leontief.approximate_allocation_factors(2022, tol=1e-6, exiobase_storage_path=synthetic_exiobase)
+    # The estimated error of the diagonal exceeds the tolerance, so the diagonal is refined
+    assert report['diagonal']['error'] > 1e-6 and report['diagonal']['refined']
+    assert report['total_FCE_bound'] == report['total_FCE_series_bound'] < 1e-4
+    assert report['total_GVA_bound'] < 1e-4
+    for col in allocation.ALLOCATION_FACTOR_COLUMNS:
+        expected = reference_allocation_factors[col].to_numpy(dtype=float)
+        assert aSoSOS_j_df[col].to_numpy() == pytest.approx(expected, rel=1e-4, abs=1e-15)
+
+    # Without refinement, the total FCE allocation factors are left out
+    aSoSOS_j_df, report = leontief.approximate_allocation_factors(
+        2022, tol=1e-6, refine_diagonal=False, exiobase_storage_path=synthetic_exiobase
+    )
+    assert not report['diagonal']['refined'] and report['total_FCE_bound'] is None
+    assert list(aSoSOS_j_df.columns) == allocation.ALLOCATION_FACTOR_COLUMNS[1:]
+
+    # Within the tolerance, the estimated diagonal is kept
+    aSoSOS_j_df, report = leontief.approximate_allocation_factors(2022, tol=1e-4, exiobase_storage_path=synthetic_exiobase)
+    assert not report['diagonal']['refined'] and report['total_FCE_bound'] is None
+    assert list(aSoSOS_j_df.columns) == allocation.ALLOCATION_FACTOR_COLUMNS
+
+    benchmark = leontief.benchmark_allocation_factors(2022, tol=1e-6, exiobase_storage_path=synthetic_exiobase)
+    assert benchmark['exact_seconds'] > 0 and benchmark['series_seconds'] > 0
+    assert max(benchmark['errors'].values()) < 1e-4
+
+
+def test_total_FCE_allocation_factor_chunked(synthetic_exiobase, reference_allocation_factors, tmp_path):
+    """Test that the out-of-core calculation gives identical results at any block size."""
+    col = "Allocation factor calculated via total final consumption expenditure"
+    total_FCE_df = leontief.calculate_total_FCE_allocation_factor_chunked(
+        2022, block_size=7, exiobase_storage_path=synthetic_exiobase
+    )
+    assert list(total_FCE_df.index) == list(reference_allocation_factors.index)
+    assert total_FCE_df[col].to_numpy() == pytest.approx(reference_allocation_factors[col].to_numpy(dtype=float), rel=1e-9)
+    assert not list((tmp_path / ".pbaesa_data").glob("*.npy"))
+
+    arrays = allocation.prepare_allocation_arrays(2022, exiobase_storage_path=synthetic_exiobase, leontief=False)
+    file_path = leontief.write_leontief_memmap(arrays['A'], tmp_path / "L.npy", block_size=10)
+    s = [leontief.calculate_total_FCE_multiplier_chunked(file_path, block_size=b) for b in [1, 7, 98]]
+    s.append(leontief.calculate_total_FCE_multiplier_chunked(file_path, memory_budget=98 * 8 * 2 * 5))
+    assert all(np.array_equal(s[0], s_b) for s_b in s[1:])
+    assert s[0] == pytest.approx(allocation.calculate_total_FCE_multiplier(np.load(file_path)), rel=1e-12)
+
+
+def test_write_leontief_memmap_memory(tmp_path):
+    """Test that the LU factorization overwrites A and that the budget covers at least one column."""
+    n = 300
+    A = np.random.default_rng(0).random((n, n)) / (2 * n)
+    L_expected = np.linalg.inv(np.identity(n) - A)
+
+    A_copy = A.copy()
+    leontief.write_leontief_memmap(A_copy, tmp_path / "L.npy", block_size=10)
+    assert np.array_equal(A_copy, A)
+
+    tracemalloc.start()
+    leontief.write_leontief_memmap(A_copy, tmp_path / "L.npy", memory_budget=2 * 8 * n * 10, overwrite_a=True)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 8 * n * n / 4
+    assert np.load(tmp_path / "L.npy") == pytest.approx(L_expected, rel=1e-12, abs=1e-15)
+
+    with pytest.raises(ValueError, match="does not fit one column"):
+        leontief.write_leontief_memmap(A, tmp_path / "L.npy", memory_budget=8 * n)
@@ -0,0 +1,77 @@
+"""Test the structural path analysis on a small cyclic system and a small Brightway project."""
+
+import numpy as np
+import pytest
+
+bd = pytest.importorskip("bw2data")
+from bw2data.tests import bw2test
+
+from pbaesa import spa
+from .test_aesa import write_test_databases
+
+
+def build_cyclic_system(n=12, seed=0):
+    """Build a random sparse system with loops and two impact categories."""
+    rng = np.random.default_rng(seed)
+    A = rng.uniform(0, 1, (n, n)) * (rng.uniform(0, 1, (n, n)) < 0.15)
+    A *= 0.3 / A.sum(axis=0).max()
+    intensities = rng.uniform(0, 1, (2, n)) * (rng.uniform(0, 1, (2, n)) < 0.5)
+    demand = np.zeros(n)
+    demand[[0, 3]] = [1.0, 2.0]
+    return A, intensities, demand
+
+
+def test_structural_path_analysis():
+    """Test that the paths add up to the total impact and that pruning keeps the top paths."""
+    A, intensities, demand = build_cyclic_system()
+    totals = intensities @ np.linalg.solve(np.identity(len(A)) - A, demand)
+
+    paths_df, report_df = spa.structural_path_analysis(
+        A, intensities, demand, categories=["a", "b"], k=10**6, cutoff=1e-9, max_depth=40, max_queue=10**7,
+    )
+    assert report_df["total"].to_numpy() == pytest.approx(totals)
+    assert paths_df.groupby("category")["direct"].sum().to_numpy() == pytest.approx(totals, rel=1e-7)
+
+    top_df, top_report_df = spa.structural_path_analysis(
+        A, intensities, demand, categories=["a", "b"], k=5, cutoff=1e-3, max_queue=5,
+    )
+    for category in ["a", "b"]:
+        expected = paths_df[paths_df["category"] == category].nlargest(5, "direct")
+        found = top_df[top_df["category"] == category]
+        assert list(found["rank"]) == [1, 2, 3, 4, 5]
+        assert list(found["path"]) == list(expected["path"])
+        assert found["direct"].to_numpy() == pytest.approx(expected["direct"].to_numpy())
+    assert (top_report_df["expanded"] < report_df["expanded"]).all()
+
+
+@bw2test
+def test_calculate_pb_paths():
+    """Test the paths of a functional unit through the technosphere of a Brightway project."""
+    write_test_databases()
+    electricity = bd.get_activity(("technosphere", "electricity"))
+
+    paths_df, report_df = spa.calculate_pb_paths({("technosphere", "wheat"): 2}, k=5)
+
+    climate = paths_df[paths_df["category"] == "Climate Change"].set_index("rank")
+    assert list(climate["names"]) == [("wheat grain production",), ("wheat grain production", "electricity production")]
+    assert climate.loc[2, "path"][-1] == electricity.id
+    assert climate.loc[2, "amount"] == pytest.approx(1)
+    assert climate["direct"].to_numpy() == pytest.approx([4e-3, 1e-3])
+    assert report_df.loc["Climate Change", "total"] == pytest.approx(5e-3)
+    assert report_df.loc["Climate Change", "covered"] == pytest.approx(1)
+    assert report_df.loc["Freshwater Use", "total"] == pytest.approx(0.6)
+
+
+def test_calculate_exiobase_paths(synthetic_exiobase):
+    """Test that the paths of EXIOBASE are labelled and start at the final demand."""
+    intensities = {"Climate Change": {"DE_Cultivation of wheat": 1.0, ("FR", "Mining of iron ores"): 2.0}}
+    paths_df, report_df = spa.calculate_exiobase_paths(
+        2022, intensities, {("DE", "Cultivation of wheat"): 1.0}, k=3, exiobase_storage_path=synthetic_exiobase
+    )
+    assert paths_df.loc[0, "path"] == ("DE_Cultivation of wheat",)
+    assert paths_df.loc[0, "direct"] == pytest.approx(1.0)
+    assert all(path[0] == "DE_Cultivation of wheat" for path in paths_df["path"])
+    assert report_df.loc["Climate Change", "total"] > 1
+
+    with pytest.raises(ValueError):
+        spa.calculate_exiobase_paths(2022, intensities, {"XX_Unknown": 1.0}, exiobase_storage_path=synthetic_exiobase)
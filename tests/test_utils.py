@@ -0,0 +1,52 @@
+"""Test the normalization and headless rendering of AESA results."""
+
+import os
+
+import pytest
+
+from pbaesa import utils
+
+
+@pytest.fixture
+def exploitation_of_SOS():
+    """SOS exploitation values of a single functional unit."""
+    mlca_scores = {
+        (("Planetary Boundaries", "Climate Change"), "fu"): 0.5,
+        (("Planetary Boundaries", "Freshwater Use"), "fu"): 400.0,
+    }
+    return utils.calculate_exploitation_of_SOS(mlca_scores)
+
+
+def test_calculate_exploitation_of_SOS(exploitation_of_SOS):
+    """Test that scores are divided by the Safe Operating Space thresholds."""
+    assert exploitation_of_SOS[(("Planetary Boundaries", "Climate Change"), "fu")] == pytest.approx(0.5)
+    assert exploitation_of_SOS[(("Planetary Boundaries", "Freshwater Use"), "fu")] == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize("file_format", ["png", "svg", "pdf"])
+def test_render_AESA_charts(tmp_path, exploitation_of_SOS, file_format):
+    """Test that charts are written to files without opening pyplot figures."""
+    import matplotlib.pyplot as plt
+
+    open_figures = len(plt.get_fignums())
+    charts = {
+        "with_thresholds": (exploitation_of_SOS, 0.01, 0.02),
+        "without_thresholds": (exploitation_of_SOS, None, None),
+    }
+    file_paths = utils.render_AESA_charts(charts, tmp_path, file_format=file_format)
+
+    assert len(file_paths) == 2
+    assert all(os.path.getsize(path) > 0 for path in file_paths)
+    assert len(plt.get_fignums()) == open_figures
+
+
+def test_render_AESA_charts_in_parallel(tmp_path, exploitation_of_SOS):
+    """Test that a process pool writes the same charts as the current process."""
+    charts = {f"chart_{i}": (exploitation_of_SOS, 0.01 * (i + 1), 0.02) for i in range(5)}
+    serial_paths = utils.render_AESA_charts(charts, tmp_path / "serial")
+    parallel_paths = utils.render_AESA_charts(charts, tmp_path / "parallel", processes=2)
+
+    assert [os.path.basename(path) for path in parallel_paths] == [f"{name}.png" for name in charts]
+    for serial_path, parallel_path in zip(serial_paths, parallel_paths):
+        with open(serial_path, "rb") as serial, open(parallel_path, "rb") as parallel:
+            assert serial.read() == parallel.read()